@@ -23,44 +23,193 @@ LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
 OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
 SOFTWARE.
 
-"""
-
-import sys
-import boto3
-
-session = boto3.Session(profile_name='default')
-client = session.client('ec2')
-ec2 = session.resource('ec2')
-
-container = []
-
 
-# Instance Ids
-ids = [instance.id for instance in ec2.instances.all()]
+Summary:
+    Resource id provider for ec2cli bash completion.
 
-# EBS Volume Ids
-vids = [x['VolumeId'] for x in client.describe_volumes()['Volumes']]
+    Ids are served from a per-profile on-disk index so completion never waits
+    on AWS.  When the index is missing or older than REFRESH_AGE a detached,
+    lock-guarded background process rebuilds it with paginated, concurrent
+    fetches across every region in regions.list, served by the ec2clid daemon
+    when it is running; until the first index is written completion returns
+    no ids.  Ids of a resource kind are replaced only when every region
+    answered, so a partial refresh never hides ids of a region that failed.
+    Only the refresh path imports boto3.
 
-# snapshot Ids
-sids = [x['SnapshotId'] for x in client.describe_snapshots(OwnerIds=['self'])['Snapshots']]
+    Usage:
 
-# ami ids
-amis = [x['ImageId'] for x in client.describe_images(Owners=['self'])['Images']]
+        $ components.py --profile default --prefix vol-
+        $ components.py --kind snapshots
+        $ components.py --refresh           # rebuild index in the foreground
 
-# elastic network interfaces (eni)
-enis = [x['NetworkInterfaceId'] for x in client.describe_network_interfaces()['NetworkInterfaces']]
-
-
-# aggregate all ids into single list
-container.extend(ids)
-container.extend(vids)
-container.extend(sids)
-container.extend(amis)
-container.extend(enis)
-
-for x in container:
-    print(x)
-
-##
+"""
 
-sys.exit(0)
+import os
+import sys
+import json
+import time
+import argparse
+import subprocess
+
+
+CONFIG_PATH = os.path.join(os.path.expanduser('~'), '.config', 'ec2cli')
+LIB_PATH = os.path.dirname(os.path.realpath(__file__))
+REGION_CONFIGFILE = 'regions.list'
+REFRESH_AGE = 300       # seconds before index is refreshed in the background
+LOCK_TIMEOUT = 600      # seconds after which a refresh lock is considered stale
+
+# resource kind: (id prefix, region_fetch resource, id field)
+KINDS = {
+    'instances': ('i-', 'instances', 'InstanceId'),
+    'volumes': ('vol-', 'volumes', 'VolumeId'),
+    'snapshots': ('snap-', 'snapshots', 'SnapshotId'),
+    'images': ('ami-', 'images', 'ImageId'),
+    'enis': ('eni-', 'enis', 'NetworkInterfaceId')
+}
+
+
+def index_path(profile):
+    return os.path.join(CONFIG_PATH, 'components-%s.json' % profile)
+
+
+def read_index(profile):
+    """Returns the resource id index for profile, None if absent"""
+    try:
+        with open(index_path(profile)) as f1:
+            return json.load(f1)
+    except (OSError, ValueError):
+        return None
+
+
+def matches(index, prefix='', kind=None):
+    """
+    Summary:
+        Filters indexed ids by resource kind and prefix
+    Returns:
+        resource ids | TYPE: list
+    """
+    if kind is None:
+        # infer kind from an unambiguous id prefix (eg vol-)
+        kind = next((k for k, v in KINDS.items() if prefix.startswith(v[0])), None)
+    kinds = [kind] if kind else sorted(KINDS)
+    return [x for k in kinds for x in index['Ids'].get(k, []) if x.startswith(prefix)]
+
+
+def regions_list():
+    """Region codes from user config, falling back to the packaged list"""
+    for path in (os.path.join(CONFIG_PATH, REGION_CONFIGFILE), os.path.join(LIB_PATH, REGION_CONFIGFILE)):
+        if os.path.exists(path):
+            with open(path) as f1:
+                return [x.strip() for x in f1.readlines() if x.strip()]
+    return []
+
+
+def refresh(profile):
+    """
+    Summary:
+        Rebuilds the id index from all regions; resource kinds fetched
+        concurrently.  Kinds with failed regions keep their previous ids and
+        the index stays due for refresh
+    Returns:
+        Success | Failure, TYPE: bool
+    """
+    from concurrent.futures import ThreadPoolExecutor
+    from region_fetch import fetch
+
+    regions = regions_list()
+    previous = read_index(profile) or {'Ids': {}, 'Updated': 0}
+
+    def ids(kind):
+        resource, field = KINDS[kind][1], KINDS[kind][2]
+        document = fetch(resource, regions, profile=profile)
+        items = document[next(k for k in document if k not in ('Regions', 'Elapsed'))]
+        if resource == 'instances':
+            items = [i for reservation in items for i in reservation['Instances']]
+        complete = not any(x.get('Error') for x in document['Regions'].values())
+        return kind, sorted(x[field] for x in items), complete
+
+    with ThreadPoolExecutor(max_workers=len(KINDS)) as executor:
+        results = list(executor.map(ids, sorted(KINDS)))
+
+    index = {
+        'Profile': profile,
+        'Updated': time.time() if all(x[2] for x in results) else previous.get('Updated', 0),
+        'Ids': {
+            kind: found if complete or kind not in previous['Ids'] else previous['Ids'][kind]
+            for kind, found, complete in results
+        }
+    }
+
+    tmp = '%s.%d.tmp' % (index_path(profile), os.getpid())
+    try:
+        os.makedirs(CONFIG_PATH, exist_ok=True)
+        with open(tmp, 'w') as f1:
+            json.dump(index, f1)
+        os.replace(tmp, index_path(profile))
+    except OSError:
+        return False
+    return True
+
+
+def acquire_lock(profile):
+    """Prevents concurrent background refreshes; stale locks are reclaimed"""
+    lock = index_path(profile) + '.lock'
+    try:
+        if time.time() - os.path.getmtime(lock) > LOCK_TIMEOUT:
+            os.remove(lock)
+    except OSError:
+        pass
+    try:
+        os.close(os.open(lock, os.O_CREAT | os.O_EXCL | os.O_WRONLY))
+        return lock
+    except OSError:
+        return None
+
+
+def refresh_background(profile):
+    """Starts a detached index refresh; completion returns immediately"""
+    if acquire_lock(profile) is None:
+        return
+    subprocess.Popen(
+        [sys.executable, os.path.realpath(__file__), '--refresh', '--locked', '--profile', profile],
+        stdin=subprocess.DEVNULL, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+        close_fds=True, start_new_session=True
+    )
+
+
+def options(parser, help_menu=False):
+    parser.add_argument("-p", "--profile", nargs='?', default=os.environ.get('AWS_PROFILE', 'default'))
+    parser.add_argument("-k", "--kind", nargs='?', default=None, choices=sorted(KINDS))
+    parser.add_argument("-x", "--prefix", nargs='?', default='')
+    parser.add_argument("-r", "--refresh", dest='refresh', action='store_true')
+    parser.add_argument("--locked", dest='locked', action='store_true', help=argparse.SUPPRESS)
+    return parser.parse_args()
+
+
+def init():
+    args = options(argparse.ArgumentParser(add_help=True, description="components help:"))
+
+    if args.refresh:
+        if not args.locked and acquire_lock(args.profile) is None:
+            return True
+        try:
+            return refresh(args.profile)
+        finally:
+            try:
+                os.remove(index_path(args.profile) + '.lock')
+            except OSError:
+                pass
+
+    index = read_index(args.profile)
+
+    if index is None or time.time() - index.get('Updated', 0) > REFRESH_AGE:
+        # first use or aged; completion is served from what exists now
+        refresh_background(args.profile)
+        index = index or {'Ids': {}, 'Updated': 0}
+
+    sys.stdout.write(''.join(x + '\n' for x in matches(index, args.prefix or '', args.kind)))
+    return True
+
+
+if __name__ == '__main__':
+    sys.exit(0 if init() else 1)
@@ -383,7 +383,19 @@ function _ec2cli_completions(){
             ;;
 
         '--tags')
-            components=$(python3 $lib_path/components.py)
+            ##  resource ids served from warm on-disk index; refreshed in background
+            local i profile="${AWS_PROFILE:-default}"
+            for (( i=1; i < ${#COMP_WORDS[@]} - 1; i++ )); do
+                if [ "${COMP_WORDS[$i]}" = "--profile" ] || [ "${COMP_WORDS[$i]}" = "-p" ]; then
+                    profile="${COMP_WORDS[$((i+1))]}"
+                fi
+            done
+            if [[ $cur =~ ^[a-z0-9] ]]; then
+                # partial resource id
+                components=$(python3 $lib_path/components.py --profile "$profile" --prefix "$cur")
+            else
+                components=$(python3 $lib_path/components.py --profile "$profile")
+            fi
             if [ "$cur" = "" ] || [ "$cur" = "-" ] || [ "$cur" = "--" ]; then
                 # display full completion subcommands
                 _complete_code_subcommands "$components"
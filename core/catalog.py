@@ -0,0 +1,300 @@
+"""
+Summary:
+    catalog (python3) | Compact, versioned EC2 instance type catalog.
+
+    Built in a single streaming pass over the AmazonEC2 offer file.  Holds
+    per type attributes plus prebuilt family and region indexes so consumers
+    perform dictionary lookups rather than re-scanning types.ec2 or
+    re-parsing the offer file on every run.
+
+    Catalog layout:
+
+        {
+            "Version": 1,
+            "Created": "2018-10-01T12:00:00",
+            "Types": {
+                "m5.large": {
+                    "Family": "m", "Class": "m5", "Generation": 5,
+                    "VCpu": 2, "Memory": "8 GiB",
+                    "Network": "Up to 10 Gigabit",
+                    "Current": true,
+                    "Regions": ["ap-south-1", "us-east-1", ...]
+                }
+            },
+            "Families": {"m": ["m1.large", ... ]},
+            "Regions": {"us-east-1": ["a1.large", ... ]}
+        }
+
+    Usage:
+
+        $ python3 catalog.py build ec2prices_allregions.json --outfile catalog.json
+        $ python3 catalog.py families            # <family> <type> <type> ...
+        $ python3 catalog.py types --family m --region us-east-1
+        $ python3 catalog.py show m5.large
+
+Author:
+    Blake Huber
+    Copyright Blake Huber, All Rights Reserved.
+
+License:
+    GNU General Public License v3.0 (GPL-3)
+    Additional terms may be found in the complete license agreement:
+    https://bitbucket.org/blakeca00/ec2cli/src/master/LICENSE.txt
+
+OS Support:
+    - RedHat Linux, Amazon Linux, Ubuntu & variants
+
+Dependencies:
+    - Requires python3, tested under py3.5 and py3.6
+"""
+
+import os
+import re
+import sys
+import json
+import datetime
+import argparse
+
+# pkg
+from offerfile import parse
+from oscodes_unix import exit_codes
+
+
+CATALOG_VERSION = 1
+CATALOG_FILE = 'catalog.json'
+DEFAULT_PATH = os.path.join(os.path.expanduser('~'), '.config', 'ec2cli', CATALOG_FILE)
+_class = re.compile(r'^([a-z]+)(\d+)')
+
+# offer file attribute name: catalog field
+ATTRIBUTES = {
+    'instanceType': 'Type',
+    'vcpu': 'VCpu',
+    'memory': 'Memory',
+    'networkPerformance': 'Network',
+    'currentGeneration': 'Current',
+    'regionCode': 'Region'
+}
+
+
+def classify(instance_type):
+    """
+    Summary:
+        Derives family, class, and generation from an instance type name
+    Args:
+        :instance_type (str): eg m5d.large
+    Returns:
+        family (m), class (m5d), generation (5) | TYPE: tuple
+    """
+    instance_class = instance_type.split('.')[0]
+    match = _class.match(instance_class)
+    if match is None:
+        # eg u-6tb1.metal
+        return instance_class.split('-')[0], instance_class, None
+    return match.group(1), instance_class, int(match.group(2))
+
+
+def _merge(types, attributes, region=None):
+    """Folds the attributes of a single product sku into the types table"""
+    name = attributes.get('Type', '')
+    if '.' not in name:
+        return
+    entry = types.get(name)
+    if entry is None:
+        family, instance_class, generation = classify(name)
+        vcpu = attributes.get('VCpu')
+        entry = types[name] = {
+            'Family': family,
+            'Class': instance_class,
+            'Generation': generation,
+            'VCpu': int(vcpu) if vcpu and vcpu.isdigit() else vcpu,
+            'Memory': attributes.get('Memory'),
+            'Network': attributes.get('Network'),
+            'Current': attributes.get('Current') == 'Yes',
+            'Regions': set()
+        }
+    # location names ("US East (N. Virginia)") are not region codes; products
+    # without a regionCode contribute no availability rather than a bad index key
+    region = region or attributes.get('Region')
+    if region:
+        entry['Regions'].add(region)
+
+
+def _catalog(types):
+    """Assembles catalog document and prebuilt indexes from the types table"""
+    families, regions = {}, {}
+    for name in sorted(types):
+        entry = types[name]
+        entry['Regions'] = sorted(entry['Regions'])
+        families.setdefault(entry['Family'], []).append(name)
+        for region in entry['Regions']:
+            regions.setdefault(region, []).append(name)
+
+    return {
+        'Version': CATALOG_VERSION,
+        'Created': datetime.datetime.utcnow().replace(microsecond=0).isoformat(),
+        'Types': types,
+        'Families': families,
+        'Regions': regions
+    }
+
+
+def build(fileobj, region=None):
+    """
+    Summary:
+        Builds a catalog from the offer file in one streaming pass
+    Args:
+        :fileobj (file): text mode file object containing the ec2 offer file
+        :region (str): region code of a regional offer file; availability is
+         otherwise taken from each product's regionCode attribute
+    Returns:
+        catalog | TYPE: dict
+    """
+    types, attributes = {}, {}
+
+    for prefix, event, value in parse(fileobj):
+        if event == 'map_key' and prefix == 'products':
+            # next sku; fold previous product attributes
+            _merge(types, attributes, region)
+            attributes = {}
+        elif event == 'string' and prefix.startswith('products.'):
+            segments = prefix.split('.')
+            if len(segments) == 4 and segments[2] == 'attributes' and segments[3] in ATTRIBUTES:
+                attributes[ATTRIBUTES[segments[3]]] = value
+        elif event == 'map_key' and prefix == '' and value == 'terms':
+            # products precede terms in the offer file; remainder is pricing
+            break
+    _merge(types, attributes, region)
+    return _catalog(types)
+
+
+def merge(catalogs):
+    """
+    Summary:
+        Combines catalogs built from regional offer files into one catalog
+    Args:
+        :catalogs (list): catalogs returned by build
+    Returns:
+        catalog with the union of types and region availability | TYPE: dict
+    """
+    types = {}
+    for catalog in catalogs:
+        for name, entry in catalog['Types'].items():
+            if name not in types:
+                types[name] = dict(entry, Regions=set())
+            types[name]['Regions'].update(entry['Regions'])
+    return _catalog(types)
+
+
+def load(path=DEFAULT_PATH):
+    """
+    Summary:
+        Reads a catalog from the local filesystem
+    Returns:
+        catalog, or None if absent or written by an incompatible version | TYPE: dict
+    """
+    try:
+        with open(path) as f1:
+            catalog = json.load(f1)
+    except (OSError, ValueError):
+        return None
+    return catalog if catalog.get('Version') == CATALOG_VERSION else None
+
+
+def save(catalog, path=DEFAULT_PATH):
+    """
+    Summary:
+        Writes catalog atomically in compact form
+    Returns:
+        Success | Failure, TYPE: bool
+    """
+    tmp = path + '.tmp'
+    try:
+        with open(tmp, 'w') as f1:
+            json.dump(catalog, f1, separators=(',', ':'))
+        os.replace(tmp, path)
+    except OSError as e:
+        print('catalog: Problem writing %s (%s)' % (path, str(e)), file=sys.stderr)
+        return False
+    return True
+
+
+def lookup(catalog, family=None, region=None):
+    """
+    Summary:
+        Returns instance types matching family and region using prebuilt indexes
+    Args:
+        :catalog (dict): catalog returned by build or load
+        :family (str): family letter(s), eg m
+        :region (str): region code, eg us-east-1
+    Returns:
+        instance type names | TYPE: list
+    """
+    if family and region:
+        available = set(catalog['Regions'].get(region, []))
+        return [x for x in catalog['Families'].get(family, []) if x in available]
+    elif family:
+        return catalog['Families'].get(family, [])
+    elif region:
+        return catalog['Regions'].get(region, [])
+    return sorted(catalog['Types'])
+
+
+def options(parser, help_menu=False):
+    """
+    Summary:
+        parse cli parameter options
+    Returns:
+        TYPE: argparse object, parser argument set
+    """
+    parser.add_argument("command", nargs='?', choices=['build', 'families', 'types', 'show'])
+    parser.add_argument("argument", nargs='?', help="offer file (build) or instance type (show)")
+    parser.add_argument("-c", "--catalog", nargs='?', default=DEFAULT_PATH, required=False)
+    parser.add_argument("-o", "--outfile", nargs='?', default=None, required=False)
+    parser.add_argument("-f", "--family", nargs='?', default=None, required=False)
+    parser.add_argument("-r", "--region", nargs='?', default=None, required=False)
+    return parser.parse_args()
+
+
+def init():
+
+    parser = argparse.ArgumentParser(add_help=True, description="catalog help:")
+
+    if len(sys.argv) == 1:
+        parser.print_help()
+        sys.exit(exit_codes['EX_OK']['Code'])
+
+    args = options(parser)
+
+    if args.command == 'build':
+        if not args.argument:
+            print('catalog: build requires the path to an ec2 offer file', file=sys.stderr)
+            return False
+        try:
+            with open(args.argument) as f1:
+                catalog = build(f1)
+        except (OSError, ValueError) as e:
+            print('catalog: %s' % str(e), file=sys.stderr)
+            return False
+        return save(catalog, args.outfile or args.catalog)
+
+    catalog = load(args.catalog)
+    if catalog is None:
+        print('catalog: No compatible catalog found at %s' % args.catalog, file=sys.stderr)
+        return False
+
+    if args.command == 'families':
+        for family in sorted(catalog['Families']):
+            print(family + ' ' + ' '.join(catalog['Families'][family]))
+    elif args.command == 'types':
+        for name in lookup(catalog, args.family, args.region):
+            print(name)
+    elif args.command == 'show':
+        if args.argument not in catalog['Types']:
+            print('catalog: Unknown instance type %s' % args.argument, file=sys.stderr)
+            return False
+        print(json.dumps(catalog['Types'][args.argument], indent=4))
+    return True
+
+
+if __name__ == '__main__':
+    sys.exit(exit_codes['EX_OK']['Code'] if init() else exit_codes['EX_DATAERR']['Code'])
@@ -2,9 +2,18 @@
 Summary:
     csv_generator (python3) | Generate csv from boto3 json output.
 
+    Rows are written as each page of results is returned, so memory use is
+    constant regardless of the number of resources exported.
+
+    Multiple profiles and regions (comma delimited) are exported in a single
+    run by a pool of workers, one shard per (profile, region).  Shards are
+    merged into one csv with AWS Account and Region columns, or written to
+    separate files with --shard.
+
     Resource Types Supported:
 
-        - ec2 snapshots
+        - ec2 instances, volumes, snapshots, images, security groups,
+          subnets, vpcs
 
 Author:
     Blake Huber
@@ -24,24 +33,34 @@ Dependencies:
 
 import os
 import sys
+import time
+import queue
 import datetime
+import threading
 import csv
-import pdb
 import argparse
 import inspect
+from concurrent.futures import ThreadPoolExecutor, as_completed
 
 # aws
 import boto3
-from botocore.exceptions import ClientError, ProfileNotFound
+from botocore.exceptions import BotoCoreError, ClientError, ProfileNotFound
 
 # pkg
 from script_utils import boto3_session, stdout_message, get_account_info
+import identity
+import scheduler
+import snapshot_store
+from projection import parse_timestamp
+from region_fetch import client_config
 from oscodes_unix import exit_codes
 import loggers
 from _version import __version__
 
 # globals
 logger = loggers.getLogger(__version__)
+MAX_WORKERS = 8
+QUEUE_PAGES = 64        # pages of rows buffered between workers and merged writer
 now = datetime.datetime.now().strftime('%Y-%m-%d')
 cur_dir = os.path.dirname(os.path.realpath(__file__))    # location of this script
 
@@ -59,75 +78,384 @@ def flattenjson(b, delim):
     return val
 
 
-def instance_json(account, profilename, r):
-    """ requests json data from aws """
-    client = boto3_session(service='ec2', region=r, profile=profilename)
+def _tags(item):
+    """Tags as a single key: value column, matching prior export format"""
+    if item.get('Tags'):
+        return {x['Key']: x['Value'] for x in item['Tags']}
+    return 'None'
+
+
+def _join(key, field):
+    """Column joining one field from each member of a list attribute"""
+    return lambda item: ' '.join(str(x.get(field)) for x in item.get(key, [])) or 'None'
+
+
+def _snapshot_ids(item):
+    ids = [x['Ebs']['SnapshotId'] for x in item.get('BlockDeviceMappings', []) if x.get('Ebs', {}).get('SnapshotId')]
+    return ' '.join(ids) or 'None'
+
+
+def _reservations(page):
+    for reservation in page['Reservations']:
+        for instance in reservation['Instances']:
+            yield instance
+
+
+# resource type: describe api, request parameters, page extractor, csv columns.
+# columns are (header, flattened json path | callable(item)); 'AWS Account' is
+# supplied by the caller
+RESOURCES = {
+    'instances': {
+        'api': 'describe_instances',
+        'params': lambda account: {},
+        'items': _reservations,
+        'columns': [
+            ('InstanceId', 'InstanceId'),
+            ('InstanceType', 'InstanceType'),
+            ('State', 'State.Name'),
+            ('LaunchTime', 'LaunchTime'),
+            ('AvailabilityZone', 'Placement.AvailabilityZone'),
+            ('ImageId', 'ImageId'),
+            ('KeyName', 'KeyName'),
+            ('PrivateIpAddress', 'PrivateIpAddress'),
+            ('PublicIpAddress', 'PublicIpAddress'),
+            ('VpcId', 'VpcId'),
+            ('SubnetId', 'SubnetId'),
+            ('SecurityGroups', _join('SecurityGroups', 'GroupId')),
+            ('Tags', _tags)
+        ]
+    },
+    'volumes': {
+        'api': 'describe_volumes',
+        'params': lambda account: {},
+        'items': lambda page: page['Volumes'],
+        'columns': [
+            ('VolumeId', 'VolumeId'),
+            ('Size', 'Size'),
+            ('VolumeType', 'VolumeType'),
+            ('Iops', 'Iops'),
+            ('State', 'State'),
+            ('CreateTime', 'CreateTime'),
+            ('AvailabilityZone', 'AvailabilityZone'),
+            ('Encrypted', 'Encrypted'),
+            ('SnapshotId', 'SnapshotId'),
+            ('InstanceIds', _join('Attachments', 'InstanceId')),
+            ('Tags', _tags)
+        ]
+    },
+    'snapshots': {
+        'api': 'describe_snapshots',
+        'params': lambda account: {'OwnerIds': [account]},
+        'items': lambda page: page['Snapshots'],
+        'columns': [
+            ('SnapshotId', 'SnapshotId'),
+            ('Description', 'Description'),
+            ('StartTime', 'StartTime'),
+            ('Encrypted', 'Encrypted'),
+            ('Progress', 'Progress'),
+            ('State', 'State'),
+            ('VolumeID', 'VolumeId'),
+            ('VolumeSize', 'VolumeSize'),
+            ('Tags', _tags)
+        ]
+    },
+    'images': {
+        'api': 'describe_images',
+        'params': lambda account: {'Owners': [account]},
+        'items': lambda page: page['Images'],
+        'columns': [
+            ('ImageId', 'ImageId'),
+            ('Name', 'Name'),
+            ('Description', 'Description'),
+            ('CreationDate', 'CreationDate'),
+            ('State', 'State'),
+            ('ImageType', 'ImageType'),
+            ('VirtualizationType', 'VirtualizationType'),
+            ('RootDeviceType', 'RootDeviceType'),
+            ('Public', 'Public'),
+            ('SnapshotIds', _snapshot_ids),
+            ('Tags', _tags)
+        ]
+    },
+    'secgroups': {
+        'api': 'describe_security_groups',
+        'params': lambda account: {},
+        'items': lambda page: page['SecurityGroups'],
+        'columns': [
+            ('GroupId', 'GroupId'),
+            ('GroupName', 'GroupName'),
+            ('Description', 'Description'),
+            ('VpcId', 'VpcId'),
+            ('IngressPorts', _join('IpPermissions', 'ToPort')),
+            ('Tags', _tags)
+        ]
+    },
+    'subnets': {
+        'api': 'describe_subnets',
+        'params': lambda account: {},
+        'items': lambda page: page['Subnets'],
+        'columns': [
+            ('SubnetId', 'SubnetId'),
+            ('VpcId', 'VpcId'),
+            ('CidrBlock', 'CidrBlock'),
+            ('AvailabilityZone', 'AvailabilityZone'),
+            ('AvailableIpAddressCount', 'AvailableIpAddressCount'),
+            ('DefaultForAz', 'DefaultForAz'),
+            ('MapPublicIpOnLaunch', 'MapPublicIpOnLaunch'),
+            ('State', 'State'),
+            ('Tags', _tags)
+        ]
+    },
+    'vpcs': {
+        'api': 'describe_vpcs',
+        'params': lambda account: {},
+        'items': lambda page: page['Vpcs'],
+        'columns': [
+            ('VpcId', 'VpcId'),
+            ('CidrBlock', 'CidrBlock'),
+            ('IsDefault', 'IsDefault'),
+            ('State', 'State'),
+            ('InstanceTenancy', 'InstanceTenancy'),
+            ('DhcpOptionsId', 'DhcpOptionsId'),
+            ('Tags', _tags)
+        ]
+    }
+}
+
+
+def fieldnames(resource, region_column=False):
+    """csv header row for resource type"""
+    return ['AWS Account'] + (['Region'] if region_column else []) + [x[0] for x in RESOURCES[resource]['columns']]
+
+
+def csv_row(resource, item, account):
+    """
+    Summary:
+        Converts a single describe-* item to a csv row
+    Returns:
+        column header: value | TYPE: dict
+    """
+    flat = flattenjson({k: v for k, v in item.items() if k != 'Tags'}, '.')
+    row = {'AWS Account': account}
+    for header, path in RESOURCES[resource]['columns']:
+        value = path(item) if callable(path) else flat.get(path)
+        if isinstance(value, datetime.datetime):
+            value = value.strftime('%Y-%m-%dT%H:%M')
+        row[header] = value
+    return row
 
-    paginator = client.get_paginator('describe_instances')
-    response_iterator = paginator.paginate(
-            PaginationConfig={'PageSize': 100}
-        )
-    # page thru, retrieve all snapshots
-    container = []
-    for page in response_iterator:
-        for _dict in page['Instances']:
-            # preprocess tags
-            if _dict.get('Tags'):
-                tags = {x['Key']:x['Value'] for x in _dict['Tags']}
-            else:
-                tags = 'None'
-
-            container.append(
-                {
-                    'AWS Account': _dict['OwnerId'],
-                    'SnapshotId': _dict['SnapshotId'],
-                    'Description': _dict['Description'],
-                    'StartTime': _dict['StartTime'].strftime('%Y-%m-%dT%H:%M'),
-                    'Encrypted': _dict['Encrypted'],
-                    'Progress': _dict['Progress'],
-                    'State': _dict['State'],
-                    'VolumeID': _dict['VolumeId'],
-                    'VolumeSize': _dict['VolumeSize'],
-                    'Tags': tags
-                }
+
+def iter_rows(resource, account, profilename, r, client=None):
+    """
+    Summary:
+        Yields csv rows while the paginator advances; no result set is retained
+    Args:
+        :resource (str): key from RESOURCES
+        :account (str): aws account number
+        :profilename (str): profile_name of an iam user from local awscli config
+        :r (str): aws region code
+        :client (boto3 client): optional ec2 client to reuse
+    Returns:
+        generator of csv rows (dict)
+    """
+    spec = RESOURCES[resource]
+    client = client or scheduler.attach(boto3_session(service='ec2', region=r, profile=profilename), account=account)
+
+    if resource == 'snapshots':
+        # served from the local inventory after an incremental sync
+        snapshot_store.sync_region(account, r, profilename, client=client)
+        for item in snapshot_store.items(account, r):
+            item['StartTime'] = parse_timestamp(item['StartTime'])
+            yield csv_row(resource, item, account)
+        return
+
+    if client.can_paginate(spec['api']):
+        paginator = client.get_paginator(spec['api'])
+        response_iterator = paginator.paginate(
+                PaginationConfig={'PageSize': 100},
+                **spec['params'](account)
             )
-    return container
+    else:
+        response_iterator = [getattr(client, spec['api'])(**spec['params'](account))]
 
+    for page in response_iterator:
+        for item in spec['items'](page):
+            yield csv_row(resource, item, account)
 
-def snapshot_json(account, profilename, r):
-    """ requests json data from aws """
-    client = boto3_session(service='ec2', region=r, profile=profilename)
 
-    paginator = client.get_paginator('describe_snapshots')
-    response_iterator = paginator.paginate(
-            OwnerIds=[account],
-            PaginationConfig={'PageSize': 100}
-        )
-    # page thru, retrieve all snapshots
-    container = []
-    for page in response_iterator:
-        for snapshot_dict in page['Snapshots']:
-            # preprocess tags
-            if snapshot_dict.get('Tags'):
-                tags = {x['Key']:x['Value'] for x in snapshot_dict['Tags']}
-            else:
-                tags = 'None'
-
-            container.append(
-                {
-                    'AWS Account': snapshot_dict['OwnerId'],
-                    'SnapshotId': snapshot_dict['SnapshotId'],
-                    'Description': snapshot_dict['Description'],
-                    'StartTime': snapshot_dict['StartTime'].strftime('%Y-%m-%dT%H:%M'),
-                    'Encrypted': snapshot_dict['Encrypted'],
-                    'Progress': snapshot_dict['Progress'],
-                    'State': snapshot_dict['State'],
-                    'VolumeID': snapshot_dict['VolumeId'],
-                    'VolumeSize': snapshot_dict['VolumeSize'],
-                    'Tags': tags
-                }
-            )
-    return container
+def write_csv(rows, resource, output_filepath, region_column=False):
+    """
+    Summary:
+        Streams rows to a csv file
+    Returns:
+        number of rows written | TYPE: int
+    """
+    count = 0
+    with open(output_filepath, 'w', newline='') as out_file:
+        csv_w = csv.DictWriter(out_file, fieldnames=fieldnames(resource, region_column), extrasaction='ignore')
+        csv_w.writeheader()
+        for row in rows:
+            csv_w.writerow(row)
+            count += 1
+    return count
+
+
+def account_sessions(profiles, workers=MAX_WORKERS):
+    """
+    Summary:
+        Creates one boto3 session per profile and resolves its account number
+        from the identity cache; sessions are reused for every region
+    Returns:
+        profile: (session, account number, client creation lock),
+        profile: error for profiles which failed to authenticate | TYPE: tuple (dict, dict)
+    """
+    sessions, failed = {}, {}
+
+    def resolve(profile):
+        session = boto3.Session(profile_name=profile)
+        account = identity.get(profile)['Account']
+        return session, account, threading.Lock()
+
+    with ThreadPoolExecutor(max_workers=max(1, min(workers, len(profiles)))) as executor:
+        futures = {executor.submit(resolve, x): x for x in profiles}
+        for future in as_completed(futures):
+            try:
+                sessions[futures[future]] = future.result()
+            except (identity.IdentityError, BotoCoreError, ClientError) as e:
+                failed[futures[future]] = str(e)
+
+    for profile, error in failed.items():
+        logger.warning('%s: profile %s failed (%s)' % (inspect.stack()[0][3], profile, error))
+    return sessions, failed
+
+
+def export_shard(resource, profile, region, sessions, sink):
+    """
+    Summary:
+        Exports one (profile, region) shard, passing each page of rows to sink
+    Args:
+        :sessions (dict): output of account_sessions
+        :sink (callable): receives a list of csv rows per page
+    Returns:
+        profile, region, rows exported, elapsed seconds | TYPE: tuple
+    """
+    start = time.time()
+    session, account, lock = sessions[profile]
+    with lock:
+        # boto3 sessions are not thread safe; clients are
+        client = scheduler.attach(
+            session.client('ec2', region_name=region, config=client_config()), account=account)
+
+    count, page = 0, []
+    for row in iter_rows(resource, account, profile, region, client=client):
+        row['Region'] = region
+        page.append(row)
+        if len(page) == 100:
+            sink(page)
+            count, page = count + len(page), []
+    if page:
+        sink(page)
+        count += len(page)
+    return profile, region, count, round(time.time() - start, 3)
+
+
+def export_all(resource, profiles, regions, output_path, shard=False, workers=MAX_WORKERS):
+    """
+    Summary:
+        Exports every (profile, region) combination concurrently
+    Args:
+        :resource (str): key from RESOURCES
+        :profiles (list): profile names from local awscli config
+        :regions (list): aws region codes
+        :output_path (str): directory in which csv files are created
+        :shard (bool): one file per (account, region) rather than a merged file
+        :workers (int): maximum concurrent shards
+    Returns:
+        csv files created | TYPE: list
+    """
+    sessions, failed = account_sessions(profiles, workers)
+    for profile, error in sorted(failed.items()):
+        print('%s: skipped (%s)' % (profile, error), file=sys.stderr)
+    if not sessions:
+        raise identity.IdentityError('No profile could be authenticated: %s' % ', '.join(profiles))
+
+    shards = [(p, r) for p in profiles if p in sessions for r in regions]
+    rows = queue.Queue(maxsize=QUEUE_PAGES)
+    files, writers = [], {}
+    stop, errors = threading.Event(), []
+
+    def merged_sink(page):
+        if stop.is_set():
+            raise RuntimeError('csv writer failed; export abandoned')
+        rows.put(page)
+
+    def shard_sink(profile, region):
+        def sink(page):
+            writers[(profile, region)].writerows(page)
+        return sink
+
+    if shard:
+        for profile, region in shards:
+            fname = '%s/%s_%s-%s-%s.csv' % (output_path, now, resource, sessions[profile][1], region)
+            handle = open(fname, 'w', newline='')
+            writers[(profile, region)] = csv.DictWriter(
+                handle, fieldnames=fieldnames(resource, True), extrasaction='ignore')
+            writers[(profile, region)].writeheader()
+            files.append((fname, handle))
+    else:
+        fname = '%s/%s_%s-merged.csv' % (output_path, now, resource)
+        handle = open(fname, 'w', newline='')
+        merged = csv.DictWriter(handle, fieldnames=fieldnames(resource, True), extrasaction='ignore')
+        merged.writeheader()
+        files.append((fname, handle))
+
+    def drain():
+        # merged output: single writer consumes pages produced by all workers;
+        # after a write error pages are discarded so workers never block on put
+        for page in iter(rows.get, None):
+            if stop.is_set():
+                continue
+            try:
+                merged.writerows(page)
+            except Exception as e:
+                errors.append(e)
+                stop.set()
+
+    if not shard:
+        writer = threading.Thread(target=drain)
+        writer.start()
+
+    start = time.time()
+    try:
+        with ThreadPoolExecutor(max_workers=max(1, min(workers, len(shards)))) as executor:
+            futures = [
+                executor.submit(
+                    export_shard, resource, p, r, sessions, shard_sink(p, r) if shard else merged_sink)
+                for p, r in shards
+            ]
+            for completed, future in enumerate(as_completed(futures), start=1):
+                if stop.is_set():
+                    # writer failed; remaining shards abandon at their next page
+                    continue
+                try:
+                    profile, region, count, elapsed = future.result()
+                    print('[%d/%d] %s %s %s: %d rows in %ss' % (
+                        completed, len(shards), resource, sessions[profile][1], region, count, elapsed),
+                        file=sys.stderr)
+                except Exception as e:
+                    logger.exception('%s: shard failed (%s)' % (inspect.stack()[0][3], str(e)))
+                    print('[%d/%d] shard failed: %s' % (completed, len(shards), str(e)), file=sys.stderr)
+    finally:
+        if not shard:
+            rows.put(None)
+            writer.join()
+        for fname, handle in files:
+            handle.close()
+    if errors:
+        raise errors[0]
+
+    print('%d shards exported in %ss' % (len(shards), round(time.time() - start, 3)), file=sys.stderr)
+    return [x[0] for x in files]
 
 
 def options(parser, help_menu=False):
@@ -138,11 +466,15 @@ def options(parser, help_menu=False):
         TYPE: argparse object, parser argument set
     """
     parser.add_argument("-p", "--profile", nargs='?', default="default",
+                              required=True, help="profile or comma delimited profiles (default: %(default)s)")
+    parser.add_argument("-t", "--type", nargs='?', default="snapshots", choices=sorted(RESOURCES),
                               required=True, help="type (default: %(default)s)")
-    parser.add_argument("-t", "--type", nargs='?', default="snapshots",
-                              required=True, help="type (default: %(default)s)")
-    parser.add_argument("-r", "--region", nargs='?', required=True)
+    parser.add_argument("-r", "--region", nargs='?', required=True,
+                              help="region or comma delimited regions")
     parser.add_argument("-f", "--filepath", nargs='?', required=False)
+    parser.add_argument("-s", "--shard", dest='shard', action='store_true', required=False,
+                              help="one csv per account and region rather than a merged file")
+    parser.add_argument("-w", "--workers", type=int, default=MAX_WORKERS, required=False)
     parser.add_argument("-d", "--debug", dest='debug', action='store_true', required=False)
     return parser.parse_args()
 
@@ -161,43 +493,45 @@ def init():
         parser.print_help()
         sys.exit(exit_codes['EX_OK']['Code'])
 
-    # account info
-    account_id, account_name = get_account_info(profile=args.profile)
-
-    # file info
-    output_fname = now + '_snapshots-' + account_name + '.csv'
+    profiles = [x.strip() for x in args.profile.split(',') if x.strip()]
+    regions = [x.strip() for x in args.region.split(',') if x.strip()]
 
     if args.filepath:
         if args.filepath.endswith('/'):
             path = '/'.join(args.filepath.split('/')[:-1])
         else:
             path = args.filepath
-        output_filepath = path + '/' + output_fname
     else:
-        output_filepath = os.environ['HOME'] + '/' + output_fname
+        path = os.environ['HOME']
 
-    # pull data from aws
-    if args.type == 'snapshots':
-        data_list = snapshot_json(account=account_id, profilename=args.profile, r=args.region)
+    if len(profiles) > 1 or len(regions) > 1 or args.shard:
+        try:
+            files = export_all(args.type, profiles, regions, path, shard=args.shard, workers=args.workers)
+        except (ClientError, ProfileNotFound, identity.IdentityError, OSError, ValueError, csv.Error) as e:
+            logger.exception('%s: Problem exporting csv (Code: %s)' % (inspect.stack()[0][3], str(e)))
+            stdout_message(str(e), 'ERROR')
+            sys.exit(exit_codes['E_MISC']['Code'])
+        return ', '.join(files)
 
-    # pdb.set_trace()
-    # column headers for each row of csv data
-    columns = [x for x in data_list[0]]
+    # account info
     try:
-        # create csv file
-        with open(output_filepath, 'w') as out_file:
-            # csv writer object
-            csv_w = csv.writer(out_file)
+        account_id, account_name = get_account_info(profile=args.profile)
+    except identity.IdentityError as e:
+        stdout_message(str(e), 'ERROR')
+        sys.exit(exit_codes[e.code]['Code'])
 
-            # write columns in first row
-            csv_w.writerow(columns)
+    # file info
+    output_fname = now + '_' + args.type + '-' + account_name + '.csv'
+    output_filepath = path + '/' + output_fname
 
-            # iterate thru dictionaries, writing 1 per row
-            for row in data_list:
-                csv_w.writerow(row.values())
+    try:
+        # pull data from aws, writing each page of results as it arrives
+        rows = iter_rows(args.type, account=account_id, profilename=args.profile, r=args.region)
+        count = write_csv(rows, args.type, output_filepath)
+        logger.info('%s: %d %s written to %s' % (inspect.stack()[0][3], count, args.type, output_filepath))
     except OSError as e:
         msg = 'Could not write to file or other OS-level error was encountered.'
-        logger.exception('%s: %s' % (inspect.stack()[0][3], msg, str(e)))
+        logger.exception('%s: %s (%s)' % (inspect.stack()[0][3], msg, str(e)))
     except Exception as e:
         logger.exception(
             '%s: Problem when creating csv file. (Code: %s)' %
@@ -0,0 +1,404 @@
+"""
+Summary:
+    ec2clid (python3) | Optional ec2cli daemon serving aws requests over a
+    unix domain socket.
+
+    Keeps boto3 sessions and clients warm per (profile, service, region) so
+    describe and mutating requests skip interpreter startup, botocore
+    service model loading and credential resolution.  Clients are rebuilt
+    when the awscli config or credentials file changes.  The daemon exits
+    after IDLE_TIMEOUT seconds without a request.
+
+    Protocol: one json request line per connection, one json response line.
+
+        {"Op": "ping"}
+        {"Op": "describe", "Resource": "volumes", "Regions": [...], "Profile": "default",
+         "Filters": ["state=in-use"], "Cache": true}
+        {"Op": "call", "Api": "create_snapshot", "Region": "us-east-1", "Profile": "default",
+         "Params": {"VolumeId": "vol-0a1b2c3d"}}
+        {"Op": "shutdown"}
+
+    Clients (region_fetch.py, components.py, ec2cli) use request(), which
+    returns None when the daemon is not running so callers fall back to
+    querying aws directly.  Once a request is sent, a timeout or missing
+    reply raises DaemonError instead: a mutation may already have been
+    applied and must not be repeated through awscli.  Only the daemon
+    imports boto3.
+
+    Usage:
+
+        $ python3 ec2clid.py start
+        $ python3 ec2clid.py status
+        $ python3 ec2clid.py call --region us-east-1 --api create_tags \\
+                --params '{"Resources": ["vol-0a1b2c3d"], "Tags": [{"Key": "Env", "Value": "prod"}]}'
+        $ python3 ec2clid.py stop
+
+Author:
+    Blake Huber
+    Copyright Blake Huber, All Rights Reserved.
+
+License:
+    GNU General Public License v3.0 (GPL-3)
+    Additional terms may be found in the complete license agreement:
+    https://bitbucket.org/blakeca00/ec2cli/src/master/LICENSE.txt
+
+OS Support:
+    - RedHat Linux, Amazon Linux, Ubuntu & variants
+
+Dependencies:
+    - Requires python3, tested under py3.5 and py3.6
+"""
+
+import os
+import sys
+import json
+import time
+import socket
+import argparse
+import threading
+import subprocess
+
+# pkg
+from oscodes_unix import exit_codes
+
+
+CONFIG_PATH = os.path.join(os.path.expanduser('~'), '.config', 'ec2cli')
+SOCKET_PATH = os.path.join(CONFIG_PATH, 'ec2clid.sock')
+CONNECT_TIMEOUT = 0.5       # seconds; a live daemon accepts immediately
+REQUEST_TIMEOUT = 300       # seconds; multi-region describes of large accounts
+IDLE_TIMEOUT = 1800         # seconds without a request before the daemon exits
+START_TIMEOUT = 10          # seconds to wait for a started daemon to answer
+
+# mutating apis served by the call op: awscli command invalidating cached responses
+MUTATIONS = {
+    'attach_volume': 'attach-volume',
+    'create_image': 'create-image',
+    'create_snapshot': 'create-snapshot',
+    'create_tags': 'create-tags',
+    'start_instances': 'start-instances'
+}
+
+
+class DaemonError(Exception):
+    """Raised for requests the daemon rejected or failed; code is a key of exit_codes"""
+    def __init__(self, message, code='E_MISC'):
+        super().__init__(message)
+        self.code = code
+
+
+def request(payload, timeout=REQUEST_TIMEOUT, socket_path=SOCKET_PATH):
+    """
+    Summary:
+        Sends a request to the daemon
+    Args:
+        :payload (dict): request; see protocol in module docstring
+        :timeout (int): seconds to wait for the response
+    Returns:
+        response, or None if the daemon is not running | TYPE: dict
+    Raises:
+        DaemonError if the request was sent but no complete response arrived;
+        a mutating request may have been applied, so callers must not retry it
+    """
+    if not os.path.exists(socket_path):
+        return None
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+        sock.settimeout(CONNECT_TIMEOUT)
+        try:
+            sock.connect(socket_path)
+        except OSError:
+            return None         # stale socket of an exited daemon
+        sock.settimeout(timeout)
+        try:
+            sock.sendall(json.dumps(payload).encode('utf-8') + b'\n')
+            with sock.makefile('rb') as f1:
+                line = f1.readline()
+            if not line.endswith(b'\n'):
+                raise ValueError('connection closed before a complete response')
+            return json.loads(line.decode('utf-8'))
+        except (OSError, ValueError) as e:
+            raise DaemonError('no response to %s request, outcome unknown (%s)' % (payload.get('Op'), str(e)))
+
+
+def ping(timeout=CONNECT_TIMEOUT, socket_path=SOCKET_PATH):
+    """Daemon status, or None if it is not running or not answering"""
+    try:
+        return request({'Op': 'ping'}, timeout=timeout, socket_path=socket_path)
+    except DaemonError:
+        return None
+
+
+def describe(resource, regions, profile=None, cache=True, expressions=None):
+    """
+    Summary:
+        region_fetch.fetch_all served by the daemon
+    Returns:
+        normalized document, or None if the daemon is not running or failed | TYPE: dict
+    Raises:
+        ValueError if a filter expression is invalid for resource
+    """
+    try:
+        response = request({
+            'Op': 'describe', 'Resource': resource, 'Regions': regions, 'Profile': profile,
+            'Filters': expressions or [], 'Cache': cache
+        })
+    except DaemonError:
+        return None             # read only; safe to repeat without the daemon
+    if response is None or response.get('Code') == 'E_MISC':
+        return None
+    if 'Error' in response:
+        raise ValueError(response['Error'])
+    return response['Document']
+
+
+def call(api, region, params=None, profile=None):
+    """
+    Summary:
+        Invokes a mutating ec2 api through the daemon's warm client pool
+    Returns:
+        api response, or None if the daemon is not running | TYPE: dict
+    Raises:
+        DaemonError if the api call was rejected or failed, or its outcome is unknown
+    """
+    response = request({'Op': 'call', 'Api': api, 'Region': region, 'Params': params or {}, 'Profile': profile})
+    if response is None:
+        return None
+    if 'Error' in response:
+        raise DaemonError(response['Error'], response.get('Code', 'E_MISC'))
+    return response['Result']
+
+
+# --- daemon ---------------------------------------------------------------------------------------
+
+
+class ClientPool():
+    """
+    boto3 clients per (profile, service, region).  Clients are thread safe
+    once created; creation and sessions are not, so both happen under lock
+    """
+    def __init__(self):
+        import identity
+        self.fingerprint = identity.fingerprint
+        self.lock = threading.Lock()
+        self.sessions = {}
+        self.clients = {}
+        self.stamp = self.fingerprint()
+
+    def client(self, service, region, profile=None):
+        import boto3
+        import scheduler
+        from region_fetch import client_config
+
+        profile = profile or 'default'
+        key = (profile, service, region)
+        with self.lock:
+            stamp = self.fingerprint()
+            if stamp != self.stamp:
+                # credentials rotated; discard clients holding the old keys
+                self.sessions, self.clients, self.stamp = {}, {}, stamp
+            if key not in self.clients:
+                if profile not in self.sessions:
+                    self.sessions[profile] = boto3.Session(profile_name=None if profile == 'default' else profile)
+                self.clients[key] = self.sessions[profile].client(service, region_name=region, config=client_config())
+                if service == 'ec2':
+                    scheduler.attach(self.clients[key], profile)
+            return self.clients[key]
+
+
+def dispatch(server, payload):
+    """
+    Summary:
+        Executes a single request
+    Returns:
+        response | TYPE: dict
+    """
+    import region_fetch
+    import response_cache
+    from botocore.exceptions import BotoCoreError, ClientError
+
+    op = payload.get('Op')
+
+    if op == 'ping':
+        import scheduler
+        stats = scheduler.SCHEDULER.stats()
+        return {'Status': 'running', 'Pid': os.getpid(), 'Clients': len(server.pool.clients),
+                'Uptime': round(time.time() - server.started),
+                'Requests': sum(x['Requests'] for x in stats), 'Throttles': sum(x['Throttles'] for x in stats)}
+
+    elif op == 'describe':
+        document = region_fetch.fetch_all(
+                payload['Resource'], payload['Regions'], profile=payload.get('Profile'),
+                cache=payload.get('Cache', True), expressions=payload.get('Filters')
+            )
+        return {'Document': document}
+
+    elif op == 'call':
+        api = payload.get('Api')
+        if api not in MUTATIONS:
+            return {'Error': 'Unsupported api: %s' % api, 'Code': 'E_BADARG'}
+        client = server.pool.client('ec2', payload['Region'], payload.get('Profile'))
+        try:
+            result = getattr(client, api)(**payload.get('Params', {}))
+        except ClientError as e:
+            return {'Error': '%s: %s' % (e.response['Error']['Code'], e.response['Error']['Message']), 'Code': 'E_MISC'}
+        except (BotoCoreError, TypeError) as e:
+            return {'Error': str(e), 'Code': 'E_BADARG'}
+        result.pop('ResponseMetadata', None)
+        response_cache.invalidate(command=MUTATIONS[api])
+        return {'Result': json.loads(json.dumps(result, default=region_fetch.json_default))}
+
+    elif op == 'shutdown':
+        threading.Thread(target=server.shutdown).start()
+        return {'Status': 'stopping'}
+
+    return {'Error': 'Unknown op: %s' % op, 'Code': 'E_BADARG'}
+
+
+def serve(socket_path=SOCKET_PATH, idle_timeout=IDLE_TIMEOUT):
+    """
+    Summary:
+        Runs the daemon in the foreground until shutdown or idle timeout
+    Returns:
+        Success | Failure, TYPE: bool
+    """
+    import socketserver
+    import loggers
+    import region_fetch
+    from _version import __version__
+
+    logger = loggers.getLogger(__version__)
+
+    class Handler(socketserver.StreamRequestHandler):
+        def handle(self):
+            self.server.last_request = time.time()
+            try:
+                response = dispatch(self.server, json.loads(self.rfile.readline().decode('utf-8')))
+            except ValueError as e:
+                response = {'Error': str(e), 'Code': 'E_BADARG'}
+            except KeyError as e:
+                response = {'Error': 'Invalid request, missing %s' % str(e), 'Code': 'E_BADARG'}
+            except Exception as e:
+                logger.exception('ec2clid: request failed (%s)' % str(e))
+                response = {'Error': str(e), 'Code': 'E_MISC'}
+            self.wfile.write(json.dumps(response).encode('utf-8') + b'\n')
+
+    class Server(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+        daemon_threads = True
+
+    if ping(socket_path=socket_path):
+        return True             # already running
+    try:
+        os.remove(socket_path)  # stale socket of an exited daemon
+    except OSError:
+        pass
+
+    os.makedirs(os.path.dirname(socket_path), mode=0o700, exist_ok=True)
+    umask = os.umask(0o177)     # socket accessible to this user only
+    try:
+        server = Server(socket_path, Handler)
+    finally:
+        os.umask(umask)
+    server.pool = region_fetch.CLIENT_POOL = ClientPool()
+    server.started = server.last_request = time.time()
+
+    def watchdog():
+        while time.time() - server.last_request < idle_timeout:
+            time.sleep(min(60, idle_timeout))
+        server.shutdown()
+
+    threading.Thread(target=watchdog, daemon=True).start()
+    logger.info('ec2clid: listening on %s (pid %d)' % (socket_path, os.getpid()))
+    try:
+        server.serve_forever()
+    finally:
+        server.server_close()
+        try:
+            os.remove(socket_path)
+        except OSError:
+            pass
+    logger.info('ec2clid: exit after %d seconds' % (time.time() - server.started))
+    return True
+
+
+def start(idle_timeout=IDLE_TIMEOUT):
+    """Starts a detached daemon and waits until it answers"""
+    if ping():
+        return True
+    subprocess.Popen(
+        [sys.executable, os.path.realpath(__file__), 'run', '--idle', str(idle_timeout)],
+        stdin=subprocess.DEVNULL, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+        close_fds=True, start_new_session=True
+    )
+    deadline = time.time() + START_TIMEOUT
+    while time.time() < deadline:
+        if ping():
+            return True
+        time.sleep(0.1)
+    return False
+
+
+def options(parser, help_menu=False):
+    """
+    Summary:
+        parse cli parameter options
+    Returns:
+        TYPE: argparse object, parser argument set
+    """
+    parser.add_argument("operation", nargs='?', default='status', choices=['start', 'run', 'stop', 'status', 'call'])
+    parser.add_argument("-p", "--profile", nargs='?', default=os.environ.get('AWS_PROFILE', 'default'))
+    parser.add_argument("-r", "--region", nargs='?', default=None, required=False)
+    parser.add_argument("-a", "--api", nargs='?', default=None, required=False, choices=sorted(MUTATIONS))
+    parser.add_argument("-P", "--params", nargs='?', default='{}', required=False, help="api parameters, json")
+    parser.add_argument("-i", "--idle", type=int, default=IDLE_TIMEOUT, required=False,
+                              help="seconds without a request before exit (default: %(default)s)")
+    return parser.parse_args()
+
+
+def init():
+
+    parser = argparse.ArgumentParser(add_help=True, description="ec2clid help:")
+    args = options(parser)
+
+    if args.operation == 'run':
+        return serve(idle_timeout=args.idle)
+
+    elif args.operation == 'start':
+        if not start(args.idle):
+            print('ec2clid: daemon failed to start', file=sys.stderr)
+            sys.exit(exit_codes['EX_UNAVAILABLE']['Code'])
+
+    elif args.operation == 'stop':
+        try:
+            request({'Op': 'shutdown'}, timeout=CONNECT_TIMEOUT)
+        except DaemonError:
+            pass
+
+    elif args.operation == 'status':
+        response = ping()
+        if response is None:
+            print('ec2clid: not running')
+            sys.exit(exit_codes['EX_UNAVAILABLE']['Code'])
+        print('ec2clid: running (pid %d, %d clients, up %ds, %d requests, %d throttled)' % (
+            response['Pid'], response['Clients'], response['Uptime'],
+            response.get('Requests', 0), response.get('Throttles', 0)))
+
+    elif args.operation == 'call':
+        if not (args.api and args.region):
+            print('ec2clid: call requires --api and --region', file=sys.stderr)
+            sys.exit(exit_codes['E_BADARG']['Code'])
+        try:
+            result = call(args.api, args.region, json.loads(args.params), args.profile)
+        except ValueError as e:
+            print('ec2clid: invalid --params (%s)' % str(e), file=sys.stderr)
+            sys.exit(exit_codes['E_BADARG']['Code'])
+        except DaemonError as e:
+            print('ec2clid: %s' % str(e), file=sys.stderr)
+            sys.exit(exit_codes[e.code]['Code'])
+        if result is None:
+            # caller falls back to awscli
+            sys.exit(exit_codes['EX_UNAVAILABLE']['Code'])
+        print(json.dumps(result, indent=4))
+    return True
+
+
+if __name__ == '__main__':
+    sys.exit(exit_codes['EX_OK']['Code'] if init() else exit_codes['E_MISC']['Code'])
@@ -17,3 +17,4 @@ E_BADARG=8                         # exit code if bad input parameter
 E_NETWORK_ACCESS=9                 # exit code if no network access from current location
 E_EXPIRED_CREDS=10                 # exit code if temporary credentials no longer valid
 E_MISC=11                          # exit code if miscellaneous (unspecified) error
+E_UNAVAILABLE=69                   # exit code if a required service (ec2clid) is unavailable
@@ -0,0 +1,208 @@
+"""
+Summary:
+    filters (python3) | Filter expressions for ec2cli list commands.
+
+    Expressions are translated into describe-* Filters parameters so EC2
+    discards non-matching resources before they are transferred.  Criteria
+    the api cannot evaluate for a resource type (eg an id prefix) are
+    applied to the response items locally.
+
+    Expression syntax (criteria are combined with AND, comma separated
+    values with OR; values may contain * and ? wildcards):
+
+        state=running,stopped
+        type=t3.*
+        vpc=vpc-0a1b2c3d
+        az=us-east-1a
+        id=i-0ab                    # id prefix
+        tag:Name=web*               # tag key and value
+        tag-key=Environment         # tag key present
+
+    Usage:
+
+        $ python3 filters.py --type instances state=running tag:Env=prod
+
+Author:
+    Blake Huber
+    Copyright Blake Huber, All Rights Reserved.
+
+License:
+    GNU General Public License v3.0 (GPL-3)
+    Additional terms may be found in the complete license agreement:
+    https://bitbucket.org/blakeca00/ec2cli/src/master/LICENSE.txt
+
+OS Support:
+    - RedHat Linux, Amazon Linux, Ubuntu & variants
+
+Dependencies:
+    - Requires python3, tested under py3.5 and py3.6
+"""
+
+import sys
+import json
+import argparse
+from fnmatch import fnmatchcase
+
+# pkg
+from projection import parse_path, resolve
+from oscodes_unix import exit_codes
+
+
+# expression key: describe-* filter name, per resource type
+SERVER = {
+    'enis': {'state': 'status', 'vpc': 'vpc-id', 'az': 'availability-zone', 'type': 'interface-type'},
+    'images': {'state': 'state', 'type': 'image-type'},
+    'instances': {
+        'state': 'instance-state-name', 'vpc': 'vpc-id', 'az': 'availability-zone', 'type': 'instance-type'
+    },
+    'secgroups': {'vpc': 'vpc-id'},
+    'snapshots': {'state': 'status'},
+    'subnets': {'state': 'state', 'vpc': 'vpc-id', 'az': 'availability-zone'},
+    'volumes': {'state': 'status', 'az': 'availability-zone', 'type': 'volume-type'},
+    'vpcs': {'state': 'state'}
+}
+
+# expression key: item path, for criteria evaluated locally
+CLIENT = {
+    'enis': {'id': 'NetworkInterfaceId'},
+    'images': {'id': 'ImageId'},
+    'instances': {'id': 'InstanceId'},
+    'secgroups': {'id': 'GroupId'},
+    'snapshots': {'id': 'SnapshotId'},
+    'subnets': {'id': 'SubnetId'},
+    'volumes': {'id': 'VolumeId'},
+    'vpcs': {'id': 'VpcId', 'vpc': 'VpcId'}
+}
+PREFIX_KEYS = ('id',)       # values matched as a prefix unless a wildcard is given
+
+
+def parse(expressions):
+    """
+    Summary:
+        Parses filter expressions
+    Args:
+        :expressions (list): key=value[,value] strings
+    Returns:
+        (key, values) per expression | TYPE: list
+    Raises:
+        ValueError for malformed expressions
+    """
+    criteria = []
+    for expression in expressions:
+        key, sep, values = expression.partition('=')
+        if not sep or not key.strip() or not values.strip():
+            raise ValueError('Invalid filter expression: %s (expected key=value)' % expression)
+        criteria.append((key.strip(), [x.strip() for x in values.split(',') if x.strip()]))
+    return criteria
+
+
+def split(resource, criteria):
+    """
+    Summary:
+        Divides criteria into describe-* Filters and locally evaluated criteria
+    Args:
+        :resource (str): resource type (instances, volumes, etc)
+        :criteria (list): output of parse
+    Returns:
+        Filters parameter, local criteria | TYPE: tuple (list, list)
+    Raises:
+        ValueError if a criterion cannot be evaluated for resource
+    """
+    server, local = [], []
+    for key, values in criteria:
+        if key.startswith('tag:') or key == 'tag-key':
+            server.append({'Name': key, 'Values': values})
+        elif key in SERVER[resource] and key not in PREFIX_KEYS:
+            server.append({'Name': SERVER[resource][key], 'Values': values})
+        elif key in CLIENT[resource]:
+            local.append((CLIENT[resource][key], key, values))
+        else:
+            raise ValueError('Filter %s is not supported for %s' % (key, resource))
+    return server, local
+
+
+def _match(value, patterns, prefix=False):
+    """True if value matches any pattern; prefix patterns match leading characters"""
+    if value is None:
+        return False
+    value = str(value)
+    for pattern in patterns:
+        if prefix and not any(x in pattern for x in '*?'):
+            pattern += '*'
+        if fnmatchcase(value, pattern):
+            return True
+    return False
+
+
+def predicate(local):
+    """
+    Summary:
+        Builds a function testing a response item against local criteria
+    Returns:
+        function(item) -> bool
+    """
+    tests = [(parse_path(path), values, key in PREFIX_KEYS) for path, key, values in local]
+
+    def test(item):
+        return all(_match(resolve(item, segments), values, prefix) for segments, values, prefix in tests)
+    return test
+
+
+def apply(resource, items, local):
+    """
+    Summary:
+        Discards response items not matching local criteria
+    Args:
+        :resource (str): resource type; instances are filtered within reservations
+        :items (list): describe-* response items
+        :local (list): local criteria returned by split
+    Returns:
+        matching items | TYPE: list
+    """
+    if not local:
+        return items
+    test = predicate(local)
+    if resource == 'instances':
+        reservations = []
+        for reservation in items:
+            instances = [x for x in reservation.get('Instances', []) if test(x)]
+            if instances:
+                reservations.append(dict(reservation, Instances=instances))
+        return reservations
+    return [x for x in items if test(x)]
+
+
+def options(parser, help_menu=False):
+    """
+    Summary:
+        parse cli parameter options
+    Returns:
+        TYPE: argparse object, parser argument set
+    """
+    parser.add_argument("-t", "--type", nargs='?', required=True, choices=sorted(SERVER))
+    parser.add_argument("expressions", nargs='*', help="key=value filter expressions")
+    return parser.parse_args()
+
+
+def init():
+
+    parser = argparse.ArgumentParser(add_help=True, description="filters help:")
+
+    if len(sys.argv) == 1:
+        parser.print_help()
+        sys.exit(exit_codes['EX_OK']['Code'])
+
+    args = options(parser)
+
+    try:
+        server, local = split(args.type, parse(args.expressions))
+    except ValueError as e:
+        print('filters: %s' % str(e), file=sys.stderr)
+        return False
+
+    print(json.dumps({'Filters': server, 'Local': [{'Path': x[0], 'Values': x[2]} for x in local]}, indent=4))
+    return True
+
+
+if __name__ == '__main__':
+    sys.exit(exit_codes['EX_OK']['Code'] if init() else exit_codes['E_BADARG']['Code'])
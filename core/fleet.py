@@ -0,0 +1,349 @@
+"""
+Summary:
+    fleet (python3) | Lists a resource type across many accounts and regions.
+
+    Every (profile, region) shard is queried on a single bounded worker pool
+    so listing a fleet of accounts costs about as long as its slowest
+    account rather than the sum of all of them.  Profiles are authenticated
+    concurrently through the identity cache; one boto3 session per profile
+    is shared by all of its regions, and assumed role credentials are kept
+    in the awscli credential cache between runs.  Requests are paced per
+    account and region by the request scheduler.
+
+    Results are merged into a region_fetch document whose items are tagged
+    with Account and Region, then rendered as one table or written as json.
+
+    Usage:
+
+        $ python3 fleet.py --type instances --profiles all --regions us-east-1,eu-west-1
+        $ python3 fleet.py --type volumes --profiles prod,stage \\
+                           --regions-file ~/.config/ec2cli/regions.list --outfile fleet.json
+
+Author:
+    Blake Huber
+    Copyright Blake Huber, All Rights Reserved.
+
+License:
+    GNU General Public License v3.0 (GPL-3)
+    Additional terms may be found in the complete license agreement:
+    https://bitbucket.org/blakeca00/ec2cli/src/master/LICENSE.txt
+
+OS Support:
+    - RedHat Linux, Amazon Linux, Ubuntu & variants
+
+Dependencies:
+    - Requires python3, tested under py3.5 and py3.6
+"""
+
+import os
+import sys
+import json
+import time
+import argparse
+import inspect
+import threading
+import configparser
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+# pkg
+import filters
+import identity
+import scheduler
+from region_fetch import RESOURCES, MAX_WORKERS, client_config, fetch_region, json_default, read_regions
+from oscodes_unix import exit_codes
+import loggers
+from _version import __version__
+
+# globals
+logger = loggers.getLogger(__version__)
+FLEET_WORKERS = MAX_WORKERS * 4
+
+# resource: projection row root, projection columns, table.py columns
+VIEWS = {
+    'enis': (
+        'NetworkInterfaces[]',
+        'Account,Region,NetworkInterfaceId,Status,PrivateIpAddress,SubnetId,Attachment.InstanceId',
+        'Account:20.20,Region:14,EniId:22,Status:10,PrivateIp:16,SubnetId:25,InstanceId:20'
+    ),
+    'images': (
+        'Images[]',
+        'Account,Region,ImageId,State,CreationDate|date,Name',
+        'Account:20.20,Region:14,ImageId:22,State:10,Created:11,Name:40.40'
+    ),
+    'instances': (
+        'Reservations[].Instances[]',
+        'Account,Region,InstanceId,InstanceType,State.Name,PrivateIpAddress,LaunchTime|runtime,Tags[0].Value',
+        'Account:20.20,Region:14,InstanceId:20,Type:12,State:10,PrivateIp:16,Runtime:12,Name:30.30'
+    ),
+    'secgroups': (
+        'SecurityGroups[]',
+        'Account,Region,GroupId,VpcId,GroupName,Description',
+        'Account:20.20,Region:14,GroupId:21,VpcId:22,GroupName:25.25,Description:35.35'
+    ),
+    'snapshots': (
+        'Snapshots[]',
+        'Account,Region,SnapshotId,VolumeSize,StartTime|date,State,VolumeId,Description',
+        'Account:20.20,Region:14,SnapId:23,Size:5,CreateTime:11,State:10,VolumeId:22,Description:35.35'
+    ),
+    'subnets': (
+        'Subnets[]',
+        'Account,Region,SubnetId,VpcId,AvailabilityZone,CidrBlock,AvailableIpAddressCount',
+        'Account:20.20,Region:14,SubnetId:25,VpcId:22,AZ:15,CIDR:18,FreeIPs:8'
+    ),
+    'volumes': (
+        'Volumes[]',
+        'Account,Region,VolumeId,Size,VolumeType,State,Attachments[0].InstanceId,CreateTime|date',
+        'Account:20.20,Region:14,VolumeId:22,Size:5,Type:8,State:10,InstanceId:20,Created:11'
+    ),
+    'vpcs': (
+        'Vpcs[]',
+        'Account,Region,VpcId,CidrBlock,IsDefault,State',
+        'Account:20.20,Region:14,VpcId:22,CIDR:18,Default:8,State:10'
+    )
+}
+
+
+def local_profiles():
+    """
+    Summary:
+        Every profile configured in the local awscli config and credentials
+        files, including role profiles.  Config file sections other than
+        [default] and [profile x] (sso-session, services, plugins) are not
+        profiles
+    Returns:
+        TYPE: list
+    """
+    profiles = set()
+    config_file, credentials_file = identity.awscli_files()
+    for path in (config_file, credentials_file):
+        parser = configparser.ConfigParser()
+        try:
+            parser.read(path)
+        except configparser.Error as e:
+            logger.warning('%s: unable to parse %s (%s)' % (inspect.stack()[0][3], path, str(e)))
+            continue
+        for section in parser.sections():
+            if path == credentials_file:
+                profiles.add(section)
+            elif section == 'default':
+                profiles.add(section)
+            elif section.startswith('profile '):
+                profiles.add(section[len('profile '):].strip())
+    return sorted(profiles)
+
+
+def authenticate(profiles, workers=FLEET_WORKERS):
+    """
+    Summary:
+        Resolves the identity of each profile and creates its boto3 session
+    Returns:
+        profile: (session, identity, client creation lock), profile: error | TYPE: tuple (dict, dict)
+    """
+    from botocore.exceptions import BotoCoreError
+
+    def resolve(profile):
+        # identity first: unknown profiles raise IdentityError (E_BADPROFILE)
+        entry = identity.get(profile)
+        return identity.profile_session(profile), entry, threading.Lock()
+
+    accounts, failed = {}, {}
+    with ThreadPoolExecutor(max_workers=max(1, min(workers, len(profiles)))) as executor:
+        futures = {executor.submit(resolve, x): x for x in profiles}
+        for future in as_completed(futures):
+            try:
+                accounts[futures[future]] = future.result()
+            except (identity.IdentityError, BotoCoreError) as e:
+                failed[futures[future]] = str(e)
+    for profile, error in sorted(failed.items()):
+        logger.warning('%s: profile %s skipped (%s)' % (inspect.stack()[0][3], profile, error))
+    return accounts, failed
+
+
+def account_name(entry):
+    """Account alias, or account number when no alias is assigned"""
+    return entry['Alias'] if entry.get('Alias') and entry['Alias'] != identity.NO_ALIAS else entry['Account']
+
+
+def fetch_shard(resource, profile, region, accounts, cache=True, expressions=None):
+    """
+    Summary:
+        Retrieves one (profile, region) shard with the profile's shared session
+    Returns:
+        items, elapsed seconds, error message or None | TYPE: tuple
+    """
+    session, entry, lock = accounts[profile]
+    with lock:
+        # boto3 sessions are not thread safe; clients are
+        client = session.client('ec2', region_name=region, config=client_config())
+    scheduler.attach(client, account=entry['Account'])
+
+    items, elapsed, error = fetch_region(resource, region, profile, cache, expressions, client=client)
+    name = account_name(entry)
+    for item in items:
+        item['Account'] = name
+        for instance in item.get('Instances', []) if resource == 'instances' else []:
+            instance['Account'], instance['Region'] = name, region
+    return items, elapsed, error
+
+
+def fetch(resource, profiles, regions, workers=FLEET_WORKERS, cache=True, expressions=None):
+    """
+    Summary:
+        Queries every (profile, region) shard concurrently, merging results
+        into one document ordered by account, then region
+    Args:
+        :resource (str): key from RESOURCES (instances, volumes, etc)
+        :profiles (list): profile names from local awscli config
+        :regions (list): aws region codes
+        :workers (int): maximum shards queried at the same time
+    Returns:
+        normalized document | TYPE: dict
+    """
+    key = RESOURCES[resource]['key']
+    start = time.time()
+
+    # validate before any profile is authenticated
+    filters.split(resource, filters.parse(expressions or []))
+
+    accounts, failed = authenticate(profiles, workers)
+
+    # profiles of the same account (user and role, gcreds- prefixed) are listed once
+    listed, duplicates = {}, {}
+    for profile in sorted(accounts):
+        account = accounts[profile][1]['Account']
+        if account in listed:
+            duplicates[profile] = listed[account]
+        else:
+            listed[account] = profile
+    shards = [
+        (p, r) for p in sorted(listed.values(), key=lambda x: account_name(accounts[x][1])) for r in regions
+    ]
+    results = {}
+
+    with ThreadPoolExecutor(max_workers=max(1, min(workers, len(shards) or 1))) as executor:
+        futures = {
+            executor.submit(fetch_shard, resource, p, r, accounts, cache, expressions): (p, r)
+            for p, r in shards
+        }
+        for future in as_completed(futures):
+            results[futures[future]] = future.result()
+
+    document = {key: [], 'Regions': {}, 'Profiles': {}}
+    for profile in profiles:
+        entry = accounts[profile][1] if profile in accounts else {}
+        document['Profiles'][profile] = {
+            'Account': entry.get('Account'),
+            'Alias': account_name(entry) if entry else None,
+            'Error': failed.get(profile),
+            'Duplicate': duplicates.get(profile)
+        }
+    for profile, region in shards:
+        items, elapsed, error = results[(profile, region)]
+        document[key].extend(items)
+        document['Regions']['%s %s' % (account_name(accounts[profile][1]), region)] = {
+            'Count': len(items),
+            'Elapsed': elapsed,
+            'Error': error
+        }
+    document['Elapsed'] = round(time.time() - start, 3)
+    logger.info(
+        '%s: %s retrieved from %d accounts, %d regions in %s seconds' %
+        (inspect.stack()[0][3], resource, len(listed), len(regions), document['Elapsed']))
+    return document
+
+
+def render(resource, document, frame='', text=''):
+    """
+    Summary:
+        Renders the merged document as one table with a summary footer
+    Returns:
+        TYPE: generator of output lines
+    """
+    import table
+    from projection import DELIMITER, project
+
+    root, columns, layout = VIEWS[resource]
+    specs = table.parse_columns(layout.split(','))
+    rows = [x.split(DELIMITER) for x in project([document], root, columns.split(','), null='-')]
+    accounts = len({x['Account'] for x in document['Profiles'].values() if x['Account']})
+    regions = len({x.split(' ')[-1] for x in document['Regions']})
+    yield from table.render(rows, specs, frame, text)
+    yield from table.footer(
+        '%d %s in %d accounts, %d regions (%ss)' % (len(rows), resource, accounts, regions, document['Elapsed']),
+        frame, text, table.table_width(specs)
+    )
+
+
+def options(parser, help_menu=False):
+    """
+    Summary:
+        parse cli parameter options
+    Returns:
+        TYPE: argparse object, parser argument set
+    """
+    parser.add_argument("-t", "--type", nargs='?', required=True, choices=sorted(RESOURCES))
+    parser.add_argument("-p", "--profiles", nargs='?', default='all', required=False,
+                              help="comma delimited profile names, or all (default: %(default)s)")
+    parser.add_argument("-r", "--regions", nargs='?', required=False,
+                              help="comma delimited list of region codes")
+    parser.add_argument("-f", "--regions-file", dest='regions_file', nargs='?', required=False)
+    parser.add_argument("-o", "--outfile", nargs='?', required=False,
+                              help="write the merged json document instead of a table")
+    parser.add_argument("-w", "--workers", type=int, default=FLEET_WORKERS, required=False)
+    parser.add_argument("-n", "--no-cache", dest='no_cache', action='store_true', required=False)
+    parser.add_argument("-F", "--filter", dest='filters', action='append', default=[], required=False,
+                              help="filter expression, eg state=running (repeatable)")
+    parser.add_argument("--frame", nargs='?', default='', required=False)
+    parser.add_argument("--text", nargs='?', default='', required=False)
+    return parser.parse_args()
+
+
+def init():
+
+    parser = argparse.ArgumentParser(add_help=True, description="fleet help:")
+
+    if len(sys.argv) == 1:
+        parser.print_help()
+        sys.exit(exit_codes['EX_OK']['Code'])
+
+    args = options(parser)
+
+    if args.regions:
+        regions = [x.strip() for x in args.regions.split(',') if x.strip()]
+    elif args.regions_file and os.path.exists(args.regions_file):
+        regions = read_regions(args.regions_file)
+    else:
+        print('fleet: You must provide --regions or a valid --regions-file', file=sys.stderr)
+        sys.exit(exit_codes['E_BADARG']['Code'])
+
+    if args.profiles == 'all':
+        profiles = local_profiles()
+    else:
+        profiles = [x.strip() for x in args.profiles.split(',') if x.strip()]
+    if not profiles:
+        print('fleet: No profiles found in the local awscli config', file=sys.stderr)
+        sys.exit(exit_codes['E_BADARG']['Code'])
+
+    try:
+        document = fetch(args.type, profiles, regions, args.workers, not args.no_cache, args.filters)
+    except ValueError as e:
+        print('fleet: %s' % str(e), file=sys.stderr)
+        sys.exit(exit_codes['E_BADARG']['Code'])
+
+    for profile, entry in sorted(document['Profiles'].items()):
+        if entry['Error']:
+            print('fleet: profile %s skipped (%s)' % (profile, entry['Error']), file=sys.stderr)
+
+    if args.outfile:
+        with open(args.outfile, 'w') as out_file:
+            json.dump(document, out_file, default=json_default)
+    else:
+        try:
+            sys.stdout.write('\n'.join(render(args.type, document, args.frame, args.text)) + '\n')
+        except BrokenPipeError:
+            sys.stdout = None
+    return any(not x['Error'] for x in document['Profiles'].values())
+
+
+if __name__ == '__main__':
+    sys.exit(exit_codes['EX_OK']['Code'] if init() else exit_codes['E_MISC']['Code'])
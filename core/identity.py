@@ -0,0 +1,282 @@
+"""
+Summary:
+    identity (python3) | Cached caller identity per awscli profile.
+
+    Account id, account alias, caller arn and temporary credential expiry
+    are stored per profile in ~/.config/ec2cli so that authentication
+    checks and account headers do not start an awscli process (sts
+    get-caller-identity, iam list-account-aliases) on every command.
+
+    An entry is valid until its time to live elapses (the "identity" key
+    of the "cache" TTL section in config.json), its credentials expire, or
+    the awscli config or credentials file changes.  Entries are replaced
+    atomically; concurrent refreshes are serialised with an flock so only
+    one process queries aws.  The lookup path does not import boto3.
+
+    Usage:
+
+        $ python3 identity.py --profile default --field alias
+        $ python3 identity.py --profile default --refresh
+        $ python3 identity.py --profile default --invalidate
+
+Author:
+    Blake Huber
+    Copyright Blake Huber, All Rights Reserved.
+
+License:
+    GNU General Public License v3.0 (GPL-3)
+    Additional terms may be found in the complete license agreement:
+    https://bitbucket.org/blakeca00/ec2cli/src/master/LICENSE.txt
+
+OS Support:
+    - RedHat Linux, Amazon Linux, Ubuntu & variants
+
+Dependencies:
+    - Requires python3, tested under py3.5 and py3.6
+"""
+
+import os
+import sys
+import json
+import time
+import fcntl
+import argparse
+
+# pkg
+from oscodes_unix import exit_codes
+from response_cache import read_config
+
+
+CONFIG_PATH = os.path.join(os.path.expanduser('~'), '.config', 'ec2cli')
+DEFAULT_TTL = 3600          # seconds
+EXPIRY_MARGIN = 60          # seconds; treat credentials about to expire as expired
+NO_ALIAS = '<no_alias_assigned>'
+CREDENTIAL_CACHE = os.path.join(os.path.expanduser('~'), '.aws', 'cli', 'cache')
+FIELDS = ('Account', 'Alias', 'Arn', 'Expiry')
+
+
+class IdentityError(Exception):
+    """Raised when a profile cannot authenticate; code is a key of exit_codes"""
+    def __init__(self, message, code='E_AUTHFAIL'):
+        super().__init__(message)
+        self.code = code
+
+
+def identity_path(profile):
+    return os.path.join(CONFIG_PATH, 'identity-%s.json' % profile)
+
+
+def awscli_files():
+    """Locations of the local awscli config and credentials files"""
+    home = os.path.expanduser('~')
+    return [
+        os.environ.get('AWS_CONFIG_FILE', os.path.join(home, '.aws', 'config')),
+        os.environ.get('AWS_SHARED_CREDENTIALS_FILE', os.path.join(home, '.aws', 'credentials'))
+    ]
+
+
+def profile_session(profile):
+    """
+    Summary:
+        boto3 session for profile.  Role credentials obtained from sts are
+        cached in the awscli credential cache, so assumed roles are reused
+        across processes and by aws cli commands until they expire
+    Returns:
+        TYPE: boto3.Session
+    Raises:
+        IdentityError if profile is not in the local awscli config
+    """
+    import boto3
+    import botocore.session
+    from botocore.credentials import JSONFileCache
+    from botocore.exceptions import ProfileNotFound
+
+    core = botocore.session.Session(profile=None if profile == 'default' else profile)
+    try:
+        provider = core.get_component('credential_provider').get_provider('assume-role')
+    except ProfileNotFound:
+        raise IdentityError('The IAM user or role (%s) cannot be found in your local awscli config' % profile,
+                            'E_BADPROFILE')
+    provider.cache = JSONFileCache(CREDENTIAL_CACHE)
+    return boto3.Session(botocore_session=core)
+
+
+def fingerprint():
+    """
+    Summary:
+        Modification time and size of each awscli file; any change to
+        either file invalidates cached identities
+    Returns:
+        TYPE: list
+    """
+    stats = []
+    for path in awscli_files():
+        try:
+            stat = os.stat(path)
+            stats.append([stat.st_mtime_ns, stat.st_size])
+        except OSError:
+            stats.append(None)
+    return stats
+
+
+def ttl(config=None):
+    config = config or read_config()
+    return config['TTL'].get('identity', DEFAULT_TTL)
+
+
+def cached(profile, now=None):
+    """
+    Summary:
+        Returns the cached identity for profile if valid
+    Args:
+        :profile (str): profile_name of an iam user from local awscli config
+    Returns:
+        identity or None | TYPE: dict
+    """
+    now = now or time.time()
+    try:
+        with open(identity_path(profile)) as f1:
+            entry = json.load(f1)
+    except (OSError, ValueError):
+        return None
+
+    if now - entry.get('Created', 0) > ttl():
+        return None
+    if entry.get('Expiry') and now > entry['Expiry'] - EXPIRY_MARGIN:
+        return None
+    if entry.get('Fingerprint') != fingerprint():
+        return None
+    return entry
+
+
+def fetch(profile):
+    """
+    Summary:
+        Queries sts and iam for the caller identity of profile
+    Returns:
+        identity | TYPE: dict
+    Raises:
+        IdentityError if profile is unknown or fails to authenticate
+    """
+    from botocore.exceptions import BotoCoreError, ClientError, ProfileNotFound
+
+    stats = fingerprint()       # taken before credentials are read
+    try:
+        session = profile_session(profile)
+        caller = session.client('sts').get_caller_identity()
+    except ProfileNotFound:
+        raise IdentityError('The IAM user or role (%s) cannot be found in your local awscli config' % profile,
+                            'E_BADPROFILE')
+    except ClientError as e:
+        code = e.response['Error']['Code']
+        if 'Expired' in code:
+            raise IdentityError('The sts temporary credentials for %s have expired' % profile, 'E_EXPIRED_CREDS')
+        raise IdentityError('The IAM profile provided (%s) failed to authenticate to AWS (%s)' % (profile, code))
+    except BotoCoreError as e:
+        raise IdentityError('The IAM profile provided (%s) failed to authenticate to AWS (%s)' % (profile, str(e)))
+
+    try:
+        aliases = session.client('iam').list_account_aliases()['AccountAliases']
+    except (BotoCoreError, ClientError):
+        aliases = []            # no iam:ListAccountAliases permission
+
+    expiry = getattr(session.get_credentials(), '_expiry_time', None)
+    return {
+        'Profile': profile,
+        'Account': caller['Account'],
+        'Alias': aliases[0] if aliases else None,
+        'Arn': caller['Arn'],
+        'Expiry': expiry.timestamp() if expiry else None,
+        'Created': time.time(),
+        'Fingerprint': stats
+    }
+
+
+def get(profile=None, refresh=False):
+    """
+    Summary:
+        Returns the identity of profile, from cache where valid.  A single
+        process refreshes an invalid entry; others wait for and reuse it
+    Args:
+        :profile (str): profile_name of an iam user from local awscli config
+        :refresh (bool): query aws regardless of cached entry
+    Returns:
+        identity | TYPE: dict
+    Raises:
+        IdentityError if profile is unknown or fails to authenticate
+    """
+    profile = profile or os.environ.get('AWS_PROFILE', 'default')
+    entry = None if refresh else cached(profile)
+    if entry:
+        return entry
+
+    os.makedirs(CONFIG_PATH, exist_ok=True)
+    with open(identity_path(profile) + '.lock', 'w') as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        entry = None if refresh else cached(profile)
+        if entry:
+            # refreshed by a concurrent process while waiting for the lock
+            return entry
+        entry = fetch(profile)
+        tmp = '%s.%d.tmp' % (identity_path(profile), os.getpid())
+        try:
+            with open(tmp, 'w') as f1:
+                json.dump(entry, f1)
+            os.chmod(tmp, 0o600)
+            os.replace(tmp, identity_path(profile))
+        except OSError:
+            pass
+    return entry
+
+
+def invalidate(profile):
+    """Removes the cached identity of profile"""
+    try:
+        os.remove(identity_path(profile))
+        return True
+    except OSError:
+        return False
+
+
+def options(parser, help_menu=False):
+    """
+    Summary:
+        parse cli parameter options
+    Returns:
+        TYPE: argparse object, parser argument set
+    """
+    parser.add_argument("-p", "--profile", nargs='?', default=os.environ.get('AWS_PROFILE', 'default'))
+    parser.add_argument("-f", "--field", nargs='?', default=None, required=False,
+                              choices=[x.lower() for x in FIELDS],
+                              help="print a single field; alias falls back to account id")
+    parser.add_argument("-r", "--refresh", dest='refresh', action='store_true', required=False)
+    parser.add_argument("-i", "--invalidate", dest='invalidate', action='store_true', required=False)
+    return parser.parse_args()
+
+
+def init():
+
+    parser = argparse.ArgumentParser(add_help=True, description="identity help:")
+    args = options(parser)
+
+    if args.invalidate:
+        invalidate(args.profile)
+        return True
+
+    try:
+        entry = get(args.profile, refresh=args.refresh)
+    except IdentityError as e:
+        print('identity: %s' % str(e), file=sys.stderr)
+        sys.exit(exit_codes[e.code]['Code'])
+
+    if args.field == 'alias':
+        print(entry['Alias'] or entry['Account'])
+    elif args.field:
+        print(entry[args.field.capitalize()] or '')
+    else:
+        print(json.dumps({k: entry[k] for k in FIELDS}, indent=4))
+    return True
+
+
+if __name__ == '__main__':
+    sys.exit(exit_codes['EX_OK']['Code'] if init() else exit_codes['E_MISC']['Code'])
@@ -0,0 +1,289 @@
+"""
+Summary:
+    instance_start (python3) | Starts ec2 instances and waits until each
+    accepts connections.
+
+    Stopped instances are started with a single start-instances call.  State
+    is then followed with one batched describe-instance-status call per poll
+    interval; as instances reach running their public addresses are read in
+    one describe-instances call and the login port (22, or 3389 for windows)
+    is probed until it accepts a tcp connection, so the caller can log in as
+    soon as sshd is listening rather than after a fixed delay.
+
+    The ssh login user is derived up front from the platform and name of
+    each instance's image, replacing sequential attempts with every
+    candidate username.
+
+    Usage:
+
+        $ python3 instance_start.py --region us-east-1 --instances i-0a1b,i-2c3d
+        $ python3 instance_start.py --region us-east-1 --instances i-0a1b --format delimited
+
+Author:
+    Blake Huber
+    Copyright Blake Huber, All Rights Reserved.
+
+License:
+    GNU General Public License v3.0 (GPL-3)
+    Additional terms may be found in the complete license agreement:
+    https://bitbucket.org/blakeca00/ec2cli/src/master/LICENSE.txt
+
+OS Support:
+    - RedHat Linux, Amazon Linux, Ubuntu & variants
+
+Dependencies:
+    - Requires python3, tested under py3.5 and py3.6
+"""
+
+import sys
+import json
+import time
+import socket
+import argparse
+import inspect
+from concurrent.futures import ThreadPoolExecutor
+
+# pkg
+import response_cache
+from region_fetch import MAX_WORKERS, ec2_client
+from projection import DELIMITER
+from oscodes_unix import exit_codes
+import loggers
+from _version import __version__
+
+# globals
+logger = loggers.getLogger(__version__)
+POLL_INTERVAL = 2           # seconds between describe-instance-status calls
+PROBE_TIMEOUT = 2           # seconds per tcp connection attempt
+TIMEOUT = 300               # seconds to wait for all instances
+DEFAULT_USER = 'ec2-user'
+COLUMNS = 'InstanceId:20,State:10,PublicIp:16,Port:5,User:10,KeyName:20,Ready:6'
+
+# image name fragment: ssh user; first match wins
+SSH_USERS = [
+    ('ubuntu', 'ubuntu'),
+    ('debian', 'admin'),
+    ('centos', 'centos'),
+    ('fedora', 'fedora'),
+    ('bitnami', 'bitnami'),
+    ('rocky', 'rocky'),
+    ('almalinux', 'ec2-user'),
+    ('amzn', 'ec2-user'),
+    ('al2023', 'ec2-user'),
+    ('rhel', 'ec2-user'),
+    ('suse', 'ec2-user'),
+    ('sles', 'ec2-user')
+]
+
+
+def ssh_user(image):
+    """
+    Summary:
+        Login user for an image from its platform, name and description
+    Args:
+        :image (dict): describe-images item, or empty when the image is unknown
+    Returns:
+        username, None for windows | TYPE: str
+    """
+    if image.get('Platform') == 'windows':
+        return None
+    text = ' '.join(str(image.get(x, '')) for x in ('PlatformDetails', 'Name', 'Description', 'ImageLocation'))
+    text = text.lower()
+    return next((user for fragment, user in SSH_USERS if fragment in text), DEFAULT_USER)
+
+
+def describe(client, instance_ids):
+    """
+    Summary:
+        Instances by id, one (paginated) describe-instances call
+    Returns:
+        instance_id: describe-instances item | TYPE: dict
+    """
+    instances = {}
+    for page in client.get_paginator('describe_instances').paginate(InstanceIds=instance_ids):
+        for reservation in page['Reservations']:
+            instances.update((x['InstanceId'], x) for x in reservation['Instances'])
+    return instances
+
+
+def images(client, instances):
+    """
+    Summary:
+        Images of instances, one describe-images call
+    Returns:
+        image_id: describe-images item | TYPE: dict
+    """
+    image_ids = sorted({x['ImageId'] for x in instances.values()})
+    if not image_ids:
+        return {}
+    # images deregistered since launch are omitted rather than failing the call
+    response = client.describe_images(Filters=[{'Name': 'image-id', 'Values': image_ids}])
+    return {x['ImageId']: x for x in response['Images']}
+
+
+def start(client, instances, out=sys.stderr):
+    """
+    Summary:
+        Starts every stopped instance with a single start-instances call;
+        instances still stopping are waited on until stopped first
+    Returns:
+        instance ids started | TYPE: list
+    """
+    stopping = [k for k, v in instances.items() if v['State']['Name'] == 'stopping']
+    if stopping:
+        out.write('  Waiting for %s to stop\n' % ', '.join(stopping))
+        delay = POLL_INTERVAL * 2
+        client.get_waiter('instance_stopped').wait(
+            InstanceIds=stopping, WaiterConfig={'Delay': delay, 'MaxAttempts': TIMEOUT // delay})
+        for instance_id in stopping:
+            instances[instance_id]['State']['Name'] = 'stopped'
+
+    stopped = [k for k, v in instances.items() if v['State']['Name'] == 'stopped']
+    if stopped:
+        client.start_instances(InstanceIds=stopped)
+        response_cache.invalidate(command='start-instances')
+    return stopped
+
+
+def probe(address, port, timeout=PROBE_TIMEOUT):
+    """True when address accepts a tcp connection on port"""
+    try:
+        with socket.create_connection((address, port), timeout=timeout):
+            return True
+    except OSError:
+        return False
+
+
+def wait(client, targets, timeout=TIMEOUT, interval=POLL_INTERVAL, out=sys.stderr):
+    """
+    Summary:
+        Polls instance state in one call per interval and probes the login
+        port of each running instance until every target is reachable
+    Args:
+        :targets (dict): instance_id: target record (see init), updated in place
+    Returns:
+        targets | TYPE: dict
+    """
+    start_time = time.time()
+    pending = set(targets)
+
+    with ThreadPoolExecutor(max_workers=max(1, min(MAX_WORKERS, len(targets)))) as executor:
+        while pending and time.time() - start_time < timeout:
+            statuses = client.describe_instance_status(InstanceIds=sorted(pending), IncludeAllInstances=True)
+            for status in statuses['InstanceStatuses']:
+                targets[status['InstanceId']]['State'] = status['InstanceState']['Name']
+
+            running = [x for x in pending if targets[x]['State'] == 'running']
+            unaddressed = [x for x in running if not targets[x]['PublicIp']]
+            if unaddressed:
+                for instance_id, instance in describe(client, unaddressed).items():
+                    targets[instance_id]['PublicIp'] = instance.get('PublicIpAddress')
+
+            addressed = [x for x in running if targets[x]['PublicIp']]
+            for instance_id, ready in zip(addressed, executor.map(
+                    lambda x: probe(targets[x]['PublicIp'], targets[x]['Port']), addressed)):
+                if ready:
+                    targets[instance_id]['Ready'] = True
+                    pending.discard(instance_id)
+
+            for instance_id in running:
+                if not targets[instance_id]['PublicIp']:
+                    # no public address; nothing further to wait for
+                    pending.discard(instance_id)
+
+            out.write('\r  %d/%d instances reachable (%ds)  ' % (
+                len(targets) - len(pending), len(targets), time.time() - start_time))
+            out.flush()
+            if pending:
+                time.sleep(interval)
+    out.write('\n')
+    for instance_id in sorted(pending):
+        logger.warning('%s: %s not reachable after %ds' % (inspect.stack()[0][3], instance_id, timeout))
+    return targets
+
+
+def options(parser, help_menu=False):
+    """
+    Summary:
+        parse cli parameter options
+    Returns:
+        TYPE: argparse object, parser argument set
+    """
+    parser.add_argument("-p", "--profile", nargs='?', default="default", required=False)
+    parser.add_argument("-r", "--region", nargs='?', required=True)
+    parser.add_argument("-i", "--instances", nargs='?', required=True,
+                              help="comma delimited instance ids")
+    parser.add_argument("-T", "--timeout", type=int, default=TIMEOUT, required=False)
+    parser.add_argument("-n", "--no-wait", dest='no_wait', action='store_true', required=False)
+    parser.add_argument("-F", "--format", nargs='?', default='table', choices=['table', 'json', 'delimited'],
+                              help="delimited: one \\x1f delimited line per instance for bash read")
+    parser.add_argument("--frame", nargs='?', default='', required=False)
+    parser.add_argument("--text", nargs='?', default='', required=False)
+    return parser.parse_args()
+
+
+def init():
+
+    parser = argparse.ArgumentParser(add_help=True, description="instance_start help:")
+
+    if len(sys.argv) == 1:
+        parser.print_help()
+        sys.exit(exit_codes['EX_OK']['Code'])
+
+    args = options(parser)
+    instance_ids = [x.strip() for x in args.instances.split(',') if x.strip()]
+
+    from botocore.exceptions import BotoCoreError, ClientError
+
+    client = ec2_client(args.region, args.profile)
+    try:
+        instances = describe(client, instance_ids)
+        ended = [k for k, v in instances.items() if v['State']['Name'] in ('shutting-down', 'terminated')]
+        if ended:
+            print('instance_start: %s terminated; cannot be started' % ', '.join(ended), file=sys.stderr)
+            sys.exit(exit_codes['E_BADARG']['Code'])
+        amis = images(client, instances)
+        targets = {}
+        for instance_id, instance in instances.items():
+            image = amis.get(instance['ImageId'], {})
+            windows = instance.get('Platform') == 'windows' or image.get('Platform') == 'windows'
+            targets[instance_id] = {
+                'InstanceId': instance_id,
+                'State': instance['State']['Name'],
+                'PublicIp': instance.get('PublicIpAddress'),
+                'Port': 3389 if windows else 22,
+                'User': None if windows else ssh_user(image),
+                'KeyName': instance.get('KeyName'),
+                'Platform': 'windows' if windows else 'linux',
+                'Ready': False
+            }
+        started = start(client, instances)
+        for instance_id in started:
+            # address from before the start was released at stop; wait() reads the new one once running
+            targets[instance_id].update({'State': 'pending', 'PublicIp': None})
+        if started:
+            print('  Starting %s' % ', '.join(started), file=sys.stderr)
+        if not args.no_wait:
+            wait(client, targets, args.timeout)
+    except (BotoCoreError, ClientError) as e:
+        print('instance_start: %s' % str(e), file=sys.stderr)
+        sys.exit(exit_codes['E_MISC']['Code'])
+
+    records = [targets[x] for x in instance_ids if x in targets]
+    if args.format == 'json':
+        print(json.dumps(records, indent=4))
+    elif args.format == 'delimited':
+        fields = ('InstanceId', 'State', 'PublicIp', 'Port', 'User', 'KeyName', 'Platform', 'Ready')
+        for x in records:
+            print(DELIMITER.join('' if x[k] is None else str(x[k]).lower() if k == 'Ready' else str(x[k])
+                                 for k in fields))
+    else:
+        from table import parse_columns, render
+        rows = [[x['InstanceId'], x['State'], x['PublicIp'] or '-', str(x['Port']), x['User'] or '-',
+                 x['KeyName'] or '-', 'yes' if x['Ready'] else 'no'] for x in records]
+        print('\n'.join(render(rows, parse_columns(COLUMNS.split(',')), args.frame, args.text)))
+    return args.no_wait or all(x['Ready'] for x in records)
+
+
+if __name__ == '__main__':
+    sys.exit(exit_codes['EX_OK']['Code'] if init() else exit_codes['E_MISC']['Code'])
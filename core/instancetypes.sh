@@ -45,7 +45,7 @@ nc=$(tput sgr0)           # no color
 
 function dependency_check(){
     ## check for required cli tools ##
-    for prog in stat date printf wget sort sed; do
+    for prog in stat date printf sort sed python3; do
         if ! type "$prog" > /dev/null 2>&1; then
             std_message "$prog is required and not found in the PATH. Aborting (code $E_DEPENDENCY)" "WARN" $ec2cli_log
             exit $E_DEPENDENCY
@@ -79,35 +79,30 @@ function set_tmpdir(){
 
 
 function get_ec2_pricefile(){
-	std_message "Downloading a current EC2 inventory price file from AWS." "INFO" $ec2cli_log
-	# retrieve current url of EC2 price files
+    ## conditional (ETag / Last-Modified) download of index and price files ##
     cd "$TMPDIR"
-	wget -O $TMPDIR/index.json $INDEXURL
-	CurrentURL="https://pricing.us-east-1.amazonaws.com"$(jq -r '.offers.AmazonEC2.currentVersionUrl' "$TMPDIR/index.json")
+	# retrieve current url of EC2 price files
+    get_ec2_offerfile
+	CurrentURL="https://pricing.us-east-1.amazonaws.com"$(jq -r '.offers.AmazonEC2.currentVersionUrl' "$TMPDIR/$OFFERFILE")
     std_logger "CurrentURL is: $CurrentURL" "INFO" $ec2cli_log
-	rm "$TMPDIR/index.json"
-	# pull on-demand pricing from current EC2 Price API url
-	wget -O "$TMPDIR/$PRICEFILE" $CurrentURL
-	#mv -v "$TMPDIR/index.json" "$TMPDIR/$PRICEFILE" 1>&2
+	# pull on-demand pricing from current EC2 Price API url; resumes partial downloads
+    if ! FETCH_STATUS=$(python3 "$lib_path/offer_fetch.py" --url "$CurrentURL" --outfile "$TMPDIR/$PRICEFILE"); then
+        FETCH_FAILED="true"
+    fi
+    std_logger "Price file fetch status: ${FETCH_STATUS:-failed}" "INFO" $ec2cli_log
 }
 
 function get_ec2_offerfile(){
-    if [ ! -e "$TMPDIR/$OFFERFILE" ]; then
-	    std_message "Retrieving offerfile to validate last official release date..." "INFO" $ec2cli_log
-	    wget $INDEXURL -O $TMPDIR/$OFFERFILE
-	    #mv $TMPDIR/index.json $TMPDIR/$OFFERFILE 1>&2
-    else
-        std_message "$OFFERFILE found, skipping download new." "INFO" $ec2cli_log
-        return
-    fi
+    ## offer index; revalidated with a conditional request when present ##
+    python3 "$lib_path/offer_fetch.py" --url "$INDEXURL" --outfile "$TMPDIR/$OFFERFILE" > /dev/null
 }
 
 function clean_up(){
     if [ ! "$RETAIN_DOWNLOADS" ] || [ "$RETAIN_DOWNLOADS" = "false" ]; then
         # offer location file
-        rm "$TMPDIR/$OFFERFILE" || true
+        rm -f "$TMPDIR/$OFFERFILE" "$TMPDIR/$OFFERFILE".meta.json || true
         # ec2 price file
-        rm "$TMPDIR/$PRICEFILE" || true
+        rm -f "$TMPDIR/$PRICEFILE" "$TMPDIR/$PRICEFILE".meta.json "$TMPDIR/$PRICEFILE".part || true
     fi
 }
 
@@ -127,43 +122,41 @@ set_tmpdir
 
 if [ ! -f "$TMPDIR/$PRICEFILE" ]; then
     std_message "EC2 local price file not found, retrieving new file..." "INFO" $ec2cli_log
-    get_ec2_pricefile "$TMPDIR/$PRICEFILE"
 else
 	std_message "Local file [$PRICEFILE] has been found, released $(stat -c '%.10y' $TMPDIR/$PRICEFILE)" "INFO" $ec2cli_log
-    get_ec2_offerfile "$TMPDIR/$OFFERFILE"
-    # grab publicationDate and convert to epoch seconds
-    PUBDATE=$(date -d$(jq -r .publicationDate "$TMPDIR/$OFFERFILE") +%s)
-    std_message "Last AWS official release date found was: $(date --date=@$PUBDATE)" "INFO" $ec2cli_log
-    LOCALDATE=$(stat -c '%Y' "$TMPDIR/$PRICEFILE")
-    if [[ $(( $PUBDATE - $LOCALDATE )) -gt $DELAY ]]; then
-    	# aws has released an update
-    	std_message "AWS official EC2 inventory recently updated.  Downloading new inventory file..." "INFO" $ec2cli_log
-    	get_ec2_pricefile "$TMPDIR/$PRICEFILE"
-        # set success bit
-        if [ -f "$TMPDIR/$PRICEFILE" ]; then
-            UPDATE_SUCCESS="true"
-            std_logger "UPDATE_SUCCESS set to true." "INFO" $ec2cli_log
-        fi
+fi
 
-    else
-    	std_message "Local file matches latest AWS Official release date within 24 hours." "INFO" $ec2cli_log
-        std_message "Processing local EC2 inventory file." "INFO" $ec2cli_log
-    fi
+get_ec2_pricefile "$TMPDIR/$PRICEFILE"
+
+if [ ! -f "$TMPDIR/$PRICEFILE" ]; then
+    std_message "Unable to retrieve EC2 price file from AWS. Aborting (code $E_DEPENDENCY)" "WARN" $ec2cli_log
+    exit $E_DEPENDENCY
+
+elif [ "$FETCH_FAILED" ]; then
+    std_message "Unable to refresh EC2 price file from AWS.  Processing existing local EC2 inventory file." "WARN" $ec2cli_log
+
+elif [ "$FETCH_STATUS" = "unchanged" ]; then
+	std_message "Local file matches latest AWS Official release.  Processing local EC2 inventory file." "INFO" $ec2cli_log
+
+else
+	std_message "AWS official EC2 inventory retrieved ($FETCH_STATUS)." "INFO" $ec2cli_log
+    UPDATE_SUCCESS="true"
+    std_logger "UPDATE_SUCCESS set to true." "INFO" $ec2cli_log
 fi
 
 ###
 ### process inventory file
 ###
 
-ARR_TYPES=( $(jq -r '.products | map(.attributes.instanceType)' "$TMPDIR/$PRICEFILE") )
-# initial array scrub - remove duplicates, quotes
-ARR_CLEAN=( $(printf '%s\n' "${ARR_TYPES[@]}" | sort -u | sed -e 's|["'\'']||g') )
-# create array of all additional elements to remove
-ARR_REMOVE=( ${ARR_CLEAN[@]/*.*/} "," )
-# remove ARR_REMOVE elements from ARR_CLEAN
-for i in "${ARR_REMOVE[@]}"; do
-	ARR_CLEAN=( ${ARR_CLEAN[@]//"$i"} )
-done
+# stream price file once into the instance type catalog (constant memory)
+CATALOG_FILE="catalog.json"
+if { [ "$FETCH_STATUS" != "unchanged" ] && [ ! "$FETCH_FAILED" ]; } || [ ! -e "$CONFIG_PATH/$CATALOG_FILE" ]; then
+    python3 "$lib_path/catalog.py" build "$TMPDIR/$PRICEFILE" --outfile "$CONFIG_PATH/$CATALOG_FILE"
+    std_logger "Instance type catalog written to $CONFIG_PATH/$CATALOG_FILE" "INFO" $ec2cli_log
+fi
+
+# deduplicated, sorted instance sizes from catalog index
+ARR_CLEAN=( $(python3 "$lib_path/catalog.py" types --catalog "$CONFIG_PATH/$CATALOG_FILE") )
 TYPE_CT=${#ARR_CLEAN[@]}    # total number of instance types available
 
 ###
@@ -0,0 +1,225 @@
+"""
+Summary:
+    offer_fetch (python3) | Conditional, resumable download of AWS price files.
+
+    Downloads pricing index and offer files through a single pooled http
+    session.  Each cached file is accompanied by a metadata sidecar
+    (<file>.meta.json) recording the ETag and Last-Modified validators
+    returned by the server, which are replayed on the next fetch as
+    If-None-Match / If-Modified-Since.  An unchanged upstream file costs
+    one 304 round trip.  Interrupted downloads are kept as <file>.part and
+    resumed with an http Range request guarded by If-Range.
+
+    Usage:
+
+        $ python3 offer_fetch.py --url https://pricing.us-east-1.amazonaws.com/... \\
+                                 --outfile /tmp/index.json
+
+Author:
+    Blake Huber
+    Copyright Blake Huber, All Rights Reserved.
+
+License:
+    GNU General Public License v3.0 (GPL-3)
+    Additional terms may be found in the complete license agreement:
+    https://bitbucket.org/blakeca00/ec2cli/src/master/LICENSE.txt
+
+OS Support:
+    - RedHat Linux, Amazon Linux, Ubuntu & variants
+
+Dependencies:
+    - Requires python3, tested under py3.5 and py3.6
+    - requests
+"""
+
+import os
+import sys
+import json
+import time
+import argparse
+from urllib.parse import urlparse
+
+# pkg
+import requests
+from requests.adapters import HTTPAdapter
+from oscodes_unix import exit_codes
+
+
+CHUNK_SIZE = 1024 * 1024        # bytes written per read from the response stream
+CONNECT_TIMEOUT = 10            # seconds
+READ_TIMEOUT = 60               # seconds
+META_SUFFIX = '.meta.json'
+PART_SUFFIX = '.part'
+_session = None
+
+
+def get_session():
+    """
+    Summary:
+        Returns the module http session, shared across index and offer requests
+    Returns:
+        requests.Session object
+    """
+    global _session
+    if _session is None:
+        _session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=4, pool_maxsize=8, max_retries=3)
+        _session.mount('https://', adapter)
+        _session.mount('http://', adapter)
+    return _session
+
+
+def local_path(url, directory):
+    """
+    Summary:
+        Maps a url to a unique cache location; offer files share the name index.json
+    Returns:
+        path, eg <directory>/offers-v1.0-aws-AmazonEC2-current-index.json | TYPE: str
+    """
+    return os.path.join(directory, '-'.join(x for x in urlparse(url).path.split('/') if x))
+
+
+def read_metadata(path):
+    """Returns fetch metadata recorded alongside path, empty dict if none"""
+    try:
+        with open(path + META_SUFFIX) as f1:
+            return json.load(f1)
+    except (OSError, ValueError):
+        return {}
+
+
+def write_metadata(path, metadata):
+    """Records fetch metadata alongside path"""
+    tmp = path + META_SUFFIX + '.tmp'
+    with open(tmp, 'w') as f1:
+        json.dump(metadata, f1, indent=4)
+    os.replace(tmp, path + META_SUFFIX)
+
+
+def fetch(url, path, session=None, force=False):
+    """
+    Summary:
+        Retrieves url to path, transferring only what has changed upstream
+    Args:
+        :url (str): http/s universal resource locator
+        :path (str): local filesystem destination
+        :session (requests.Session): http session; module session if omitted
+        :force (bool): ignore cached validators, download in full
+    Returns:
+        status: 'unchanged', 'downloaded', or 'resumed' | TYPE: str
+    Raises:
+        requests.RequestException on transport or http errors
+    """
+    session = session or get_session()
+    metadata = {} if force else read_metadata(path)
+    part = path + PART_SUFFIX
+    headers = {}
+
+    if metadata.get('Url') != url:
+        metadata = {}
+
+    if os.path.exists(path) and metadata.get('Complete'):
+        # conditional request; server replies 304 when unchanged
+        if metadata.get('ETag'):
+            headers['If-None-Match'] = metadata['ETag']
+        if metadata.get('LastModified'):
+            headers['If-Modified-Since'] = metadata['LastModified']
+
+    elif os.path.exists(part) and not metadata.get('Complete') and metadata.get('ETag'):
+        # resume partial download; If-Range falls back to 200 if object changed
+        headers['Range'] = 'bytes=%d-' % os.path.getsize(part)
+        headers['If-Range'] = metadata['ETag']
+
+    start = time.time()
+    with session.get(url, headers=headers, stream=True, timeout=(CONNECT_TIMEOUT, READ_TIMEOUT)) as r:
+
+        if r.status_code == 304:
+            metadata['Checked'] = time.time()
+            write_metadata(path, metadata)
+            return 'unchanged'
+
+        if r.status_code == 416:
+            # partial file no longer consistent with upstream; start over
+            try:
+                os.remove(part)
+            except FileNotFoundError:
+                pass
+            return fetch(url, path, session, force=True)
+
+        r.raise_for_status()
+        resumed = r.status_code == 206
+
+        metadata = {
+            'Url': url,
+            'ETag': r.headers.get('ETag'),
+            'LastModified': r.headers.get('Last-Modified'),
+            'Complete': False
+        }
+        write_metadata(path, metadata)
+
+        with open(part, 'ab' if resumed else 'wb') as f1:
+            for chunk in r.iter_content(chunk_size=CHUNK_SIZE):
+                f1.write(chunk)
+
+    os.replace(part, path)
+    metadata.update({
+        'Complete': True,
+        'Size': os.path.getsize(path),
+        'Elapsed': round(time.time() - start, 3),
+        'Checked': time.time()
+    })
+    write_metadata(path, metadata)
+    return 'resumed' if resumed else 'downloaded'
+
+
+def fetch_json(url, directory, session=None):
+    """
+    Summary:
+        Retrieves (conditionally) and parses a json document such as a price index
+    Args:
+        :url (str): http/s universal resource locator
+        :directory (str): cache location of the downloaded document
+    Returns:
+        parsed json document | TYPE: dict
+    """
+    path = local_path(url, directory)
+    fetch(url, path, session)
+    with open(path) as f1:
+        return json.load(f1)
+
+
+def options(parser, help_menu=False):
+    """
+    Summary:
+        parse cli parameter options
+    Returns:
+        TYPE: argparse object, parser argument set
+    """
+    parser.add_argument("-u", "--url", nargs='?', required=True)
+    parser.add_argument("-o", "--outfile", nargs='?', required=True)
+    parser.add_argument("-f", "--force", dest='force', action='store_true', required=False)
+    return parser.parse_args()
+
+
+def init():
+
+    parser = argparse.ArgumentParser(add_help=True, description="offer_fetch help:")
+
+    if len(sys.argv) == 1:
+        parser.print_help()
+        sys.exit(exit_codes['EX_OK']['Code'])
+
+    args = options(parser)
+
+    try:
+        status = fetch(args.url, args.outfile, force=args.force)
+    except (OSError, requests.RequestException) as e:
+        print('offer_fetch: Failed to retrieve %s (%s)' % (args.url, str(e)), file=sys.stderr)
+        return False
+
+    print(status)
+    return True
+
+
+if __name__ == '__main__':
+    sys.exit(exit_codes['EX_OK']['Code'] if init() else exit_codes['E_MISC']['Code'])
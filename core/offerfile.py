@@ -0,0 +1,198 @@
+"""
+Summary:
+    offerfile (python3) | Streaming reader for the Amazon EC2 offer file.
+
+    The AmazonEC2 offer (price) file is several GB in size; loading it with
+    json.loads or jq exhausts memory on small build hosts.  This module walks
+    the document as a stream of parse events, reading fixed size chunks, so
+    memory use is constant regardless of file size.
+
+    Events follow the ijson convention of (prefix, event, value) where prefix
+    is the dotted path to the current value and list members are named "item":
+
+        ('products.ABC123.attributes.instanceType', 'string', 'm5.large')
+
+    Usage:
+
+        $ python3 offerfile.py ec2prices_allregions.json   # prints instance types
+
+Author:
+    Blake Huber
+    Copyright Blake Huber, All Rights Reserved.
+
+License:
+    GNU General Public License v3.0 (GPL-3)
+    Additional terms may be found in the complete license agreement:
+    https://bitbucket.org/blakeca00/ec2cli/src/master/LICENSE.txt
+
+OS Support:
+    - RedHat Linux, Amazon Linux, Ubuntu & variants
+
+Dependencies:
+    - Requires python3, tested under py3.5 and py3.6
+"""
+
+import re
+import sys
+import json
+import argparse
+
+# pkg
+from oscodes_unix import exit_codes
+
+
+CHUNK_SIZE = 64 * 1024      # characters read from the offer file per refill
+_token = re.compile(
+    r'[ \t\n\r]*(?:'
+    r'([{}\[\]:,])|'                                    # structural
+    r'("(?:[^"\\]|\\.)*")|'                             # string
+    r'(-?\d+(?:\.\d+)?(?:[eE][+-]?\d+)?)|'              # number
+    r'(true|false|null)'                                # literal
+    r')', re.S)
+_literals = {'true': ('boolean', True), 'false': ('boolean', False), 'null': ('null', None)}
+_delimiter = re.compile(r'[ \t\n\r,:\]}]')        # characters which may follow a number or literal
+
+
+def tokens(fileobj, chunk_size=CHUNK_SIZE):
+    """
+    Summary:
+        Yields lexical json tokens read incrementally from a file object
+    Args:
+        :fileobj (file): text mode file object
+        :chunk_size (int): characters read per refill
+    Returns:
+        generator of (kind, value) tuples; kind is one of
+        'punct', 'string', 'number', 'literal'
+    """
+    buffer, pos, eof = '', 0, False
+
+    while True:
+        match = _token.match(buffer, pos)
+
+        # token may be truncated at the chunk boundary; refill and retry.  A number
+        # cut after '1500.' or '1e' matches a shorter number followed by the tail
+        truncated = match is not None and (match.group(3) or match.group(4)) and \
+            not _delimiter.match(buffer, match.end()) and len(buffer) - match.end() < 64
+        if not eof and (match is None or match.end() == len(buffer) or truncated):
+            chunk = fileobj.read(chunk_size)
+            buffer, pos, eof = buffer[pos:] + chunk, 0, not chunk
+            continue
+
+        if match is None:
+            if buffer[pos:].strip():
+                raise ValueError('Invalid json near: %s' % buffer[pos:pos + 40])
+            return
+
+        pos = match.end()
+        punct, string, number, literal = match.groups()
+        if punct:
+            yield 'punct', punct
+        elif string:
+            yield 'string', json.loads(string)
+        elif number:
+            yield 'number', number
+        else:
+            yield 'literal', literal
+
+
+def parse(fileobj, chunk_size=CHUNK_SIZE):
+    """
+    Summary:
+        Yields (prefix, event, value) parse events without building the document
+    Args:
+        :fileobj (file): text mode file object
+        :chunk_size (int): characters read per refill
+    Returns:
+        generator of (prefix, event, value) tuples
+    """
+    path = []           # current location; dict keys and 'item' for list members
+    containers = []     # '{' or '[' for each open container
+    expect_key = False
+
+    for kind, value in tokens(fileobj, chunk_size):
+        prefix = '.'.join(path)
+
+        if kind == 'punct':
+            if value == '{':
+                yield prefix, 'start_map', None
+                containers.append('{')
+                path.append('')
+                expect_key = True
+            elif value == '[':
+                yield prefix, 'start_array', None
+                containers.append('[')
+                path.append('item')
+            elif value in '}]':
+                containers.pop()
+                path.pop()
+                yield '.'.join(path), 'end_map' if value == '}' else 'end_array', None
+            elif value == ',':
+                expect_key = containers[-1] == '{'
+            continue
+
+        if expect_key:
+            path[-1] = value
+            yield '.'.join(path[:-1]), 'map_key', value
+            expect_key = False
+            continue
+
+        if kind == 'string':
+            yield prefix, 'string', value
+        elif kind == 'number':
+            yield prefix, 'number', float(value) if ('.' in value or 'e' in value.lower()) else int(value)
+        else:
+            event, literal = _literals[value]
+            yield prefix, event, literal
+
+
+def instance_types(fileobj, chunk_size=CHUNK_SIZE):
+    """
+    Summary:
+        Collects the distinct instanceType attribute of every product sku
+    Args:
+        :fileobj (file): text mode file object containing the ec2 offer file
+    Returns:
+        deduplicated instance sizes (eg m5.large) | TYPE: set
+    """
+    sizes = set()
+    for prefix, event, value in parse(fileobj, chunk_size):
+        if event == 'string' and prefix.startswith('products.') and prefix.endswith('.attributes.instanceType'):
+            # exclude family-only values (eg "m5") which lack a size
+            if '.' in value:
+                sizes.add(value)
+    return sizes
+
+
+def options(parser, help_menu=False):
+    """
+    Summary:
+        parse cli parameter options
+    Returns:
+        TYPE: argparse object, parser argument set
+    """
+    parser.add_argument("filename", nargs='?', default='-', help="ec2 offer file (default: stdin)")
+    return parser.parse_args()
+
+
+def init():
+
+    parser = argparse.ArgumentParser(add_help=True, description="offerfile help:")
+    args = options(parser)
+
+    try:
+        if args.filename == '-':
+            sizes = instance_types(sys.stdin)
+        else:
+            with open(args.filename) as f1:
+                sizes = instance_types(f1)
+    except (OSError, ValueError) as e:
+        print('offerfile: %s' % str(e), file=sys.stderr)
+        return False
+
+    for size in sorted(sizes):
+        sys.stdout.write(size + '\n')
+    return True
+
+
+if __name__ == '__main__':
+    sys.exit(exit_codes['EX_OK']['Code'] if init() else exit_codes['EX_DATAERR']['Code'])
@@ -0,0 +1,296 @@
+"""
+Summary:
+    projection (python3) | Single-pass json column projection.
+
+    Parses a describe-* json response once and emits every requested column
+    as a single delimited row per resource, replacing one jq invocation per
+    column in the ec2cli_list_* renderers.  Input containing several top-level
+    json documents (concatenated awscli output) is read as a stream of values.
+
+    Path syntax (relative to the row root):
+
+        State.Name
+        Tags[0].Value
+        BlockDeviceMappings[0].Ebs.VolumeId
+
+    Row roots expand lists with [], eg: Reservations[].Instances[]
+
+    With --stream each input line is parsed as a separate json document
+    (region_fetch.py --stream output) and its rows are flushed immediately.
+
+    A column may be suffixed with :N to truncate to N characters (cut -c 1-N).
+
+    Timestamp columns may name a formatter with |name, applied in process so
+    renderers need not fork date(1) per row:
+
+        LaunchTime|runtime      elapsed time since timestamp, eg 3d,4h,12m
+        CreateTime|date         local date, eg 2018-10-01
+        CreationDate|datetime   local date and time, eg 2018-10-01.T12:00
+
+Author:
+    Blake Huber
+    Copyright Blake Huber, All Rights Reserved.
+
+License:
+    GNU General Public License v3.0 (GPL-3)
+    Additional terms may be found in the complete license agreement:
+    https://bitbucket.org/blakeca00/ec2cli/src/master/LICENSE.txt
+
+OS Support:
+    - RedHat Linux, Amazon Linux, Ubuntu & variants
+
+Dependencies:
+    - Requires python3, tested under py3.5 and py3.6
+"""
+
+import re
+import sys
+import json
+import time
+import argparse
+import datetime
+
+# pkg
+from oscodes_unix import exit_codes
+
+
+DELIMITER = '\x1f'      # ascii unit separator; preserves empty fields in bash read
+NULL = 'null'           # jq -r representation of a missing value
+_segment = re.compile(r'([^.\[\]]+)|\[(\d*)\]')
+_timestamp = re.compile(
+    r'(\d{4})-(\d{2})-(\d{2})[T ](\d{2}):(\d{2}):(\d{2})(?:\.\d+)?(Z|[+-]\d{2}:?\d{2})?$')
+
+
+def iter_documents(text):
+    """
+    Summary:
+        Yields each top-level json value found in text
+    Args:
+        :text (str): one or more concatenated json documents
+    Returns:
+        generator of parsed json objects
+    """
+    decoder = json.JSONDecoder()
+    index, end = 0, len(text)
+    while True:
+        while index < end and text[index].isspace():
+            index += 1
+        if index >= end:
+            return
+        obj, index = decoder.raw_decode(text, index)
+        yield obj
+
+
+def parse_path(path):
+    """
+    Summary:
+        Splits a dotted path into key and list index segments
+    Returns:
+        segments: str (dict key), int (list index), or None (expand list) | TYPE: list
+    """
+    segments = []
+    for key, index in _segment.findall(path.lstrip('.')):
+        if key:
+            segments.append(key)
+        else:
+            segments.append(int(index) if index else None)
+    return segments
+
+
+def resolve(obj, segments):
+    """Returns value at segments within obj; None when any segment is absent"""
+    for segment in segments:
+        try:
+            obj = obj[segment]
+        except (KeyError, IndexError, TypeError):
+            return None
+    return obj
+
+
+def iter_rows(obj, segments):
+    """Yields each object found under a row root, expanding [] segments"""
+    if not segments:
+        yield obj
+        return
+    segment, remainder = segments[0], segments[1:]
+    if segment is None:
+        for item in obj if isinstance(obj, list) else []:
+            yield from iter_rows(item, remainder)
+    else:
+        child = resolve(obj, [segment])
+        if child is not None:
+            yield from iter_rows(child, remainder)
+
+
+def parse_timestamp(value):
+    """
+    Summary:
+        Parses an iso 8601 timestamp as returned by the ec2 api
+    Args:
+        :value (str): eg 2018-10-01T12:00:00.000Z
+    Returns:
+        timezone aware datetime (utc assumed if no offset), or None | TYPE: datetime
+    """
+    match = _timestamp.match(str(value))
+    if match is None:
+        return None
+    offset = match.group(7)
+    if offset in (None, 'Z'):
+        tz = datetime.timezone.utc
+    else:
+        sign = -1 if offset[0] == '-' else 1
+        tz = datetime.timezone(sign * datetime.timedelta(hours=int(offset[1:3]), minutes=int(offset[-2:])))
+    return datetime.datetime(*(int(x) for x in match.groups()[:6]), tzinfo=tz)
+
+
+def convert_time(seconds):
+    """Formats elapsed seconds as days, hours, minutes (std_functions convert_time)"""
+    minutes = max(int(seconds), 0) // 60
+    return '%dd,%dh,%dm' % (minutes // 1440, minutes // 60 % 24, minutes % 60)
+
+
+def runtime(value, now=None):
+    """Elapsed time since timestamp value, eg 3d,4h,12m"""
+    start = parse_timestamp(value)
+    if start is None:
+        return value
+    return convert_time((now or time.time()) - start.timestamp())
+
+
+def localdate(value, fmt='%Y-%m-%d'):
+    """Timestamp value in local time, as rendered by date -d <value> +fmt"""
+    dt = parse_timestamp(value)
+    return dt.astimezone().strftime(fmt) if dt else value
+
+
+# column formatter name: function(value) -> str
+FORMATTERS = {
+    'runtime': runtime,
+    'date': localdate,
+    'datetime': lambda x: localdate(x, '%Y-%m-%d.T%H:%M')
+}
+
+
+def parse_columns(columns):
+    """
+    Summary:
+        Parses column specifications
+    Args:
+        :columns (list): column paths, optionally suffixed with |formatter
+         and :width
+    Returns:
+        (segments, width, formatter) per column | TYPE: list
+    Raises:
+        ValueError if a formatter name is unknown
+    """
+    specs = []
+    for column in columns:
+        path, _, width = column.partition(':')
+        path, _, formatter = path.partition('|')
+        if formatter and formatter not in FORMATTERS:
+            raise ValueError('Unknown column formatter: %s' % formatter)
+        specs.append((parse_path(path), int(width) if width else None, FORMATTERS.get(formatter)))
+    return specs
+
+
+def format_value(value, width=None, delimiter=DELIMITER, null=NULL):
+    """Renders a json value as jq -r would, constrained to a single field"""
+    if value is None:
+        return null
+    if isinstance(value, bool):
+        value = 'true' if value else 'false'
+    elif isinstance(value, (dict, list)):
+        value = json.dumps(value, separators=(',', ':'))
+    else:
+        value = str(value)
+    value = value.replace('\n', ' ').replace(delimiter, ' ')
+    return value[:width] if width else value
+
+
+def project(documents, root, columns, delimiter=DELIMITER, null=NULL):
+    """
+    Summary:
+        Projects columns from each row of each document in one pass
+    Args:
+        :documents (iterable): parsed json documents
+        :root (str): path to rows, eg Reservations[].Instances[]
+        :columns (list): column paths relative to each row, eg LaunchTime|runtime
+        :delimiter (str): field separator
+        :null (str): representation of missing values
+    Returns:
+        generator of delimited row strings
+    """
+    root_segments = parse_path(root)
+    specs = parse_columns(columns)
+    for document in documents:
+        for row in iter_rows(document, root_segments):
+            values = []
+            for segments, width, formatter in specs:
+                value = resolve(row, segments)
+                if formatter and value is not None:
+                    value = formatter(value)
+                values.append(format_value(value, width, delimiter, null))
+            yield delimiter.join(values)
+
+
+def options(parser, help_menu=False):
+    """
+    Summary:
+        parse cli parameter options
+    Returns:
+        TYPE: argparse object, parser argument set
+    """
+    parser.add_argument("-r", "--root", nargs='?', required=True,
+                              help="path to rows, eg Reservations[].Instances[]")
+    parser.add_argument("-c", "--columns", nargs='?', required=True,
+                              help="comma delimited column paths, eg State.Name,LaunchTime|runtime,Tags[0].Value:17")
+    parser.add_argument("-D", "--delimiter", nargs='?', default=DELIMITER, required=False)
+    parser.add_argument("-n", "--null", nargs='?', default=NULL, required=False)
+    parser.add_argument("-s", "--stream", dest='stream', action='store_true', required=False,
+                              help="one json document per input line; rows flushed per document")
+    parser.add_argument("filename", nargs='?', default='-')
+    return parser.parse_args()
+
+
+def init():
+
+    parser = argparse.ArgumentParser(add_help=True, description="projection help:")
+
+    if len(sys.argv) == 1:
+        parser.print_help()
+        sys.exit(exit_codes['EX_OK']['Code'])
+
+    args = options(parser)
+
+    if args.stream:
+        try:
+            columns = args.columns.split(',')
+            for line in sys.stdin:
+                if line.strip():
+                    rows = project([json.loads(line)], args.root, columns, args.delimiter, args.null)
+                    sys.stdout.write(''.join(row + '\n' for row in rows))
+                    sys.stdout.flush()
+        except ValueError as e:
+            print('projection: %s' % str(e), file=sys.stderr)
+            return False
+        except BrokenPipeError:
+            pass
+        return True
+
+    try:
+        if args.filename == '-':
+            text = sys.stdin.read()
+        else:
+            with open(args.filename) as f1:
+                text = f1.read()
+        rows = project(iter_documents(text), args.root, args.columns.split(','), args.delimiter, args.null)
+        for row in rows:
+            sys.stdout.write(row + '\n')
+    except (OSError, ValueError) as e:
+        print('projection: %s' % str(e), file=sys.stderr)
+        return False
+    return True
+
+
+if __name__ == '__main__':
+    sys.exit(exit_codes['EX_OK']['Code'] if init() else exit_codes['EX_DATAERR']['Code'])
@@ -0,0 +1,424 @@
+"""
+Summary:
+    region_fetch (python3) | Concurrent multi-region describe-* fetch engine.
+
+    Queries every region in parallel using a bounded worker pool and merges
+    the per-region responses into a single normalized json document which the
+    ec2cli bash renderers read in place of concatenated awscli output.
+
+    Normalized document layout:
+
+        {
+            "<ResultKey>": [ ...merged items, each tagged with "Region"... ],
+            "Regions": {
+                "<region>": {"Count": int, "Elapsed": float, "Error": str|null}
+            },
+            "Elapsed": float
+        }
+
+    Resource Types Supported:
+
+        - enis, images, instances, secgroups, snapshots, subnets, volumes, vpcs
+
+    Filter expressions (see filters.py) are sent as describe-* Filters so
+    only matching resources are transferred; criteria the api cannot
+    evaluate are applied to each region's items before merging.
+
+    Streaming mode (--stream) writes one json document per api page to
+    stdout as pages arrive, bounded by --limit items, so renderers can show
+    the first rows of very large listings without waiting for the full
+    result.  Streamed pages bypass the response cache.
+
+    When the ec2clid daemon is running, requests are forwarded to it and
+    served from its pool of warm boto3 clients.
+
+    Clients are attached to the request scheduler (scheduler.py), which
+    paces api calls per account, region and api class and retries
+    throttled requests with jittered backoff.
+
+    Region responses are served from the local response cache while their
+    time to live is unexpired; boto3 is imported only when a region must be
+    queried, so fully cached listings return without loading the aws sdk.
+
+Author:
+    Blake Huber
+    Copyright Blake Huber, All Rights Reserved.
+
+License:
+    GNU General Public License v3.0 (GPL-3)
+    Additional terms may be found in the complete license agreement:
+    https://bitbucket.org/blakeca00/ec2cli/src/master/LICENSE.txt
+
+OS Support:
+    - RedHat Linux, Amazon Linux, Ubuntu & variants
+
+Dependencies:
+    - Requires python3, tested under py3.5 and py3.6
+"""
+
+import os
+import sys
+import json
+import time
+import datetime
+import argparse
+import inspect
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+# pkg
+import filters
+import response_cache
+from oscodes_unix import exit_codes
+import loggers
+from _version import __version__
+
+# globals
+logger = loggers.getLogger(__version__)
+MAX_WORKERS = 8
+CONNECT_TIMEOUT = 5         # seconds; bounds time lost to unreachable regions
+READ_TIMEOUT = 30           # seconds
+MAX_ATTEMPTS = 3
+STREAM_PAGE_SIZE = 1000     # items per api call when streaming (describe-* MaxResults)
+MIN_PAGE_SIZE = 5           # smallest MaxResults accepted by describe-* apis
+CLIENT_POOL = None          # warm clients, set when running inside ec2clid
+
+
+RESOURCES = {
+    'enis': {
+        'api': 'describe_network_interfaces',
+        'key': 'NetworkInterfaces',
+        'params': {}
+    },
+    'images': {
+        'api': 'describe_images',
+        'key': 'Images',
+        'params': {'Owners': ['self']}
+    },
+    'instances': {
+        'api': 'describe_instances',
+        'key': 'Reservations',
+        'params': {}
+    },
+    'secgroups': {
+        'api': 'describe_security_groups',
+        'key': 'SecurityGroups',
+        'params': {}
+    },
+    'snapshots': {
+        'api': 'describe_snapshots',
+        'key': 'Snapshots',
+        'params': {'OwnerIds': ['self']}
+    },
+    'subnets': {
+        'api': 'describe_subnets',
+        'key': 'Subnets',
+        'params': {}
+    },
+    'volumes': {
+        'api': 'describe_volumes',
+        'key': 'Volumes',
+        'params': {}
+    },
+    'vpcs': {
+        'api': 'describe_vpcs',
+        'key': 'Vpcs',
+        'params': {}
+    }
+}
+
+
+def json_default(obj):
+    """Serializes datetime objects returned by boto3 in iso8601 format"""
+    if isinstance(obj, (datetime.datetime, datetime.date)):
+        return obj.isoformat()
+    raise TypeError('Object of type %s is not json serializable' % type(obj).__name__)
+
+
+def read_regions(regions_file):
+    """
+    Summary:
+        Reads region codes from ec2cli regions.list config file
+    Args:
+        :regions_file (str): path to file containing 1 region code per line
+    Returns:
+        region codes | TYPE: list
+    """
+    with open(regions_file) as f1:
+        return [x.strip() for x in f1.readlines() if x.strip()]
+
+
+def client_config():
+    """
+    Returns botocore client configuration bounding time lost to slow regions;
+    retry mode is pinned so AWS_RETRY_MODE=adaptive in the environment does not
+    add botocore's client rate limiter alongside scheduler.py
+    """
+    from botocore.config import Config
+    return Config(
+            connect_timeout=CONNECT_TIMEOUT,
+            read_timeout=READ_TIMEOUT,
+            retries={'max_attempts': MAX_ATTEMPTS, 'mode': 'standard'}
+        )
+
+
+def ec2_client(region, profile=None):
+    """Returns a scheduled ec2 client for region; reused from the pool when running in ec2clid"""
+    if CLIENT_POOL is not None:
+        return CLIENT_POOL.client('ec2', region, profile)
+    import scheduler
+    from script_utils import boto3_session
+    return scheduler.attach(boto3_session(service='ec2', region=region, profile=profile, config=client_config()), profile)
+
+
+def fetch_region(resource, region, profile=None, cache=True, expressions=None, client=None):
+    """
+    Summary:
+        Retrieves all items of a resource type from a single region
+    Args:
+        :resource (str): key from RESOURCES (instances, volumes, etc)
+        :region (str): aws region code
+        :profile (str): profile_name of an iam user from local awscli config
+        :cache (bool): serve unexpired responses from the local cache
+        :expressions (list): filter expressions, eg ['state=running', 'tag:Env=prod']
+        :client (boto3 client): optional ec2 client to reuse
+    Returns:
+        items, elapsed seconds, error message or None | TYPE: tuple
+    Raises:
+        ValueError if a filter expression is invalid for resource
+    """
+    spec = RESOURCES[resource]
+    server, local = filters.split(resource, filters.parse(expressions or []))
+    params = dict(spec['params'], Filters=server) if server else spec['params']
+    start = time.time()
+    items = []
+
+    if cache:
+        cached = response_cache.get(resource, profile, region, spec['api'], params)
+        if cached is not None:
+            return filters.apply(resource, cached, local), round(time.time() - start, 3), None
+
+    # deferred; sdk import dominates startup when every region is cached
+    from botocore.exceptions import BotoCoreError, ClientError
+
+    try:
+        client = client or ec2_client(region, profile)
+        if client.can_paginate(spec['api']):
+            paginator = client.get_paginator(spec['api'])
+            for page in paginator.paginate(**params):
+                items.extend(page[spec['key']])
+        else:
+            items.extend(getattr(client, spec['api'])(**params)[spec['key']])
+
+    except ClientError as e:
+        # opted-out regions, missing permissions, scheduler retries exhausted
+        error = '%s: %s' % (e.response['Error']['Code'], e.response['Error']['Message'])
+        logger.warning('%s: region %s failed (%s)' % (inspect.stack()[0][3], region, error))
+        return [], round(time.time() - start, 3), error
+    except BotoCoreError as e:
+        logger.warning('%s: region %s failed (%s)' % (inspect.stack()[0][3], region, str(e)))
+        return [], round(time.time() - start, 3), str(e)
+
+    for item in items:
+        item['Region'] = region
+    items = json.loads(json.dumps(items, default=json_default))
+    response_cache.put(resource, profile, region, spec['api'], params, items)
+    return filters.apply(resource, items, local), round(time.time() - start, 3), None
+
+
+def iter_pages(resource, regions, profile=None, page_size=None, limit=None, expressions=None):
+    """
+    Summary:
+        Yields api pages as they arrive, regions queried in order
+    Args:
+        :resource (str): key from RESOURCES (instances, volumes, etc)
+        :regions (list): aws region codes
+        :profile (str): profile_name of an iam user from local awscli config
+        :page_size (int): items requested per api call; small when limit is small
+        :limit (int): stop after this many items in total
+        :expressions (list): filter expressions applied in every region
+    Returns:
+        generator of (region, items) tuples; items tagged with Region
+    Raises:
+        ValueError if a filter expression is invalid for resource
+    """
+    from botocore.exceptions import BotoCoreError, ClientError
+
+    spec = RESOURCES[resource]
+    server, local = filters.split(resource, filters.parse(expressions or []))
+    params = dict(spec['params'], Filters=server) if server else dict(spec['params'])
+    page_size = page_size or STREAM_PAGE_SIZE
+    if limit:
+        page_size = min(page_size, limit)
+    page_size = max(MIN_PAGE_SIZE, page_size)
+    pagination = {'PageSize': page_size}
+    remaining = limit
+
+    for region in regions:
+        try:
+            client = ec2_client(region, profile)
+            for page in client.get_paginator(spec['api']).paginate(PaginationConfig=pagination, **params):
+                items = filters.apply(resource, page[spec['key']], local)
+                if remaining is not None:
+                    items, remaining = items[:remaining], remaining - len(items[:remaining])
+                for item in items:
+                    item['Region'] = region
+                yield region, items
+                if remaining is not None and remaining <= 0:
+                    return
+        except (BotoCoreError, ClientError) as e:
+            logger.warning('%s: region %s failed (%s)' % (inspect.stack()[0][3], region, str(e)))
+
+
+def fetch_all(resource, regions, profile=None, workers=MAX_WORKERS, cache=True, expressions=None):
+    """
+    Summary:
+        Queries all regions concurrently, merging results into one document
+    Args:
+        :resource (str): key from RESOURCES (instances, volumes, etc)
+        :regions (list): aws region codes
+        :profile (str): profile_name of an iam user from local awscli config
+        :workers (int): maximum number of regions queried at the same time
+        :cache (bool): serve unexpired responses from the local cache
+        :expressions (list): filter expressions applied in every region
+    Returns:
+        normalized document | TYPE: dict
+    Raises:
+        ValueError if a filter expression is invalid for resource
+    """
+    key = RESOURCES[resource]['key']
+    start = time.time()
+    results = {}
+
+    # validate before any region is queried
+    filters.split(resource, filters.parse(expressions or []))
+
+    with ThreadPoolExecutor(max_workers=max(1, min(workers, len(regions)))) as executor:
+        futures = {
+            executor.submit(fetch_region, resource, region, profile, cache, expressions): region
+            for region in regions
+        }
+        for future in as_completed(futures):
+            results[futures[future]] = future.result()
+
+    document = {key: [], 'Regions': {}}
+
+    # merge in regions.list order so output is stable between runs
+    for region in regions:
+        items, elapsed, error = results[region]
+        document[key].extend(items)
+        document['Regions'][region] = {
+            'Count': len(items),
+            'Elapsed': elapsed,
+            'Error': error
+        }
+    document['Elapsed'] = round(time.time() - start, 3)
+    logger.info(
+        '%s: %s retrieved from %d regions in %s seconds' %
+        (inspect.stack()[0][3], resource, len(regions), document['Elapsed']))
+    return document
+
+
+def fetch(resource, regions, profile=None, workers=MAX_WORKERS, cache=True, expressions=None):
+    """
+    Summary:
+        fetch_all served by the ec2clid daemon when running, otherwise in process
+    Returns:
+        normalized document | TYPE: dict
+    Raises:
+        ValueError if a filter expression is invalid for resource
+    """
+    import ec2clid
+    document = ec2clid.describe(resource, regions, profile, cache, expressions)
+    if document is None:
+        document = fetch_all(resource, regions, profile, workers, cache, expressions)
+    return document
+
+
+def options(parser, help_menu=False):
+    """
+    Summary:
+        parse cli parameter options
+    Returns:
+        TYPE: argparse object, parser argument set
+    """
+    parser.add_argument("-p", "--profile", nargs='?', default="default",
+                              required=False, help="type (default: %(default)s)")
+    parser.add_argument("-t", "--type", nargs='?', required=True, choices=sorted(RESOURCES))
+    parser.add_argument("-r", "--regions", nargs='?', required=False,
+                              help="comma delimited list of region codes")
+    parser.add_argument("-f", "--regions-file", dest='regions_file', nargs='?', required=False)
+    parser.add_argument("-o", "--outfile", nargs='?', required=False)
+    parser.add_argument("-w", "--workers", type=int, default=MAX_WORKERS, required=False)
+    parser.add_argument("-n", "--no-cache", dest='no_cache', action='store_true', required=False,
+                              help="query aws even when an unexpired cached response exists")
+    parser.add_argument("-F", "--filter", dest='filters', action='append', default=[], required=False,
+                              help="filter expression, eg state=running (repeatable)")
+    parser.add_argument("-s", "--stream", dest='stream', action='store_true', required=False,
+                              help="write one json document per api page as pages arrive")
+    parser.add_argument("-l", "--limit", type=int, default=None, required=False)
+    parser.add_argument("-P", "--page-size", dest='page_size', type=int, default=None, required=False)
+    parser.add_argument("-d", "--debug", dest='debug', action='store_true', required=False)
+    return parser.parse_args()
+
+
+def init():
+
+    parser = argparse.ArgumentParser(add_help=True, description="region_fetch help:")
+
+    if len(sys.argv) == 1:
+        parser.print_help()
+        sys.exit(exit_codes['EX_OK']['Code'])
+
+    args = options(parser)
+
+    if args.regions:
+        regions = [x.strip() for x in args.regions.split(',') if x.strip()]
+    elif args.regions_file and os.path.exists(args.regions_file):
+        regions = read_regions(args.regions_file)
+    else:
+        print('region_fetch: You must provide --regions or a valid --regions-file', file=sys.stderr)
+        sys.exit(exit_codes['E_BADARG']['Code'])
+
+    if args.stream or args.limit or args.page_size:
+        key = RESOURCES[args.type]['key']
+        try:
+            for region, items in iter_pages(args.type, regions, args.profile, args.page_size,
+                                            args.limit, args.filters):
+                sys.stdout.write(json.dumps({key: items, 'Region': region}, default=json_default) + '\n')
+                sys.stdout.flush()
+        except ValueError as e:
+            print('region_fetch: %s' % str(e), file=sys.stderr)
+            sys.exit(exit_codes['E_BADARG']['Code'])
+        except BrokenPipeError:
+            # reader exited early, eg head
+            pass
+        return True
+
+    try:
+        document = fetch(
+                args.type, regions, profile=args.profile, workers=args.workers,
+                cache=not args.no_cache, expressions=args.filters
+            )
+    except ValueError as e:
+        print('region_fetch: %s' % str(e), file=sys.stderr)
+        sys.exit(exit_codes['E_BADARG']['Code'])
+
+    try:
+        if args.outfile:
+            with open(args.outfile, 'w') as out_file:
+                json.dump(document, out_file, default=json_default)
+        else:
+            json.dump(document, sys.stdout, default=json_default)
+    except OSError as e:
+        logger.exception('%s: Problem writing output (Code: %s)' % (inspect.stack()[0][3], str(e)))
+        return False
+
+    if args.debug:
+        for region, detail in document['Regions'].items():
+            print('%s\t%s\t%s\t%s' % (region, detail['Count'], detail['Elapsed'], detail['Error'] or '-'),
+                  file=sys.stderr)
+    return True
+
+
+if __name__ == '__main__':
+    sys.exit(exit_codes['EX_OK']['Code'] if init() else exit_codes['E_MISC']['Code'])
@@ -0,0 +1,282 @@
+"""
+Summary:
+    response_cache (python3) | Local cache of EC2 describe-* responses.
+
+    Entries are keyed by (profile, account, region, api, params) and expire
+    after a per-resource time to live read from the "cache" section of
+    config.json.  Total cache size is bounded; least recently written
+    entries are evicted first.  Commands which mutate resources invalidate
+    the affected resource types so subsequent listings reflect the change.
+
+    The lookup path imports neither boto3 nor botocore so a cache hit
+    returns in a few milliseconds.
+
+    Usage:
+
+        $ python3 response_cache.py invalidate --command create-snapshot
+        $ python3 response_cache.py invalidate --resource volumes
+        $ python3 response_cache.py clear
+        $ python3 response_cache.py stats
+
+Author:
+    Blake Huber
+    Copyright Blake Huber, All Rights Reserved.
+
+License:
+    GNU General Public License v3.0 (GPL-3)
+    Additional terms may be found in the complete license agreement:
+    https://bitbucket.org/blakeca00/ec2cli/src/master/LICENSE.txt
+
+OS Support:
+    - RedHat Linux, Amazon Linux, Ubuntu & variants
+
+Dependencies:
+    - Requires python3, tested under py3.5 and py3.6
+"""
+
+import os
+import re
+import sys
+import glob
+import json
+import time
+import hashlib
+import argparse
+import configparser
+
+# pkg
+from oscodes_unix import exit_codes
+
+
+CACHE_DIR = os.path.join(os.path.expanduser('~'), '.config', 'ec2cli', 'cache')
+CONFIG_FILE = os.path.join(os.path.dirname(os.path.realpath(__file__)), 'config.json')
+DEFAULT_TTL = 60                # seconds
+DEFAULT_MAX_SIZE_MB = 64
+
+# resource types whose cached responses are stale after each mutating command
+INVALIDATES = {
+    'attach-volume': ['volumes', 'instances'],
+    'create-image': ['images', 'snapshots'],
+    'create-snapshot': ['snapshots'],
+    'create-tags': ['enis', 'images', 'instances', 'secgroups', 'snapshots', 'subnets', 'volumes', 'vpcs'],
+    'start-instances': ['instances']
+}
+_account = re.compile(r'arn:aws[\w-]*:iam::(\d{12}):')
+
+
+def read_config(config_file=CONFIG_FILE):
+    """
+    Summary:
+        Reads cache section of ec2cli config.json
+    Returns:
+        cache configuration | TYPE: dict
+    """
+    try:
+        with open(config_file) as f1:
+            config = json.load(f1).get('cache', {})
+    except (OSError, ValueError):
+        config = {}
+    return {
+        'ENABLED': str(config.get('ENABLED', 'true')).lower() == 'true',
+        'MAX_SIZE_MB': int(config.get('MAX_SIZE_MB', DEFAULT_MAX_SIZE_MB)),
+        'TTL': {k: int(v) for k, v in config.get('TTL', {}).items()}
+    }
+
+
+def account_id(profile=None):
+    """
+    Summary:
+        Resolves an account discriminator for profile from local awscli files
+        without network access: the account of an assumed role, otherwise
+        the access key id (unique per iam user)
+    Args:
+        :profile (str): profile_name of an iam user from local awscli config
+    Returns:
+        account id, access key id, or None | TYPE: str
+    """
+    profile = profile or os.environ.get('AWS_PROFILE', 'default')
+    home = os.path.expanduser('~')
+    config = configparser.RawConfigParser()
+    config.read([
+        os.environ.get('AWS_CONFIG_FILE', os.path.join(home, '.aws', 'config')),
+        os.environ.get('AWS_SHARED_CREDENTIALS_FILE', os.path.join(home, '.aws', 'credentials'))
+    ])
+    for section in ('profile ' + profile, profile):
+        if config.has_section(section):
+            match = _account.search(config.get(section, 'role_arn', fallback=''))
+            if match:
+                return match.group(1)
+            if config.has_option(section, 'aws_access_key_id'):
+                return config.get(section, 'aws_access_key_id')
+    return os.environ.get('AWS_ACCESS_KEY_ID')
+
+
+def cache_key(profile, account, region, api, params):
+    """Returns digest uniquely identifying a describe-* request"""
+    request = json.dumps([profile, account, region, api, params], sort_keys=True, default=str)
+    return hashlib.sha256(request.encode('utf-8')).hexdigest()
+
+
+def _entry_path(resource, key, cache_dir=CACHE_DIR):
+    """Entries are prefixed by resource type so invalidation is a glob"""
+    return os.path.join(cache_dir, '%s-%s.json' % (resource, key))
+
+
+def get(resource, profile, region, api, params, account=None, config=None, cache_dir=CACHE_DIR):
+    """
+    Summary:
+        Returns cached response items if present and unexpired
+    Args:
+        :resource (str): resource type (instances, volumes, etc)
+        :profile (str): profile_name of an iam user from local awscli config
+        :region (str): aws region code
+        :api (str): boto3 client method name
+        :params (dict): request parameters
+        :account (str): account discriminator; resolved from profile if omitted
+    Returns:
+        cached items or None | TYPE: list
+    """
+    config = config or read_config()
+    ttl = config['TTL'].get(resource, DEFAULT_TTL)
+
+    if not config['ENABLED'] or ttl <= 0:
+        return None
+
+    path = _entry_path(resource, cache_key(profile, account or account_id(profile), region, api, params), cache_dir)
+    try:
+        if time.time() - os.path.getmtime(path) > ttl:
+            return None
+        with open(path) as f1:
+            return json.load(f1)['Data']
+    except (OSError, ValueError, KeyError):
+        return None
+
+
+def put(resource, profile, region, api, params, data, account=None, config=None, cache_dir=CACHE_DIR):
+    """
+    Summary:
+        Stores response items, then evicts entries beyond the size bound
+    Returns:
+        Success | Failure, TYPE: bool
+    """
+    config = config or read_config()
+    if not config['ENABLED'] or config['TTL'].get(resource, DEFAULT_TTL) <= 0:
+        return False
+
+    account = account or account_id(profile)
+    path = _entry_path(resource, cache_key(profile, account, region, api, params), cache_dir)
+    tmp = '%s.%d.tmp' % (path, os.getpid())
+    entry = {
+        'Resource': resource,
+        'Profile': profile,
+        'Region': region,
+        'Api': api,
+        'Created': time.time(),
+        'Data': data
+    }
+    try:
+        os.makedirs(cache_dir, mode=0o700, exist_ok=True)
+        with open(tmp, 'w') as f1:
+            json.dump(entry, f1, default=str)
+        os.replace(tmp, path)
+    except OSError:
+        return False
+    evict(config['MAX_SIZE_MB'] * 1024 * 1024, cache_dir)
+    return True
+
+
+def evict(max_bytes, cache_dir=CACHE_DIR):
+    """
+    Summary:
+        Removes oldest entries until total cache size is within max_bytes
+    Returns:
+        number of entries removed | TYPE: int
+    """
+    entries = []
+    for path in glob.glob(os.path.join(cache_dir, '*.json')):
+        try:
+            stat = os.stat(path)
+            entries.append((stat.st_mtime, stat.st_size, path))
+        except OSError:
+            continue
+
+    total, removed = sum(x[1] for x in entries), 0
+    for mtime, size, path in sorted(entries):
+        if total <= max_bytes:
+            break
+        try:
+            os.remove(path)
+            total -= size
+            removed += 1
+        except OSError:
+            continue
+    return removed
+
+
+def invalidate(resources=None, command=None, cache_dir=CACHE_DIR):
+    """
+    Summary:
+        Removes cached entries for resource types, or those affected by a command
+    Args:
+        :resources (list): resource types (instances, volumes, etc); all if omitted
+        :command (str): mutating awscli command (create-snapshot, etc)
+    Returns:
+        number of entries removed | TYPE: int
+    """
+    if command:
+        resources = INVALIDATES.get(command, [])
+    patterns = ['%s-*.json' % x for x in resources] if resources is not None else ['*.json']
+
+    removed = 0
+    for pattern in patterns:
+        for path in glob.glob(os.path.join(cache_dir, pattern)):
+            try:
+                os.remove(path)
+                removed += 1
+            except OSError:
+                continue
+    return removed
+
+
+def options(parser, help_menu=False):
+    """
+    Summary:
+        parse cli parameter options
+    Returns:
+        TYPE: argparse object, parser argument set
+    """
+    parser.add_argument("operation", nargs='?', choices=['invalidate', 'clear', 'stats'])
+    parser.add_argument("-c", "--command", nargs='?', default=None, required=False,
+                              choices=sorted(INVALIDATES))
+    parser.add_argument("-r", "--resource", nargs='?', default=None, required=False)
+    return parser.parse_args()
+
+
+def init():
+
+    parser = argparse.ArgumentParser(add_help=True, description="response_cache help:")
+
+    if len(sys.argv) == 1:
+        parser.print_help()
+        sys.exit(exit_codes['EX_OK']['Code'])
+
+    args = options(parser)
+
+    if args.operation == 'invalidate':
+        if not (args.command or args.resource):
+            print('response_cache: invalidate requires --command or --resource', file=sys.stderr)
+            return False
+        invalidate(resources=[args.resource] if args.resource else None, command=args.command)
+
+    elif args.operation == 'clear':
+        invalidate()
+
+    elif args.operation == 'stats':
+        paths = glob.glob(os.path.join(CACHE_DIR, '*.json'))
+        size = sum(os.path.getsize(x) for x in paths if os.path.exists(x))
+        print('entries: %d\nbytes: %d\nlocation: %s' % (len(paths), size, CACHE_DIR))
+    return True
+
+
+if __name__ == '__main__':
+    sys.exit(exit_codes['EX_OK']['Code'] if init() else exit_codes['E_MISC']['Code'])
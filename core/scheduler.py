@@ -0,0 +1,393 @@
+"""
+Summary:
+    scheduler (python3) | Rate-limit-aware scheduling of ec2 api requests.
+
+    Every boto3 client created by ec2cli is attached to a process-wide
+    scheduler which paces requests per (account, region, api class) key:
+
+        - a token bucket per key, sized to the ec2 request rate limits of
+          the api class (describe or mutate), spaces request starts
+        - an AIMD limit per key bounds requests in flight; it grows by one
+          request per window of successful requests and is halved when ec2
+          answers RequestLimitExceeded
+        - throttled and transient failures are retried with full jitter
+          exponential backoff in place of botocore's fixed retry policy
+
+    Request, retry and throttle counts are accumulated in a stats file when
+    each process exits so aggregate throughput can be tuned with the rates
+    in the scheduler section of config.json.
+
+    Usage:
+
+        $ python3 scheduler.py stats
+        $ python3 scheduler.py stats --format json
+        $ python3 scheduler.py reset
+
+Author:
+    Blake Huber
+    Copyright Blake Huber, All Rights Reserved.
+
+License:
+    GNU General Public License v3.0 (GPL-3)
+    Additional terms may be found in the complete license agreement:
+    https://bitbucket.org/blakeca00/ec2cli/src/master/LICENSE.txt
+
+OS Support:
+    - RedHat Linux, Amazon Linux, Ubuntu & variants
+
+Dependencies:
+    - Requires python3, tested under py3.5 and py3.6
+"""
+
+import os
+import sys
+import json
+import time
+import fcntl
+import atexit
+import random
+import argparse
+import threading
+
+# pkg
+from response_cache import CONFIG_FILE
+from oscodes_unix import exit_codes
+import loggers
+from _version import __version__
+
+# globals
+logger = loggers.getLogger(__version__)
+STATS_PATH = os.path.join(os.path.expanduser('~'), '.config', 'ec2cli', 'scheduler-stats.json')
+MAX_RETRIES = 5             # throttled requests
+MAX_ERROR_RETRIES = 3       # transient errors; bounds time lost to unreachable regions
+BASE_BACKOFF = 0.25         # seconds
+MAX_BACKOFF = 20            # seconds
+MIN_CONCURRENCY = 1
+MAX_CONCURRENCY = 32
+
+# api class: requests per second, bucket size, initial requests in flight
+RATES = {
+    'describe': {'RATE': 20, 'BURST': 100, 'CONCURRENCY': 8},
+    'mutate': {'RATE': 5, 'BURST': 50, 'CONCURRENCY': 4}
+}
+THROTTLE_CODES = {
+    'RequestLimitExceeded', 'Throttling', 'ThrottlingException', 'TooManyRequestsException',
+    'SnapshotCreationPerVolumeRateExceeded'
+}
+TRANSIENT_CODES = {'InternalError', 'InternalFailure', 'ServiceUnavailable', 'Unavailable', 'RequestTimeout'}
+
+
+def read_config(config_file=CONFIG_FILE):
+    """
+    Summary:
+        Reads scheduler section of ec2cli config.json
+    Returns:
+        scheduler configuration | TYPE: dict
+    """
+    try:
+        with open(config_file) as f1:
+            config = json.load(f1).get('scheduler', {})
+    except (OSError, ValueError):
+        config = {}
+    rates = config.get('RATES', {})
+    return {
+        'ENABLED': str(config.get('ENABLED', 'true')).lower() == 'true',
+        'RATES': {
+            k: {x: float(rates.get(k, {}).get(x, v[x])) for x in v} for k, v in RATES.items()
+        }
+    }
+
+
+def api_class(operation):
+    """describe for read-only operations (Describe*, Get*, List*), otherwise mutate"""
+    return 'describe' if operation.startswith(('Describe', 'Get', 'List')) else 'mutate'
+
+
+class TokenBucket():
+    """Holds up to burst tokens, refilled at rate per second"""
+    def __init__(self, rate, burst):
+        self.rate, self.burst = rate, burst
+        self.tokens = burst
+        self.stamp = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        """Takes one token, blocking until one is available; returns seconds waited"""
+        waited = 0
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.burst, self.tokens + (now - self.stamp) * self.rate)
+                self.stamp = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return waited
+                delay = (1 - self.tokens) / self.rate
+            time.sleep(delay)
+            waited += delay
+
+    def drain(self):
+        """Empties the bucket; ec2 is throttling this key"""
+        with self.lock:
+            self.tokens = 0
+            self.stamp = time.monotonic()
+
+
+class Limiter():
+    """
+    AIMD bound on requests in flight: +1 per limit successes, halved on
+    throttle at most once per cooldown so a burst of throttled responses to
+    requests already in flight counts as a single congestion signal
+    """
+    cooldown = 1.0      # seconds
+
+    def __init__(self, limit):
+        self.limit = float(limit)
+        self.inflight = 0
+        self.decreased = 0
+        self.cond = threading.Condition()
+
+    def acquire(self):
+        with self.cond:
+            while self.inflight >= int(self.limit):
+                self.cond.wait()
+            self.inflight += 1
+
+    def release(self, throttled=False):
+        with self.cond:
+            self.inflight -= 1
+            now = time.monotonic()
+            if throttled:
+                if now - self.decreased > self.cooldown:
+                    self.limit = max(MIN_CONCURRENCY, self.limit / 2)
+                    self.decreased = now
+            else:
+                self.limit = min(MAX_CONCURRENCY, self.limit + 1 / self.limit)
+            self.cond.notify_all()
+
+
+class Scheduler():
+    """
+    Token bucket, concurrency limit and counters per (account, region,
+    api class).  Attached to clients through botocore events, so paginated
+    calls and every retry attempt are scheduled
+    """
+    def __init__(self, config=None):
+        self.config = config or read_config()
+        self.lock = threading.Lock()
+        self.keys = {}
+
+    def state(self, key):
+        with self.lock:
+            if key not in self.keys:
+                rates = self.config['RATES'][key[2]]
+                self.keys[key] = {
+                    'bucket': TokenBucket(rates['RATE'], rates['BURST']),
+                    'limiter': Limiter(rates['CONCURRENCY']),
+                    'stats': {
+                        'Requests': 0, 'Retries': 0, 'Throttles': 0, 'Errors': 0,
+                        'Waited': 0.0, 'First': time.time(), 'Last': time.time()
+                    }
+                }
+            return self.keys[key]
+
+    def attach(self, client, account):
+        """
+        Summary:
+            Schedules every request of an ec2 client; botocore's retry handler
+            is replaced by retry()
+        Args:
+            :client (boto3 client): ec2 client
+            :account (str): aws account number (or profile name when unknown)
+        Returns:
+            client | TYPE: boto3 client
+        """
+        if not self.config['ENABLED']:
+            return client
+        region = client.meta.region_name
+        events = client.meta.events
+
+        def key(operation):
+            return (account, region, api_class(operation))
+
+        def before_send(event_name=None, **kwargs):
+            state = self.state(key(event_name.rsplit('.', 1)[-1]))
+            waited = state['bucket'].acquire()
+            state['limiter'].acquire()
+            with self.lock:
+                state['stats']['Requests'] += 1
+                state['stats']['Waited'] += waited
+
+        def needs_retry(response=None, attempts=1, caught_exception=None, operation=None, **kwargs):
+            return self.retry(key(operation.name), response, attempts, caught_exception)
+
+        events.unregister('needs-retry.ec2', unique_id='retry-config-ec2')
+        events.register('before-send.ec2', before_send, unique_id='scheduler-before-send')
+        events.register_first('needs-retry.ec2', needs_retry, unique_id='scheduler-needs-retry')
+        return client
+
+    def retry(self, key, response, attempts, caught_exception):
+        """
+        Summary:
+            Records the outcome of one attempt and decides whether to retry
+        Returns:
+            seconds to sleep before retrying, or None | TYPE: float or None
+        """
+        code, status = None, 0
+        if response is not None:
+            status = response[0].status_code
+            code = response[1].get('Error', {}).get('Code')
+        throttled = code in THROTTLE_CODES
+        transient = caught_exception is not None or code in TRANSIENT_CODES or status >= 500
+
+        retry = attempts <= (MAX_RETRIES if throttled else MAX_ERROR_RETRIES) and (throttled or transient)
+
+        state = self.state(key)
+        state['limiter'].release(throttled)
+        if throttled:
+            state['bucket'].drain()
+        with self.lock:
+            stats = state['stats']
+            stats['Last'] = time.time()
+            stats['Throttles'] += throttled
+            stats['Errors'] += transient and not throttled
+            stats['Retries'] += retry
+
+        if not retry:
+            if throttled:
+                logger.warning('scheduler: %s %s %s throttled after %d attempts' % (key + (attempts,)))
+            return None
+        # full jitter
+        return random.uniform(0, min(MAX_BACKOFF, BASE_BACKOFF * 2 ** attempts))
+
+    def stats(self):
+        """
+        Summary:
+            Counters per key with the current concurrency limit and request rate
+        Returns:
+            TYPE: list of dict
+        """
+        records = []
+        with self.lock:
+            for (account, region, cls), state in sorted(self.keys.items()):
+                stats = dict(state['stats'])
+                stats.update({
+                    'Account': account, 'Region': region, 'Class': cls,
+                    'Concurrency': round(state['limiter'].limit, 1)
+                })
+                records.append(stats)
+        return records
+
+    def save(self, path=STATS_PATH):
+        """Accumulates this process's counters into the stats file"""
+        records = [x for x in self.stats() if x['Requests']]
+        if not records:
+            return
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path + '.lock', 'w') as lock:
+                fcntl.flock(lock, fcntl.LOCK_EX)
+                totals = load(path)
+                for x in records:
+                    entry = totals.setdefault('%s %s %s' % (x['Account'], x['Region'], x['Class']), {
+                        'Requests': 0, 'Retries': 0, 'Throttles': 0, 'Errors': 0, 'Waited': 0.0, 'Seconds': 0.0
+                    })
+                    for field in ('Requests', 'Retries', 'Throttles', 'Errors', 'Waited'):
+                        entry[field] += x[field]
+                    entry['Seconds'] += max(x['Last'] - x['First'], 0.001)
+                    entry['Concurrency'] = x['Concurrency']
+                    entry['Updated'] = int(x['Last'])
+                tmp = '%s.%d.tmp' % (path, os.getpid())
+                with open(tmp, 'w') as f1:
+                    json.dump(totals, f1, indent=4)
+                os.replace(tmp, path)
+        except OSError as e:
+            logger.warning('scheduler: unable to save stats (%s)' % str(e))
+
+
+def load(path=STATS_PATH):
+    try:
+        with open(path) as f1:
+            return json.load(f1)
+    except (OSError, ValueError):
+        return {}
+
+
+SCHEDULER = Scheduler()
+atexit.register(SCHEDULER.save)
+
+
+def attach(client, profile=None, account=None):
+    """
+    Summary:
+        Attaches client to the process scheduler.  Without an account number
+        the cached identity of profile is used, falling back to the profile
+        name so no request is made to resolve it
+    Returns:
+        client | TYPE: boto3 client
+    """
+    if account is None:
+        import identity
+        entry = identity.cached(profile or os.environ.get('AWS_PROFILE', 'default'))
+        account = entry['Account'] if entry else (profile or 'default')
+    return SCHEDULER.attach(client, account)
+
+
+def report(totals):
+    """
+    Summary:
+        Rows for the stats table, busiest keys first
+    Returns:
+        TYPE: list
+    """
+    rows = []
+    for key, x in sorted(totals.items(), key=lambda kv: -kv[1]['Requests']):
+        rows.append(key.split(' ') + [
+            str(x['Requests']), str(x['Retries']), str(x['Throttles']),
+            '%.1f' % (x['Throttles'] * 100.0 / x['Requests'] if x['Requests'] else 0),
+            '%.2f' % (x['Requests'] / x['Seconds'] if x['Seconds'] else 0),
+            str(x.get('Concurrency', ''))
+        ])
+    return rows
+
+
+def options(parser, help_menu=False):
+    """
+    Summary:
+        parse cli parameter options
+    Returns:
+        TYPE: argparse object, parser argument set
+    """
+    parser.add_argument("operation", nargs='?', default='stats', choices=['stats', 'reset'])
+    parser.add_argument("-F", "--format", nargs='?', default='table', choices=['table', 'json'])
+    parser.add_argument("--frame", nargs='?', default='', required=False)
+    parser.add_argument("--text", nargs='?', default='', required=False)
+    return parser.parse_args()
+
+
+def init():
+
+    parser = argparse.ArgumentParser(add_help=True, description="scheduler help:")
+    args = options(parser)
+
+    if args.operation == 'reset':
+        try:
+            os.remove(STATS_PATH)
+        except OSError:
+            pass
+        return True
+
+    totals = load()
+    if args.format == 'json':
+        print(json.dumps(totals, indent=4))
+    elif totals:
+        from table import parse_columns, render
+        columns = 'Account:14,Region:15,Class:9,Requests:9,Retries:8,Throttles:10,Throttled%:11,Req/s:8,Limit:6'
+        print('\n'.join(render(report(totals), parse_columns(columns.split(',')), args.frame, args.text)))
+    else:
+        print('scheduler: no requests recorded', file=sys.stderr)
+    return True
+
+
+if __name__ == '__main__':
+    sys.exit(exit_codes['EX_OK']['Code'] if init() else exit_codes['E_MISC']['Code'])
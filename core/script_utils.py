@@ -27,9 +27,10 @@ from pygments import highlight, lexers, formatters
 
 # aws
 import boto3
-from botocore.exceptions import ClientError
+from botocore.exceptions import ClientError, ProfileNotFound
 
 # project
+import identity
 from colors import Colors
 from oscodes_unix import exit_codes
 from _version import __version__
@@ -66,25 +67,26 @@ def bool_assignment(arg, patterns=None):
         raise e
 
 
-def boto3_session(service, region, profile=None):
+def boto3_session(service, region, profile=None, config=None):
     """
     Summary:
         Establishes boto3 sessions, client
     Args:
         :service (str): boto3 service abbreviation ('ec2', 's3', etc)
         :profile (str): profile_name of an iam user from local awscli config
+        :config (botocore.config.Config): optional client timeouts, retries
     Returns:
         TYPE: boto3 client object
     """
     try:
         if profile:
             if profile == 'default':
-                client = boto3.client(service, region_name=region)
+                client = boto3.client(service, region_name=region, config=config)
             else:
                 session = boto3.Session(profile_name=profile)
-                client = session.client(service, region_name=region)
+                client = session.client(service, region_name=region, config=config)
         else:
-            client = boto3.client(service, region_name=region)
+            client = boto3.client(service, region_name=region, config=config)
     except ClientError as e:
         logger.exception(
             "%s: IAM user or role not found (Code: %s Message: %s)" %
@@ -187,8 +189,9 @@ def debug_mode(header, data_object, debug=False, halt=False):
 def get_account_info(profile=None):
     """
     Summary:
-        Queries AWS iam and sts services to discover account id information
-        in the form of account name and account alias (if assigned)
+        Discovers account id information in the form of account number and
+        account alias (if assigned) from the per-profile identity cache;
+        iam and sts are queried only when the cached identity is invalid
 
     Returns:
         TYPE: tuple
@@ -200,29 +203,15 @@ def get_account_info(profile=None):
     103562488773 tooling-prod
 
     """
-    if profile:
-        session = boto3.Session(profile_name=profile)
-        sts_client = session.client('sts')
-        iam_client = session.client('iam')
-    else:
-        sts_client = boto3.client('sts')
-        iam_client = boto3.client('iam')
-
     try:
-        number = sts_client.get_caller_identity()['Account']
-        name = iam_client.list_account_aliases()['AccountAliases'][0]
+        entry = identity.get(profile)
+    except identity.IdentityError as e:
+        logger.warning("%s: problem retrieving caller identity (%s)" % (inspect.stack()[0][3], str(e)))
+        raise
+    if not entry['Alias']:
+        logger.info('No account alias defined. account_name set to %s' % identity.NO_ALIAS)
+    return (entry['Account'], entry['Alias'] or identity.NO_ALIAS)
 
-    except IndexError as e:
-        name = '<no_alias_assigned>'
-        logger.info('Error: %s. No account alias defined. account_name set to %s' % (e, name))
-        return (number, name)
-    except ClientError as e:
-        logger.warning(
-            "%s: problem retrieving caller identity (Code: %s Message: %s)" %
-            (inspect.stack()[0][3], e.response['Error']['Code'], e.response['Error']['Message'])
-            )
-        raise e
-    return (number, name)
 
 
 def get_os(detailed=False):
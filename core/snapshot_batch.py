@@ -0,0 +1,278 @@
+"""
+Summary:
+    snapshot_batch (python3) | Snapshots many EBS volumes at once.
+
+    Volumes are selected by id, by tag, or by the instance they are attached
+    to with a single describe-volumes call; snapshot descriptions are built
+    from that response (date, Name tag).  create-snapshot requests are
+    submitted concurrently under a rate limit, then every snapshot is
+    followed with one batched describe-snapshots call per poll interval
+    while aggregate progress is reported.
+
+    Usage:
+
+        $ python3 snapshot_batch.py --region us-east-1 --volumes vol-0a1b,vol-2c3d
+        $ python3 snapshot_batch.py --region us-east-1 --tag Environment=prod --rate 2
+        $ python3 snapshot_batch.py --region us-east-1 --instance i-0a1b2c3d --no-wait
+
+Author:
+    Blake Huber
+    Copyright Blake Huber, All Rights Reserved.
+
+License:
+    GNU General Public License v3.0 (GPL-3)
+    Additional terms may be found in the complete license agreement:
+    https://bitbucket.org/blakeca00/ec2cli/src/master/LICENSE.txt
+
+OS Support:
+    - RedHat Linux, Amazon Linux, Ubuntu & variants
+
+Dependencies:
+    - Requires python3, tested under py3.5 and py3.6
+"""
+
+import sys
+import json
+import time
+import datetime
+import argparse
+import inspect
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+# pkg
+import response_cache
+from region_fetch import MAX_WORKERS, ec2_client
+from oscodes_unix import exit_codes
+import loggers
+from _version import __version__
+
+# globals
+logger = loggers.getLogger(__version__)
+RATE = 5                    # create-snapshot requests per second
+POLL_INTERVAL = 15          # seconds between progress polls
+MAX_FILTER_VALUES = 200     # describe-snapshots limit on values per filter
+COLUMNS = 'VolumeId:22,SnapshotId:23,Size:5,State:10,Prog:5,Description:40.39'
+
+
+class RateLimiter():
+    """Spaces calls at least 1/rate seconds apart across threads"""
+    def __init__(self, rate):
+        self.interval = 1.0 / rate if rate else 0
+        self.lock = threading.Lock()
+        self.next = time.time()
+
+    def wait(self):
+        with self.lock:
+            now = time.time()
+            delay, self.next = self.next - now, max(self.next, now) + self.interval
+        if delay > 0:
+            time.sleep(delay)
+
+
+def select_volumes(client, volume_ids=None, tags=None, instance=None):
+    """
+    Summary:
+        Resolves volume selectors with a single (paginated) describe-volumes
+    Args:
+        :volume_ids (list): volume ids
+        :tags (list): Key=Value selectors, all must match
+        :instance (str): instance id; all attached volumes
+    Returns:
+        describe-volumes items | TYPE: list
+    """
+    params = {'Filters': []}
+    if volume_ids:
+        params['VolumeIds'] = volume_ids
+    for tag in tags or []:
+        key, _, value = tag.partition('=')
+        params['Filters'].append({'Name': 'tag:' + key, 'Values': [value or '*']})
+    if instance:
+        params['Filters'].append({'Name': 'attachment.instance-id', 'Values': [instance]})
+    if not params['Filters']:
+        del params['Filters']
+
+    volumes = []
+    for page in client.get_paginator('describe_volumes').paginate(**params):
+        volumes.extend(page['Volumes'])
+    return volumes
+
+
+def description(volume, now=None):
+    """date, Name tag (first tag when unnamed), as ec2cli_create_snapshot"""
+    tags = volume.get('Tags') or []
+    name = next((x['Value'] for x in tags if x['Key'] == 'Name'), tags[0]['Value'] if tags else '')
+    return '%s, %s' % ((now or datetime.datetime.now()).strftime('%Y-%m-%d.T%H:%M'), name)
+
+
+def submit(client, volumes, rate=RATE, workers=MAX_WORKERS):
+    """
+    Summary:
+        Creates a snapshot of each volume concurrently, at most rate per second
+    Returns:
+        snapshots created, volume_id: error for failures | TYPE: tuple (list, dict)
+    """
+    from botocore.exceptions import BotoCoreError, ClientError
+
+    limiter, now = RateLimiter(rate), datetime.datetime.now()
+    created, failed = [], {}
+
+    def create(volume):
+        limiter.wait()
+        params = {'VolumeId': volume['VolumeId'], 'Description': description(volume, now)}
+        names = [x for x in volume.get('Tags') or [] if x['Key'] == 'Name']
+        if names:
+            params['TagSpecifications'] = [{'ResourceType': 'snapshot', 'Tags': names}]
+        return client.create_snapshot(**params)
+
+    with ThreadPoolExecutor(max_workers=max(1, min(workers, len(volumes)))) as executor:
+        futures = {executor.submit(create, x): x['VolumeId'] for x in volumes}
+        for future in as_completed(futures):
+            try:
+                snapshot = future.result()
+                snapshot.pop('ResponseMetadata', None)
+                created.append(snapshot)
+            except ClientError as e:
+                failed[futures[future]] = '%s: %s' % (e.response['Error']['Code'], e.response['Error']['Message'])
+            except BotoCoreError as e:
+                failed[futures[future]] = str(e)
+
+    for volume_id, error in failed.items():
+        logger.warning('%s: snapshot of %s failed (%s)' % (inspect.stack()[0][3], volume_id, error))
+    if created:
+        response_cache.invalidate(command='create-snapshot')
+    return created, failed
+
+
+def poll(client, snapshot_ids):
+    """
+    Summary:
+        Current state of snapshots, one describe-snapshots call per 200 ids
+    Returns:
+        snapshot_id: describe-snapshots item | TYPE: dict
+    """
+    snapshots = {}
+    for i in range(0, len(snapshot_ids), MAX_FILTER_VALUES):
+        chunk = snapshot_ids[i:i + MAX_FILTER_VALUES]
+        paginator = client.get_paginator('describe_snapshots')
+        for page in paginator.paginate(OwnerIds=['self'], Filters=[{'Name': 'snapshot-id', 'Values': chunk}]):
+            snapshots.update((x['SnapshotId'], x) for x in page['Snapshots'])
+    return snapshots
+
+
+def progress(snapshots):
+    """
+    Summary:
+        Aggregate progress weighted by volume size
+    Returns:
+        completed, errored, percent complete | TYPE: tuple
+    """
+    done = sum(1 for x in snapshots if x['State'] == 'completed')
+    errors = sum(1 for x in snapshots if x['State'] == 'error')
+    size = sum(x.get('VolumeSize', 0) for x in snapshots) or 1
+    percent = sum(int(str(x.get('Progress') or '0').rstrip('%') or 0) * x.get('VolumeSize', 0)
+                  for x in snapshots) / size
+    return done, errors, round(percent, 1)
+
+
+def follow(client, created, interval=POLL_INTERVAL, timeout=None, out=sys.stderr):
+    """
+    Summary:
+        Polls until every snapshot is completed or errored, or timeout
+    Returns:
+        latest state of each snapshot | TYPE: list
+    """
+    ids = [x['SnapshotId'] for x in created]
+    state = {x['SnapshotId']: x for x in created}
+    start = time.time()
+    while True:
+        state.update(poll(client, ids))
+        done, errors, percent = progress(list(state.values()))
+        line = '%d/%d snapshots completed, %d failed, %s%% of %d GiB' % (
+            done, len(ids), errors, percent, sum(x.get('VolumeSize', 0) for x in state.values()))
+        if out.isatty():
+            out.write('\r  ' + line + ' ' * 8)
+        else:
+            out.write('  ' + line + '\n')
+        out.flush()
+        if done + errors == len(ids) or (timeout and time.time() - start > timeout):
+            break
+        time.sleep(interval)
+    if out.isatty():
+        out.write('\n')
+    return [state[x] for x in ids]
+
+
+def options(parser, help_menu=False):
+    """
+    Summary:
+        parse cli parameter options
+    Returns:
+        TYPE: argparse object, parser argument set
+    """
+    parser.add_argument("-p", "--profile", nargs='?', default="default", required=False)
+    parser.add_argument("-r", "--region", nargs='?', required=True)
+    parser.add_argument("-v", "--volumes", nargs='?', default=None, required=False,
+                              help="comma delimited volume ids")
+    parser.add_argument("-t", "--tag", dest='tags', action='append', default=[], required=False,
+                              help="Key=Value volume tag selector (repeatable)")
+    parser.add_argument("-i", "--instance", nargs='?', default=None, required=False,
+                              help="snapshot all volumes attached to instance")
+    parser.add_argument("-R", "--rate", type=float, default=RATE, required=False,
+                              help="create-snapshot requests per second (default: %(default)s)")
+    parser.add_argument("-n", "--no-wait", dest='no_wait', action='store_true', required=False)
+    parser.add_argument("-T", "--timeout", type=int, default=None, required=False,
+                              help="seconds to follow progress")
+    parser.add_argument("-F", "--format", nargs='?', default='table', choices=['table', 'json'])
+    parser.add_argument("--frame", nargs='?', default='', required=False)
+    parser.add_argument("--text", nargs='?', default='', required=False)
+    return parser.parse_args()
+
+
+def init():
+
+    parser = argparse.ArgumentParser(add_help=True, description="snapshot_batch help:")
+
+    if len(sys.argv) == 1:
+        parser.print_help()
+        sys.exit(exit_codes['EX_OK']['Code'])
+
+    args = options(parser)
+
+    if not (args.volumes or args.tags or args.instance):
+        print('snapshot_batch: You must provide --volumes, --tag or --instance', file=sys.stderr)
+        sys.exit(exit_codes['E_BADARG']['Code'])
+
+    from botocore.exceptions import BotoCoreError, ClientError
+
+    client = ec2_client(args.region, args.profile)
+    try:
+        volumes = select_volumes(
+                client, [x.strip() for x in (args.volumes or '').split(',') if x.strip()],
+                args.tags, args.instance
+            )
+    except (BotoCoreError, ClientError) as e:
+        print('snapshot_batch: %s' % str(e), file=sys.stderr)
+        sys.exit(exit_codes['E_BADARG']['Code'])
+
+    if not volumes:
+        print('snapshot_batch: No volumes match in region %s' % args.region, file=sys.stderr)
+        return False
+
+    print('  Creating %d snapshots in %s' % (len(volumes), args.region), file=sys.stderr)
+    created, failed = submit(client, volumes, args.rate)
+    snapshots = created if args.no_wait or not created else follow(client, created, timeout=args.timeout)
+
+    if args.format == 'json':
+        print(json.dumps({'Snapshots': snapshots, 'Failed': failed}, indent=4, default=str))
+    else:
+        from table import parse_columns, render
+        rows = [[x['VolumeId'], x['SnapshotId'], str(x.get('VolumeSize', '')), x['State'],
+                 x.get('Progress') or '-', x.get('Description', '')] for x in snapshots]
+        rows.extend([volume_id, '-', '-', 'failed', '-', error] for volume_id, error in sorted(failed.items()))
+        print('\n'.join(render(rows, parse_columns(COLUMNS.split(',')), args.frame, args.text)))
+    return not failed
+
+
+if __name__ == '__main__':
+    sys.exit(exit_codes['EX_OK']['Code'] if init() else exit_codes['E_MISC']['Code'])
@@ -0,0 +1,356 @@
+"""
+Summary:
+    snapshot_store (python3) | Local EBS snapshot inventory, synced incrementally.
+
+    Snapshots owned by an account are kept in a sqlite database under
+    ~/.config/ec2cli so listings, totals and csv exports do not download
+    every snapshot on each run.  Completed snapshots are immutable, so a
+    region sync only:
+
+        - fetches snapshots started on or after the day of the newest
+          stored StartTime (the watermark), using start-time filters
+        - re-checks snapshots not yet completed
+        - every FULL_SYNC_INTERVAL seconds, lists all snapshot ids and
+          tombstones those deleted since the previous full sync
+
+    Usage:
+
+        $ python3 snapshot_store.py list --profile default --regions us-east-1 --outfile snaps.json
+        $ python3 snapshot_store.py sync --regions-file ~/.config/ec2cli/regions.list --full
+        $ python3 snapshot_store.py stats --regions us-east-1,eu-west-1
+
+Author:
+    Blake Huber
+    Copyright Blake Huber, All Rights Reserved.
+
+License:
+    GNU General Public License v3.0 (GPL-3)
+    Additional terms may be found in the complete license agreement:
+    https://bitbucket.org/blakeca00/ec2cli/src/master/LICENSE.txt
+
+OS Support:
+    - RedHat Linux, Amazon Linux, Ubuntu & variants
+
+Dependencies:
+    - Requires python3, tested under py3.5 and py3.6
+"""
+
+import os
+import sys
+import json
+import time
+import sqlite3
+import datetime
+import argparse
+import inspect
+from concurrent.futures import ThreadPoolExecutor
+
+# pkg
+import identity
+from region_fetch import MAX_WORKERS, ec2_client, json_default, read_regions
+from oscodes_unix import exit_codes
+import loggers
+from _version import __version__
+
+# globals
+logger = loggers.getLogger(__version__)
+DB_PATH = os.path.join(os.path.expanduser('~'), '.config', 'ec2cli', 'snapshots.db')
+FULL_SYNC_INTERVAL = 86400      # seconds between id-set diffs detecting deletions
+MAX_DELTA_DAYS = 180            # watermarks older than this trigger a full sync
+MAX_FILTER_VALUES = 200         # describe-snapshots limit on values per filter
+PAGE_SIZE = 1000
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS snapshots (
+    account TEXT NOT NULL,
+    region TEXT NOT NULL,
+    snapshot_id TEXT NOT NULL,
+    start_time TEXT,
+    state TEXT,
+    volume_size INTEGER,
+    data TEXT,
+    deleted REAL,
+    PRIMARY KEY (account, region, snapshot_id)
+);
+CREATE INDEX IF NOT EXISTS snapshots_state ON snapshots (account, region, state);
+CREATE TABLE IF NOT EXISTS sync (
+    account TEXT NOT NULL,
+    region TEXT NOT NULL,
+    full_sync REAL,
+    synced REAL,
+    PRIMARY KEY (account, region)
+);
+"""
+
+
+def connect(db_path=DB_PATH):
+    """Opens the inventory; one connection per thread"""
+    os.makedirs(os.path.dirname(db_path), mode=0o700, exist_ok=True)
+    conn = sqlite3.connect(db_path, timeout=30)
+    conn.execute('PRAGMA journal_mode=WAL')
+    conn.executescript(SCHEMA)
+    return conn
+
+
+def upsert(conn, account, region, snapshots):
+    """Stores describe-snapshots items, clearing any tombstone"""
+    rows = []
+    for item in snapshots:
+        item = json.loads(json.dumps(dict(item, Region=region), default=json_default))
+        rows.append((account, region, item['SnapshotId'], item.get('StartTime'), item.get('State'),
+                     item.get('VolumeSize'), json.dumps(item)))
+    with conn:
+        conn.executemany(
+            'INSERT OR REPLACE INTO snapshots VALUES (?, ?, ?, ?, ?, ?, ?, NULL)', rows)
+    return len(rows)
+
+
+def watermark(conn, account, region):
+    """StartTime of the newest stored snapshot, or None"""
+    return conn.execute(
+        'SELECT max(start_time) FROM snapshots WHERE account=? AND region=?', (account, region)).fetchone()[0]
+
+
+def delta_days(mark, now=None):
+    """
+    Summary:
+        start-time filter values covering each utc day from the watermark day
+        through today, or None when a full sync is cheaper
+    Returns:
+        TYPE: list
+    """
+    today = (now or datetime.datetime.utcnow()).date()
+    first = datetime.datetime.strptime(mark[:10], '%Y-%m-%d').date()
+    days = (today - first).days + 1
+    if days > MAX_DELTA_DAYS:
+        return None
+    return [(first + datetime.timedelta(days=x)).strftime('%Y-%m-%d') + '*' for x in range(max(days, 1))]
+
+
+def _paginate(client, **params):
+    paginator = client.get_paginator('describe_snapshots')
+    for page in paginator.paginate(OwnerIds=['self'], PaginationConfig={'PageSize': PAGE_SIZE}, **params):
+        yield page['Snapshots']
+
+
+def sync_region(account, region, profile=None, full=False, client=None, db_path=DB_PATH):
+    """
+    Summary:
+        Brings the inventory of one region up to date
+    Args:
+        :account (str): aws account number
+        :region (str): aws region code
+        :profile (str): profile_name of an iam user from local awscli config
+        :full (bool): list every snapshot and tombstone deletions regardless of interval
+        :client (boto3 client): optional ec2 client to reuse
+    Returns:
+        snapshots fetched, snapshots tombstoned | TYPE: tuple
+    """
+    client = client or ec2_client(region, profile)
+    conn = connect(db_path)
+    now = time.time()
+    fetched = removed = 0
+    try:
+        state = conn.execute(
+            'SELECT full_sync FROM sync WHERE account=? AND region=?', (account, region)).fetchone()
+        mark = watermark(conn, account, region)
+        days = delta_days(mark) if mark else None
+
+        if full or state is None or state[0] is None or now - state[0] > FULL_SYNC_INTERVAL or days is None:
+            seen = set()
+            for snapshots in _paginate(client):
+                fetched += upsert(conn, account, region, snapshots)
+                seen.update(x['SnapshotId'] for x in snapshots)
+            stored = {x[0] for x in conn.execute(
+                'SELECT snapshot_id FROM snapshots WHERE account=? AND region=? AND deleted IS NULL',
+                (account, region))}
+            removed = tombstone(conn, account, region, stored - seen, now)
+            full_sync = now
+        else:
+            # snapshots started since the watermark day; completed ones never change
+            for snapshots in _paginate(client, Filters=[{'Name': 'start-time', 'Values': days}]):
+                fetched += upsert(conn, account, region, snapshots)
+
+            pending = [x[0] for x in conn.execute(
+                "SELECT snapshot_id FROM snapshots WHERE account=? AND region=? AND deleted IS NULL "
+                "AND state != 'completed'", (account, region))]
+            for i in range(0, len(pending), MAX_FILTER_VALUES):
+                chunk, seen = pending[i:i + MAX_FILTER_VALUES], set()
+                for snapshots in _paginate(client, Filters=[{'Name': 'snapshot-id', 'Values': chunk}]):
+                    fetched += upsert(conn, account, region, snapshots)
+                    seen.update(x['SnapshotId'] for x in snapshots)
+                removed += tombstone(conn, account, region, set(chunk) - seen, now)
+            full_sync = state[0]
+
+        with conn:
+            conn.execute('INSERT OR REPLACE INTO sync VALUES (?, ?, ?, ?)', (account, region, full_sync, now))
+    finally:
+        conn.close()
+    return fetched, removed
+
+
+def tombstone(conn, account, region, snapshot_ids, now=None):
+    """Marks snapshots deleted in aws; rows are kept so deletions are auditable"""
+    with conn:
+        conn.executemany(
+            'UPDATE snapshots SET deleted=? WHERE account=? AND region=? AND snapshot_id=?',
+            [(now or time.time(), account, region, x) for x in snapshot_ids])
+    return len(snapshot_ids)
+
+
+def items(account, region, db_path=DB_PATH):
+    """
+    Summary:
+        Reads the stored snapshots of a region, newest first
+    Returns:
+        describe-snapshots items | TYPE: generator
+    """
+    conn = connect(db_path)
+    try:
+        for row in conn.execute(
+                'SELECT data FROM snapshots WHERE account=? AND region=? AND deleted IS NULL '
+                'ORDER BY start_time DESC', (account, region)):
+            yield json.loads(row[0])
+    finally:
+        conn.close()
+
+
+def stats(account, regions, db_path=DB_PATH):
+    """
+    Summary:
+        Snapshot count and total volume size (GiB) per region
+    Returns:
+        region: (count, size) | TYPE: dict
+    """
+    conn = connect(db_path)
+    try:
+        return {
+            region: conn.execute(
+                'SELECT count(*), coalesce(sum(volume_size), 0) FROM snapshots '
+                'WHERE account=? AND region=? AND deleted IS NULL', (account, region)).fetchone()
+            for region in regions
+        }
+    finally:
+        conn.close()
+
+
+def sync_all(regions, profile=None, full=False, workers=MAX_WORKERS, db_path=DB_PATH):
+    """
+    Summary:
+        Syncs regions concurrently; a failed region is reported, not fatal
+    Returns:
+        region: {'Fetched', 'Removed', 'Elapsed', 'Error'} | TYPE: dict
+    """
+    from botocore.exceptions import BotoCoreError, ClientError
+
+    account = identity.get(profile)['Account']
+
+    def sync(region):
+        start = time.time()
+        try:
+            fetched, removed = sync_region(account, region, profile, full, db_path=db_path)
+            error = None
+        except ClientError as e:
+            fetched = removed = 0
+            error = '%s: %s' % (e.response['Error']['Code'], e.response['Error']['Message'])
+        except (BotoCoreError, sqlite3.Error) as e:
+            fetched = removed = 0
+            error = str(e)
+        if error:
+            logger.warning('%s: region %s failed (%s)' % (inspect.stack()[0][3], region, error))
+        return region, {'Fetched': fetched, 'Removed': removed, 'Elapsed': round(time.time() - start, 3),
+                        'Error': error}
+
+    with ThreadPoolExecutor(max_workers=max(1, min(workers, len(regions)))) as executor:
+        return dict(executor.map(sync, regions))
+
+
+def document(regions, profile=None, sync=True, full=False, db_path=DB_PATH):
+    """
+    Summary:
+        Snapshot listing in the region_fetch document format, served from
+        the inventory after an incremental sync
+    Returns:
+        TYPE: dict
+    """
+    start = time.time()
+    results = sync_all(regions, profile, full, db_path=db_path) if sync else {}
+    account = identity.get(profile)['Account']
+    doc = {'Snapshots': [], 'Regions': {}}
+    for region in regions:
+        snapshots = list(items(account, region, db_path))
+        doc['Snapshots'].extend(snapshots)
+        result = results.get(region, {})
+        doc['Regions'][region] = {
+            'Count': len(snapshots),
+            'Elapsed': result.get('Elapsed', 0),
+            'Error': result.get('Error')
+        }
+    doc['Elapsed'] = round(time.time() - start, 3)
+    return doc
+
+
+def options(parser, help_menu=False):
+    """
+    Summary:
+        parse cli parameter options
+    Returns:
+        TYPE: argparse object, parser argument set
+    """
+    parser.add_argument("operation", nargs='?', default='list', choices=['list', 'sync', 'stats'])
+    parser.add_argument("-p", "--profile", nargs='?', default="default", required=False)
+    parser.add_argument("-r", "--regions", nargs='?', required=False,
+                              help="comma delimited list of region codes")
+    parser.add_argument("-f", "--regions-file", dest='regions_file', nargs='?', required=False)
+    parser.add_argument("-o", "--outfile", nargs='?', required=False)
+    parser.add_argument("-F", "--full", dest='full', action='store_true', required=False,
+                              help="list all snapshot ids and tombstone deletions")
+    parser.add_argument("-n", "--no-sync", dest='no_sync', action='store_true', required=False,
+                              help="serve the inventory without querying aws")
+    return parser.parse_args()
+
+
+def init():
+
+    parser = argparse.ArgumentParser(add_help=True, description="snapshot_store help:")
+    args = options(parser)
+
+    if args.regions:
+        regions = [x.strip() for x in args.regions.split(',') if x.strip()]
+    elif args.regions_file and os.path.exists(args.regions_file):
+        regions = read_regions(args.regions_file)
+    else:
+        print('snapshot_store: You must provide --regions or a valid --regions-file', file=sys.stderr)
+        sys.exit(exit_codes['E_BADARG']['Code'])
+
+    try:
+        if args.operation == 'sync':
+            for region, result in sorted(sync_all(regions, args.profile, args.full).items()):
+                print('%s\t%d fetched\t%d removed\t%ss\t%s' % (
+                    region, result['Fetched'], result['Removed'], result['Elapsed'], result['Error'] or '-'))
+
+        elif args.operation == 'stats':
+            account = identity.get(args.profile)['Account']
+            for region, (count, size) in stats(account, regions).items():
+                print('%s\t%d snapshots\t%d GiB' % (region, count, size))
+
+        else:
+            doc = document(regions, args.profile, sync=not args.no_sync, full=args.full)
+            if args.outfile:
+                with open(args.outfile, 'w') as out_file:
+                    json.dump(doc, out_file)
+            else:
+                json.dump(doc, sys.stdout)
+
+    except identity.IdentityError as e:
+        print('snapshot_store: %s' % str(e), file=sys.stderr)
+        sys.exit(exit_codes[e.code]['Code'])
+    except (OSError, sqlite3.Error) as e:
+        logger.exception('%s: inventory unavailable (%s)' % (inspect.stack()[0][3], str(e)))
+        print('snapshot_store: %s' % str(e), file=sys.stderr)
+        return False
+    return True
+
+
+if __name__ == '__main__':
+    sys.exit(exit_codes['EX_OK']['Code'] if init() else exit_codes['E_MISC']['Code'])
@@ -0,0 +1,321 @@
+"""
+Summary:
+    spot_engine (python3) | Current spot prices across regions, instance
+    types and operating systems.
+
+    Each (region, product description, instance type pattern) combination is
+    queried concurrently with describe-spot-price-history starting now, so
+    only the prices in effect are returned.  Results are reduced to the
+    latest price per (availability zone, instance type, product) and ranked.
+    Instance type patterns may contain wildcards (m5.*, *.xlarge); they are
+    evaluated by the api.  Families (m, c, r ...) are expanded to their
+    instance types from the local catalog when one exists.  Types and
+    patterns are sent together as the values of one instance-type filter
+    (at most MAX_FILTER_VALUES per query), so each region and product costs
+    one paginated query rather than one per instance type.
+
+    With --sort none results are not ranked: each query's prices are written
+    as soon as it completes (json as one document per line), suitable for
+    batch collection from cron.
+
+    Usage:
+
+        $ python3 spot_engine.py --regions us-east-1,us-west-2 --types 'm5.*,c5.large' \\
+                                 --products Linux/UNIX --top 20
+        $ python3 spot_engine.py --regions-file ~/.config/ec2cli/regions.list \\
+                                 --families m,c --format csv --sort none
+
+Author:
+    Blake Huber
+    Copyright Blake Huber, All Rights Reserved.
+
+License:
+    GNU General Public License v3.0 (GPL-3)
+    Additional terms may be found in the complete license agreement:
+    https://bitbucket.org/blakeca00/ec2cli/src/master/LICENSE.txt
+
+OS Support:
+    - RedHat Linux, Amazon Linux, Ubuntu & variants
+
+Dependencies:
+    - Requires python3, tested under py3.5 and py3.6
+"""
+
+import os
+import sys
+import csv
+import json
+import time
+import datetime
+import argparse
+import inspect
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+# pkg
+from region_fetch import MAX_WORKERS, ec2_client, read_regions
+from oscodes_unix import exit_codes
+import loggers
+from _version import __version__
+
+# globals
+logger = loggers.getLogger(__version__)
+PRODUCTS = ['Linux/UNIX', 'SUSE Linux', 'Red Hat Enterprise Linux', 'Windows']
+DEFAULT_PRODUCTS = ['Linux/UNIX']
+MAX_FILTER_VALUES = 200     # describe-spot-price-history limit on values per filter
+FIELDS = ['Region', 'AvailabilityZone', 'InstanceType', 'ProductDescription', 'SpotPrice', 'Timestamp']
+# table.py column specs for FIELDS
+COLUMNS = 'Region:15,AZ:16,InstanceType:15,Product:24.24,Price:10,Updated:16'
+
+
+def query(region, product, patterns, profile=None, now=None):
+    """
+    Summary:
+        Prices in effect for one region, product description and group of
+        instance types or patterns (values of a single filter)
+    Returns:
+        price records | TYPE: list
+    """
+    client = ec2_client(region, profile)
+    paginator = client.get_paginator('describe_spot_price_history')
+    records = []
+    for page in paginator.paginate(
+            StartTime=now or datetime.datetime.utcnow(),
+            ProductDescriptions=[product],
+            Filters=[{'Name': 'instance-type', 'Values': list(patterns)}]):
+        for x in page['SpotPriceHistory']:
+            records.append({
+                'Region': region,
+                'AvailabilityZone': x['AvailabilityZone'],
+                'InstanceType': x['InstanceType'],
+                'ProductDescription': x['ProductDescription'],
+                'SpotPrice': float(x['SpotPrice']),
+                'Timestamp': x['Timestamp'].strftime('%Y-%m-%dT%H:%M')
+                if isinstance(x['Timestamp'], datetime.datetime) else str(x['Timestamp'])[:16]
+            })
+    return records
+
+
+def latest(records):
+    """
+    Summary:
+        Reduces price records to the most recent per (az, type, product)
+    Returns:
+        TYPE: list
+    """
+    prices = {}
+    for x in records:
+        key = (x['AvailabilityZone'], x['InstanceType'], x['ProductDescription'])
+        if key not in prices or x['Timestamp'] > prices[key]['Timestamp']:
+            prices[key] = x
+    return list(prices.values())
+
+
+def groups(patterns, size=MAX_FILTER_VALUES):
+    """
+    Summary:
+        Splits instance types and patterns into filter value groups
+    Returns:
+        TYPE: list of tuples
+    """
+    patterns = list(dict.fromkeys(patterns))
+    return [tuple(patterns[i:i + size]) for i in range(0, len(patterns), size)]
+
+
+def family_patterns(families, catalog_path=None):
+    """
+    Summary:
+        Instance types of each family from the local catalog, otherwise a
+        wildcard pattern per family (m -> m*)
+    Returns:
+        TYPE: list
+    """
+    import catalog
+    index = catalog.load(catalog_path or catalog.DEFAULT_PATH)
+    patterns = []
+    for family in families:
+        types = catalog.lookup(index, family) if index else []
+        patterns.extend(types or [family + '*'])
+    return patterns
+
+
+def rank(records, sort='price', top=None):
+    """
+    Summary:
+        Orders records cheapest first (or by region, type); ties by az
+    Returns:
+        TYPE: list
+    """
+    keys = {
+        'price': lambda x: (x['SpotPrice'], x['InstanceType'], x['AvailabilityZone']),
+        'region': lambda x: (x['Region'], x['SpotPrice'], x['AvailabilityZone']),
+        'type': lambda x: (x['InstanceType'], x['SpotPrice'], x['AvailabilityZone'])
+    }
+    records = sorted(records, key=keys[sort])
+    return records[:top] if top else records
+
+
+def prices(regions, patterns, products=None, profile=None, workers=MAX_WORKERS, callback=None):
+    """
+    Summary:
+        Queries every (region, product, pattern) combination concurrently
+    Args:
+        :regions (list): aws region codes
+        :patterns (list): instance types or wildcard patterns, eg m5.*; one
+            query per MAX_FILTER_VALUES patterns
+        :products (list): product descriptions, eg Linux/UNIX
+        :profile (str): profile_name of an iam user from local awscli config
+        :workers (int): maximum concurrent queries
+        :callback (callable): receives the latest prices of each query as it
+            completes; records are then not retained
+    Returns:
+        latest price records, failed queries | TYPE: tuple (list, dict)
+    """
+    from botocore.exceptions import BotoCoreError, ClientError
+
+    now = datetime.datetime.utcnow()
+    shards = [(r, p, t) for r in regions for p in (products or DEFAULT_PRODUCTS) for t in groups(patterns)]
+    records, failed = [], {}
+
+    with ThreadPoolExecutor(max_workers=max(1, min(workers, len(shards)))) as executor:
+        futures = {executor.submit(query, r, p, t, profile, now): (r, p, t) for r, p, t in shards}
+        for future in as_completed(futures):
+            try:
+                if callback:
+                    callback(latest(future.result()))
+                else:
+                    records.extend(future.result())
+            except ClientError as e:
+                failed[futures[future]] = '%s: %s' % (e.response['Error']['Code'], e.response['Error']['Message'])
+            except BotoCoreError as e:
+                failed[futures[future]] = str(e)
+
+    for shard, error in failed.items():
+        logger.warning('%s: %s %s %s failed (%s)' % (
+            inspect.stack()[0][3], shard[0], shard[1], ','.join(shard[2]), error))
+    return latest(records), failed
+
+
+def writer(fmt='table', frame='', text=''):
+    """
+    Summary:
+        Returns a function writing records to stdout as each batch arrives;
+        csv and table headers are written once
+    """
+    state = {'header': True}
+
+    def emit(records):
+        if not records:
+            return
+        if fmt == 'json':
+            sys.stdout.write(''.join(json.dumps(x) + '\n' for x in records))
+        elif fmt == 'csv':
+            out = csv.DictWriter(sys.stdout, fieldnames=FIELDS)
+            if state['header']:
+                out.writeheader()
+            out.writerows(records)
+        else:
+            from table import parse_columns, render
+            rows = [[str(x[k]) if k != 'SpotPrice' else '%.4f' % x[k] for k in FIELDS] for x in records]
+            lines = list(render(rows, parse_columns(COLUMNS.split(',')), frame, text))
+            sys.stdout.write('\n'.join(lines if state['header'] else lines[3:]) + '\n')
+        state['header'] = False
+        sys.stdout.flush()
+    return emit
+
+
+def write(records, fmt='table', frame='', text=''):
+    """Writes ranked records to stdout as a table, json or csv"""
+    if fmt == 'json':
+        json.dump(records, sys.stdout, indent=4)
+        sys.stdout.write('\n')
+    elif fmt == 'csv':
+        writer = csv.DictWriter(sys.stdout, fieldnames=FIELDS)
+        writer.writeheader()
+        writer.writerows(records)
+    else:
+        from table import parse_columns, render
+        rows = [[str(x[k]) if k != 'SpotPrice' else '%.4f' % x[k] for k in FIELDS] for x in records]
+        sys.stdout.write('\n'.join(render(rows, parse_columns(COLUMNS.split(',')), frame, text)) + '\n')
+
+
+def options(parser, help_menu=False):
+    """
+    Summary:
+        parse cli parameter options
+    Returns:
+        TYPE: argparse object, parser argument set
+    """
+    parser.add_argument("-p", "--profile", nargs='?', default="default", required=False)
+    parser.add_argument("-r", "--regions", nargs='?', required=False,
+                              help="comma delimited list of region codes")
+    parser.add_argument("-f", "--regions-file", dest='regions_file', nargs='?', required=False)
+    parser.add_argument("-t", "--types", nargs='?', default=None, required=False,
+                              help="comma delimited instance types or patterns, eg 'm5.*,c5.large'")
+    parser.add_argument("-a", "--families", nargs='?', default=None, required=False,
+                              help="comma delimited instance families, eg m,c,r")
+    parser.add_argument("-o", "--products", nargs='?', default=','.join(DEFAULT_PRODUCTS), required=False,
+                              help="comma delimited product descriptions (%s)" % ', '.join(PRODUCTS))
+    parser.add_argument("-s", "--sort", nargs='?', default='price', choices=['price', 'region', 'type', 'none'])
+    parser.add_argument("-n", "--top", type=int, default=None, required=False)
+    parser.add_argument("-F", "--format", nargs='?', default='table', choices=['table', 'json', 'csv'])
+    parser.add_argument("--frame", nargs='?', default='', required=False)
+    parser.add_argument("--text", nargs='?', default='', required=False)
+    parser.add_argument("-w", "--workers", type=int, default=MAX_WORKERS, required=False)
+    return parser.parse_args()
+
+
+def init():
+
+    parser = argparse.ArgumentParser(add_help=True, description="spot_engine help:")
+
+    if len(sys.argv) == 1:
+        parser.print_help()
+        sys.exit(exit_codes['EX_OK']['Code'])
+
+    args = options(parser)
+
+    if args.regions:
+        regions = [x.strip() for x in args.regions.split(',') if x.strip()]
+    elif args.regions_file and os.path.exists(args.regions_file):
+        regions = read_regions(args.regions_file)
+    else:
+        print('spot_engine: You must provide --regions or a valid --regions-file', file=sys.stderr)
+        sys.exit(exit_codes['E_BADARG']['Code'])
+
+    products = [x.strip() for x in args.products.split(',') if x.strip()]
+    unknown = [x for x in products if x not in PRODUCTS]
+    if unknown:
+        print('spot_engine: Unknown product description: %s' % ', '.join(unknown), file=sys.stderr)
+        sys.exit(exit_codes['E_BADARG']['Code'])
+
+    patterns = [x.strip() for x in (args.types or '').split(',') if x.strip()]
+    if args.families:
+        patterns.extend(family_patterns([x.strip() for x in args.families.split(',') if x.strip()]))
+    if not patterns:
+        print('spot_engine: You must provide --types or --families', file=sys.stderr)
+        sys.exit(exit_codes['E_BADARG']['Code'])
+
+    if args.sort == 'none' and args.top:
+        print('spot_engine: --top requires ranked results; not valid with --sort none', file=sys.stderr)
+        sys.exit(exit_codes['E_BADARG']['Code'])
+
+    start = time.time()
+    try:
+        if args.sort == 'none':
+            records, failed = prices(regions, patterns, products, args.profile, args.workers,
+                                     callback=writer(args.format, args.frame, args.text))
+        else:
+            records, failed = prices(regions, patterns, products, args.profile, args.workers)
+            write(rank(records, args.sort, args.top), args.format, args.frame, args.text)
+    except BrokenPipeError:
+        sys.stdout = None
+        return True
+
+    for (region, product, group), error in sorted(failed.items()):
+        print('spot_engine: %s %s %s failed (%s)' % (region, product, ','.join(group), error), file=sys.stderr)
+    logger.info('spot_engine: %d prices in %ss' % (len(records), round(time.time() - start, 3)))
+    return not failed or len(failed) < len(regions) * len(products) * len(groups(patterns))
+
+
+if __name__ == '__main__':
+    sys.exit(exit_codes['EX_OK']['Code'] if init() else exit_codes['E_MISC']['Code'])
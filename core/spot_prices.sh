@@ -105,7 +105,29 @@ function precheck(){
 
 function load_arrays(){
     ## loads array for each instance type family ##
+    local family types
     #
+    if [ -e "$config_dir/catalog.json" ]; then
+        # single read of prebuilt family index
+        while read -r family types; do
+            case $family in
+                c)  C_TYPE=$types ;;
+                d)  D_TYPE=$types ;;
+                f)  F_TYPE=$types ;;
+                g)  G_TYPE=$types ;;
+                h)  H_TYPE=$types ;;
+                i)  I_TYPE=$types ;;
+                m)  M_TYPE=$types ;;
+                p)  P_TYPE=$types ;;
+                r)  R_TYPE=$types ;;
+                t)  T_TYPE=$types ;;
+                x)  X_TYPE=$types ;;
+                *)  MISC_TYPE="$MISC_TYPE $types" ;;
+            esac
+        done < <(python3 "$lib_path/catalog.py" families --catalog "$config_dir/catalog.json")
+        return 0
+    fi
+    # catalog absent; scan flat types file
     C_TYPE=$(grep c[1-9].* $config_dir/types.ec2 | grep -v cc)
     D_TYPE=$(grep d[1-9].* $config_dir/types.ec2)
     F_TYPE=$(grep f[1-9].* $config_dir/types.ec2)
@@ -152,10 +174,47 @@ function precheck(){
 
 }
 
+function spot_batch(){
+    ## non-interactive mode; flags translated for spot_engine.py, results streamed to stdout ##
+    local args=(--profile "$PROFILE")
+    #
+    while [ $# -gt 0 ]; do
+        case "$1" in
+            --regions)
+                if [ "$2" = "all" ]; then
+                    args+=(--regions-file "$HOME/.config/ec2cli/regions.list")
+                else
+                    args+=(--regions "$2")
+                fi
+                shift 2
+                ;;
+            --os)
+                args+=(--products "$2")
+                shift 2
+                ;;
+            --families | --types | --format | --sort | --top)
+                args+=("$1" "$2")
+                shift 2
+                ;;
+            *)
+                echo "spot_prices: unknown option $1" >&2
+                exit $E_BADARG
+                ;;
+        esac
+    done
+    exec python3 "$lib_path/spot_engine.py" "${args[@]}"
+}
+
 #
 # --- main ---------------------------------------------------------------------
 #
 
+# non-interactive when flags follow the profile name, eg:
+#   spot_prices.sh default --regions all --os Linux/UNIX --families m,c --format json --sort none
+if [ "$2" ]; then
+    shift 1
+    spot_batch "$@"
+fi
 
 echo -e "\n"
 
@@ -371,25 +430,14 @@ fi
 if [ "$TYPE" = "SUSE" ]; then TYPE='SUSE Linux'; fi
 
 
-if [ "$SIZE" = 'all' ]; then
-    aws ec2 describe-spot-price-history  \
-        --profile $PROFILE \
-        --region $REGION \
-        --start-time "$NOW" \
-        --product-description "$TYPE" \
-        --output table
+if [ "$SIZE" = 'all' ]; then SIZE='*'; fi
 
-else
-
-    aws ec2 describe-spot-price-history  \
-    --profile $PROFILE \
-    --region $REGION \
-    --start-time "$NOW" \
-    --product-description "$TYPE" \
-    --instance-types "$SIZE" \
-    --output table
-
-fi
+# append price changes since the last sync to the local store, then report
+# current price and 7 day low, mean, high and volatility per az from rollups
+python3 "$lib_path/spot_store.py" sync --profile "$PROFILE" --regions "$REGION" \
+    --products "$TYPE" --types "$SIZE"
+python3 "$lib_path/spot_store.py" summary --regions "$REGION" --products "$TYPE" \
+    --types "$SIZE" --days 7 --frame "$frame" --text "$bodytext"
 
 exit 0
 
@@ -0,0 +1,379 @@
+"""
+Summary:
+    spot_store (python3) | Local spot price history with hourly and daily
+    rollups.
+
+    Price changes are appended to a sqlite database under ~/.config/ec2cli.
+    Each sync of a (region, product description, instance type pattern)
+    fetches only the window since that query was last synced (HISTORY_DAYS
+    on first use).  Hourly and daily rollups (min, max, mean, volatility)
+    are recomputed for the buckets touched by each sync, so questions such
+    as the cheapest availability zone for a type over the past week are
+    answered from the store without api calls.
+
+    Low, mean and high are time weighted over the window: the price in effect
+    at the start of the window (the last change at or before it) is carried
+    forward, so a series whose price has not changed recently still reports.
+    Volatility is computed over change events only: the standard deviation of
+    the prices set by changes within the window divided by their mean
+    (coefficient of variation); 0 when the price did not change.
+
+    Usage:
+
+        $ python3 spot_store.py sync --regions us-east-1,us-west-2 --types 'm5.*'
+        $ python3 spot_store.py cheapest --type m5.large --days 7
+        $ python3 spot_store.py summary --regions us-east-1 --types m5.large --days 7
+
+Author:
+    Blake Huber
+    Copyright Blake Huber, All Rights Reserved.
+
+License:
+    GNU General Public License v3.0 (GPL-3)
+    Additional terms may be found in the complete license agreement:
+    https://bitbucket.org/blakeca00/ec2cli/src/master/LICENSE.txt
+
+OS Support:
+    - RedHat Linux, Amazon Linux, Ubuntu & variants
+
+Dependencies:
+    - Requires python3, tested under py3.5 and py3.6
+"""
+
+import os
+import sys
+import math
+import time
+import sqlite3
+import datetime
+import argparse
+import inspect
+from concurrent.futures import ThreadPoolExecutor
+
+# pkg
+from region_fetch import MAX_WORKERS, ec2_client, read_regions
+from spot_engine import PRODUCTS, DEFAULT_PRODUCTS
+from oscodes_unix import exit_codes
+import loggers
+from _version import __version__
+
+# globals
+logger = loggers.getLogger(__version__)
+DB_PATH = os.path.join(os.path.expanduser('~'), '.config', 'ec2cli', 'spot.db')
+HISTORY_DAYS = 7            # window fetched on the first sync of a query
+PERIODS = {'hour': 3600, 'day': 86400}
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS prices (
+    region TEXT NOT NULL,
+    az TEXT NOT NULL,
+    instance_type TEXT NOT NULL,
+    product TEXT NOT NULL,
+    ts INTEGER NOT NULL,
+    price REAL NOT NULL,
+    PRIMARY KEY (az, instance_type, product, ts)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS rollups (
+    period TEXT NOT NULL,
+    bucket INTEGER NOT NULL,
+    region TEXT NOT NULL,
+    az TEXT NOT NULL,
+    instance_type TEXT NOT NULL,
+    product TEXT NOT NULL,
+    n INTEGER,
+    low REAL,
+    high REAL,
+    total REAL,
+    squares REAL,
+    PRIMARY KEY (period, instance_type, product, bucket, az)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS watermarks (
+    region TEXT NOT NULL,
+    product TEXT NOT NULL,
+    pattern TEXT NOT NULL,
+    ts INTEGER NOT NULL,
+    PRIMARY KEY (region, product, pattern)
+);
+"""
+
+
+def connect(db_path=DB_PATH):
+    """Opens the store; one connection per thread"""
+    os.makedirs(os.path.dirname(db_path), mode=0o700, exist_ok=True)
+    conn = sqlite3.connect(db_path, timeout=30)
+    conn.execute('PRAGMA journal_mode=WAL')
+    conn.executescript(SCHEMA)
+    return conn
+
+
+def glob(pattern):
+    """Instance type pattern as a sqlite GLOB; ? and * keep their meaning"""
+    return pattern.replace('[', '[[]')
+
+
+def _epoch(value):
+    if isinstance(value, datetime.datetime):
+        return int(value.timestamp())
+    return int(value)
+
+
+def fetch(region, product, pattern, start, end, profile=None):
+    """
+    Summary:
+        Price changes in [start, end] for one region, product and type pattern
+    Returns:
+        (region, az, type, product, epoch seconds, price) rows | TYPE: list
+    """
+    client = ec2_client(region, profile)
+    paginator = client.get_paginator('describe_spot_price_history')
+    rows = []
+    for page in paginator.paginate(
+            StartTime=datetime.datetime.utcfromtimestamp(start),
+            EndTime=datetime.datetime.utcfromtimestamp(end),
+            ProductDescriptions=[product],
+            Filters=[{'Name': 'instance-type', 'Values': [pattern]}]):
+        for x in page['SpotPriceHistory']:
+            rows.append((region, x['AvailabilityZone'], x['InstanceType'], x['ProductDescription'],
+                         _epoch(x['Timestamp']), float(x['SpotPrice'])))
+    return rows
+
+
+def rollup(conn, region, product, pattern, since):
+    """
+    Summary:
+        Recomputes hourly and daily rollups of buckets at or after since for
+        series matching region, product and pattern
+    """
+    with conn:
+        for period, seconds in PERIODS.items():
+            conn.execute(
+                'INSERT OR REPLACE INTO rollups '
+                'SELECT ?, ts / ? * ?, region, az, instance_type, product, '
+                'count(*), min(price), max(price), sum(price), sum(price * price) '
+                'FROM prices WHERE region=? AND product=? AND instance_type GLOB ? AND ts >= ? '
+                'GROUP BY ts / ?, region, az, instance_type, product',
+                (period, seconds, seconds, region, product, glob(pattern), since // seconds * seconds, seconds))
+
+
+def sync_query(region, product, pattern, profile=None, now=None, db_path=DB_PATH):
+    """
+    Summary:
+        Appends price changes since the last sync of a query, then rolls up
+    Returns:
+        price changes stored | TYPE: int
+    """
+    now = int(now or time.time())
+    conn = connect(db_path)
+    try:
+        mark = conn.execute(
+            'SELECT ts FROM watermarks WHERE region=? AND product=? AND pattern=?',
+            (region, product, pattern)).fetchone()
+        start = mark[0] if mark else now - HISTORY_DAYS * 86400
+        rows = fetch(region, product, pattern, start, now, profile)
+        with conn:
+            before = conn.total_changes
+            conn.executemany('INSERT OR IGNORE INTO prices VALUES (?, ?, ?, ?, ?, ?)', rows)
+            stored = conn.total_changes - before
+            conn.execute('INSERT OR REPLACE INTO watermarks VALUES (?, ?, ?, ?)', (region, product, pattern, now))
+        if rows:
+            rollup(conn, region, product, pattern, min(x[4] for x in rows))
+    finally:
+        conn.close()
+    return stored
+
+
+def sync(regions, patterns, products=None, profile=None, workers=MAX_WORKERS, db_path=DB_PATH):
+    """
+    Summary:
+        Syncs every (region, product, pattern) combination concurrently
+    Returns:
+        (region, product, pattern): stored count or error message | TYPE: dict
+    """
+    from botocore.exceptions import BotoCoreError, ClientError
+
+    shards = [(r, p, t) for r in regions for p in (products or DEFAULT_PRODUCTS) for t in patterns]
+
+    def run(shard):
+        try:
+            return shard, sync_query(*shard, profile=profile, db_path=db_path)
+        except ClientError as e:
+            error = '%s: %s' % (e.response['Error']['Code'], e.response['Error']['Message'])
+        except (BotoCoreError, sqlite3.Error) as e:
+            error = str(e)
+        logger.warning('%s: %s failed (%s)' % (inspect.stack()[0][3], ' '.join(shard), error))
+        return shard, error
+
+    with ThreadPoolExecutor(max_workers=max(1, min(workers, len(shards)))) as executor:
+        return dict(executor.map(run, shards))
+
+
+def _stats(n, total, squares):
+    """mean and volatility (coefficient of variation) from rollup sums"""
+    mean = total / n
+    variance = max(squares / n - mean * mean, 0)
+    return mean, (math.sqrt(variance) / mean if mean else 0)
+
+
+def _weighted(carried, changes, since, now):
+    """
+    Summary:
+        Time weighted low, mean and high of a series over [since, now]
+    Args:
+        :carried (float): price in effect at since, None if the series starts later
+        :changes (list): (epoch seconds, price) changes after since, ascending
+    Returns:
+        low, mean, high | TYPE: tuple
+    """
+    points = ([(since, carried)] if carried is not None else []) + changes
+    spans = [(price, max(end - start, 0)) for (start, price), (end, _) in zip(points, points[1:] + [(now, None)])]
+    duration = sum(x[1] for x in spans)
+    prices = [x[0] for x in spans]
+    mean = sum(p * d for p, d in spans) / duration if duration else prices[-1]
+    return min(prices), mean, max(prices)
+
+
+def summary(patterns, regions=None, products=None, days=7, period='day', now=None, db_path=DB_PATH):
+    """
+    Summary:
+        Per (az, type, product) statistics over the past days; the price in
+        effect at the start of the window is carried forward into each series
+    Returns:
+        records with Low, Mean, High (time weighted), Volatility (of change
+        events), Samples (change events in window), Latest | TYPE: list
+    """
+    now = int(now or time.time())
+    since = now - days * 86400
+    since -= since % PERIODS[period]
+    products = products or DEFAULT_PRODUCTS
+    conn = connect(db_path)
+    records = []
+    try:
+        for pattern in patterns:
+            where = 'instance_type GLOB ? AND product IN (%s) %s' % (
+                ','.join('?' * len(products)),
+                'AND region IN (%s) ' % ','.join('?' * len(regions)) if regions else '')
+            params = [glob(pattern)] + list(products) + list(regions or [])
+            series = {}
+
+            # price in effect at since (sqlite returns the row holding max(ts))
+            for region, az, itype, product, price, ts in conn.execute(
+                    'SELECT region, az, instance_type, product, price, max(ts) FROM prices '
+                    'WHERE %s AND ts <= ? GROUP BY az, instance_type, product' % where, params + [since]):
+                series[(region, az, itype, product)] = [price, []]
+
+            for region, az, itype, product, ts, price in conn.execute(
+                    'SELECT region, az, instance_type, product, ts, price FROM prices '
+                    'WHERE %s AND ts > ? AND ts <= ? ORDER BY ts' % where, params + [since, now]):
+                series.setdefault((region, az, itype, product), [None, []])[1].append((ts, price))
+
+            # volatility of change events from rollups
+            volatility = {}
+            for region, az, itype, product, n, total, squares in conn.execute(
+                    'SELECT region, az, instance_type, product, sum(n), sum(total), sum(squares) '
+                    'FROM rollups WHERE period=? AND bucket >= ? AND %s'
+                    'GROUP BY region, az, instance_type, product' % where, [period, since] + params):
+                volatility[(region, az, itype, product)] = _stats(n, total, squares)[1]
+
+            for key, (carried, changes) in series.items():
+                region, az, itype, product = key
+                low, mean, high = _weighted(carried, changes, since, now)
+                records.append({
+                    'Region': region, 'AvailabilityZone': az, 'InstanceType': itype,
+                    'ProductDescription': product, 'Samples': len(changes), 'Low': low, 'Mean': round(mean, 6),
+                    'High': high, 'Volatility': round(volatility.get(key, 0) if changes else 0, 4),
+                    'Latest': changes[-1][1] if changes else carried
+                })
+    finally:
+        conn.close()
+    return records
+
+
+def cheapest(instance_type, regions=None, products=None, days=7, top=None, db_path=DB_PATH):
+    """
+    Summary:
+        Availability zones ranked by mean price over the past days
+    Returns:
+        TYPE: list
+    """
+    records = sorted(summary([instance_type], regions, products, days, db_path=db_path),
+                     key=lambda x: (x['Mean'], x['Volatility'], x['AvailabilityZone']))
+    return records[:top] if top else records
+
+
+def write(records, frame='', text=''):
+    from table import parse_columns, render
+    columns = 'Region:15,AZ:16,InstanceType:15,Product:12.12,Latest:9,Low:9,Mean:9,High:9,Volatility:10'
+    fields = ['Region', 'AvailabilityZone', 'InstanceType', 'ProductDescription', 'Latest', 'Low', 'Mean',
+              'High', 'Volatility']
+    rows = [['%.4f' % x[k] if isinstance(x[k], float) else str(x[k]) for k in fields] for x in records]
+    sys.stdout.write('\n'.join(render(rows, parse_columns(columns.split(',')), frame, text)) + '\n')
+
+
+def options(parser, help_menu=False):
+    """
+    Summary:
+        parse cli parameter options
+    Returns:
+        TYPE: argparse object, parser argument set
+    """
+    parser.add_argument("operation", nargs='?', default='summary', choices=['sync', 'summary', 'cheapest'])
+    parser.add_argument("-p", "--profile", nargs='?', default="default", required=False)
+    parser.add_argument("-r", "--regions", nargs='?', required=False,
+                              help="comma delimited list of region codes")
+    parser.add_argument("-f", "--regions-file", dest='regions_file', nargs='?', required=False)
+    parser.add_argument("-t", "--types", "--type", dest='types', nargs='?', default='*', required=False,
+                              help="comma delimited instance types or patterns, eg 'm5.*,c5.large'")
+    parser.add_argument("-o", "--products", nargs='?', default=','.join(DEFAULT_PRODUCTS), required=False)
+    parser.add_argument("-d", "--days", type=int, default=7, required=False)
+    parser.add_argument("-P", "--period", nargs='?', default='day', choices=sorted(PERIODS))
+    parser.add_argument("-n", "--top", type=int, default=None, required=False)
+    parser.add_argument("--frame", nargs='?', default='', required=False)
+    parser.add_argument("--text", nargs='?', default='', required=False)
+    return parser.parse_args()
+
+
+def init():
+
+    parser = argparse.ArgumentParser(add_help=True, description="spot_store help:")
+    args = options(parser)
+
+    regions = None
+    if args.regions:
+        regions = [x.strip() for x in args.regions.split(',') if x.strip()]
+    elif args.regions_file and os.path.exists(args.regions_file):
+        regions = read_regions(args.regions_file)
+    patterns = [x.strip() for x in args.types.split(',') if x.strip()]
+    products = [x.strip() for x in args.products.split(',') if x.strip()]
+
+    if [x for x in products if x not in PRODUCTS]:
+        print('spot_store: Unknown product description (%s)' % ', '.join(PRODUCTS), file=sys.stderr)
+        sys.exit(exit_codes['E_BADARG']['Code'])
+
+    try:
+        if args.operation == 'sync':
+            if not regions:
+                print('spot_store: sync requires --regions or a valid --regions-file', file=sys.stderr)
+                sys.exit(exit_codes['E_BADARG']['Code'])
+            results = sync(regions, patterns, products, args.profile)
+            for (region, product, pattern), result in sorted(results.items()):
+                if not isinstance(result, int):
+                    print('spot_store: %s %s %s failed (%s)' % (region, product, pattern, result), file=sys.stderr)
+            return any(isinstance(x, int) for x in results.values())
+
+        elif args.operation == 'cheapest':
+            write(cheapest(patterns[0], regions, products, args.days, args.top), args.frame, args.text)
+
+        else:
+            records = sorted(summary(patterns, regions, products, args.days, args.period),
+                             key=lambda x: (x['Latest'], x['AvailabilityZone']))
+            write(records[:args.top] if args.top else records, args.frame, args.text)
+
+    except (OSError, sqlite3.Error) as e:
+        logger.exception('%s: store unavailable (%s)' % (inspect.stack()[0][3], str(e)))
+        print('spot_store: %s' % str(e), file=sys.stderr)
+        return False
+    return True
+
+
+if __name__ == '__main__':
+    sys.exit(exit_codes['EX_OK']['Code'] if init() else exit_codes['E_MISC']['Code'])
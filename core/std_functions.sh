@@ -17,11 +17,15 @@
 #------------------------------------------------------------------------------
 
  # pkg reported in logs will be the basename of the caller
-pkg=$(basename $0 2>/dev/null)
-pkg_root="$(echo $pkg | awk -F '.' '{print $1}')"       # pkg without file extention
-pkg_path=$(cd $(dirname $0 2>/dev/null); pwd -P)
-host=$(hostname)
-system=$(uname)
+pkg=${0##*/}
+pkg_root="${pkg%%.*}"                                    # pkg without file extention
+pkg_path=$(cd "${0%/*}" 2>/dev/null; pwd -P)                 # cwd when called without a path
+host="${HOSTNAME:-$(hostname)}"
+case "$OSTYPE" in
+    linux*)     system="Linux" ;;
+    darwin*)    system="Darwin" ;;
+    *)          system=$(uname) ;;
+esac
 
 # this file
 LIB_VERSION="2.9.8"
@@ -64,24 +68,25 @@ function array2json(){
 
 
 function authenticated(){
-    ## validates authentication using iam user or role ##
+    ## validates authentication using iam user or role; served from identity cache when valid ##
     local profilename="$1"
-    local response
-    local awscli=$(which aws)
     #
-    response=$($awscli sts get-caller-identity --profile $profilename 2>&1)
-    if [ "$(echo $response | grep Invalid)" ]; then
-        std_message "The IAM profile provided ($profilename) failed to authenticate to AWS. Exit (Code $E_AUTH)" "AUTH"
-        return 1
-    elif [ "$(echo $response | grep found)" ]; then
-        std_message "The IAM user or role ($profilename) cannot be found in your local awscli config. Exit (Code $E_BADARG)" "AUTH"
-        return 1
-    elif [ "$(echo $response | grep Expired)" ]; then
-        std_message "The sts temporary credentials for the role provided ($profilename) have expired. Exit (Code $E_AUTH)" "INFO"
-        return 1
-    else
-        return 0
-    fi
+    python3 "$lib_path/identity.py" --profile "$profilename" --field account > /dev/null 2>&1
+    case $? in
+        0)
+            return 0
+            ;;
+        6)
+            std_message "The IAM user or role ($profilename) cannot be found in your local awscli config. Exit (Code $E_BADARG)" "AUTH"
+            ;;
+        9)
+            std_message "The sts temporary credentials for the role provided ($profilename) have expired. Exit (Code $E_AUTH)" "INFO"
+            ;;
+        *)
+            std_message "The IAM profile provided ($profilename) failed to authenticate to AWS. Exit (Code $E_AUTH)" "AUTH"
+            ;;
+    esac
+    return 1
 }
 
 
@@ -658,15 +663,18 @@ function std_logger(){
     local msg="$1"
     local prefix="$2"
     local log_file="$3"
-    local rst=$(echo -e ${RESET})
-    local version
+    local rst="$RESET"                      # colors.sh; already escaped
+    local version stamp
     local strip_ansi="false"
 
     # set prefix if not provided
     if [ ! $prefix ]; then prefix="INFO"; fi
 
-    # set version in logger
-    if [ $pkg_lib ] && [ -f $pkg_lib/version.py ]; then
+    # set version in logger; version module sourced once per process
+    if [ "$__version__" ]; then
+        version=$__version__
+
+    elif [ $pkg_lib ] && [ -f $pkg_lib/version.py ]; then
         source "$pkg_lib/version.py"
         version=$__version__
 
@@ -679,6 +687,8 @@ function std_logger(){
     fi
 
     # write out to log
+    printf -v stamp '%(%Y-%m-%d %T)T' -1
+
     if [ ! -f $log_file ]; then
 
         # create log file
@@ -691,12 +701,12 @@ function std_logger(){
 
     elif [ "$strip_ansi" = "true" ]; then
 
-        echo -e "$(date +'%Y-%m-%d %T') $host - $pkg - $version - [$prefix]: $msg${rst}" | \
+        echo -e "$stamp $host - $pkg - $version - [$prefix]: $msg${rst}" | \
         sed -r "s/\x1B\[([0-9]{1,2}(;[0-9]{1,2})?)?[m|G|K]//g" >> "$log_file"
 
     else
 
-        echo -e "$(date +'%Y-%m-%d %T') $host - $pkg - $version - [$prefix]: $msg${rst}" >> "$log_file"
+        echo -e "$stamp $host - $pkg - $version - [$prefix]: $msg${rst}" >> "$log_file"
 
     fi
     #
@@ -0,0 +1,343 @@
+"""
+Summary:
+    table (python3) | In-process table renderer for ec2cli listings.
+
+    Reads delimited rows (projection.py output, or rows printed by a bash
+    renderer) from stdin and writes the framed header, sorted and padded
+    body to stdout in a single pass.  Replaces the print_header, awk printf,
+    sort, and indent pipeline along with its intermediate temp files.
+
+    Column syntax:
+
+        Header:width            pad to width (awk %-Ns)
+        Header:width.precision  pad and truncate (awk %-N.Ps)
+        Header:width:color      value rendered in color (green, red, ...)
+
+    In streaming mode (--stream) rows are rendered and flushed as they are
+    read, without sorting, so the first page of a large listing is visible
+    while later pages are still being fetched.  An optional footer reports
+    a running row count and column total computed in constant memory.
+
+    Usage:
+
+        $ python3 projection.py --root 'Volumes[]' --columns 'VolumeId,Size' vols.json | \\
+            python3 table.py --columns 'VolumeId:23,Size:6' --sort Size --numeric \\
+                             --frame "$frame" --text "$bodytext"
+
+        $ python3 region_fetch.py --type snapshots --regions us-east-1 --stream | \\
+            python3 projection.py --stream --root 'Snapshots[]' --columns 'SnapshotId,VolumeSize' | \\
+            python3 table.py --stream --columns 'SnapshotId:23,Size:6' --total Size \\
+                             --footer '{count} snapshots, {total} GB'
+
+Author:
+    Blake Huber
+    Copyright Blake Huber, All Rights Reserved.
+
+License:
+    GNU General Public License v3.0 (GPL-3)
+    Additional terms may be found in the complete license agreement:
+    https://bitbucket.org/blakeca00/ec2cli/src/master/LICENSE.txt
+
+OS Support:
+    - RedHat Linux, Amazon Linux, Ubuntu & variants
+
+Dependencies:
+    - Requires python3, tested under py3.5 and py3.6
+"""
+
+import re
+import sys
+import argparse
+
+# pkg
+from oscodes_unix import exit_codes
+
+
+DELIMITER = '\x1f'      # ascii unit separator, matches projection.py
+INDENT = 2              # leading spaces, as indent02
+_number = re.compile(r'\d+')
+
+# ansi codes for column colors, as defined in colors.sh
+COLORS = {
+    'blue': '\033[38;5;51m',
+    'cyan': '\033[38;5;36m',
+    'green': '\033[38;5;95;38;5;46m',
+    'orange': '\033[38;5;95;38;5;214m',
+    'red': '\033[31;1m',
+    'white': '\033[38;5;15m',
+    'yellow': '\033[38;5;11m'
+}
+
+
+def parse_columns(columns):
+    """
+    Summary:
+        Parses column specifications
+    Args:
+        :columns (list): Header:width[.precision][:color] per column
+    Returns:
+        (header, width, precision, color) per column | TYPE: list
+    Raises:
+        ValueError if width or color is invalid
+    """
+    specs = []
+    for column in columns:
+        header, _, remainder = column.partition(':')
+        width, _, color = remainder.partition(':')
+        width, _, precision = width.partition('.')
+        if color and color not in COLORS:
+            raise ValueError('Unknown column color: %s' % color)
+        specs.append((header, int(width or 0), int(precision) if precision else None, COLORS.get(color)))
+    return specs
+
+
+def column_index(specs, name):
+    """
+    Summary:
+        Locates a sort column by header (case insensitive, ignoring *) or 1-based position
+    Returns:
+        0-based column index, or None | TYPE: int
+    """
+    if name is None:
+        return None
+    if name.isdigit():
+        return int(name) - 1 if 0 < int(name) <= len(specs) else None
+    name = name.strip('*').lower()
+    return next((i for i, x in enumerate(specs) if x[0].strip('*').lower() == name), None)
+
+
+def sort_rows(rows, specs, sort=None, numeric=False, reverse=False):
+    """
+    Summary:
+        Sorts rows in place on the named column.  Numeric sorts order by the
+        integers embedded in each value (sizes, dates, 3d,4h,12m runtimes)
+    Returns:
+        rows | TYPE: list
+    """
+    index = column_index(specs, sort)
+    if index is None:
+        return rows
+    if numeric:
+        findall = _number.findall
+        rows.sort(key=lambda row: tuple(map(int, findall(row[index]))), reverse=reverse)
+    else:
+        rows.sort(key=lambda row: row[index], reverse=reverse)
+    return rows
+
+
+def table_width(specs, width=None):
+    """Border length; sum of padded column widths unless given"""
+    return width or sum(x[1] + 3 for x in specs) + 1
+
+
+def render(rows, specs, frame='', text='', width=None, indent=INDENT):
+    """
+    Summary:
+        Renders header and rows as framed, column aligned lines
+    Args:
+        :rows (list): lists of field values
+        :specs (list): parsed column specifications
+        :frame (str): escape sequence for borders and separators
+        :text (str): escape sequence for body text
+        :width (int): border length; sum of column widths if omitted
+        :indent (int): leading spaces per line
+    Returns:
+        generator of output lines
+    """
+    sp = frame + '|' + text
+    margin = ' ' * indent
+    width = table_width(specs, width)
+
+    # single format template per line; {:<w.p} matches awk %-w.ps
+    plain, colored = [], []
+    for header, w, precision, color in specs:
+        field = '{:<%d%s}' % (w, '.%d' % precision if precision is not None else '')
+        plain.append(' ' + field + ' ')
+        colored.append(' ' + (color + field + text if color else field) + ' ')
+    template = margin + sp + sp.join(colored) + sp + ' '
+    bar = margin + frame + '_' * width + text
+
+    yield bar
+    yield (margin + sp + sp.join(plain) + sp + ' ').format(*(x[0] for x in specs))
+    yield bar
+    for row in rows:
+        yield template.format(*row)
+
+
+def footer(message, frame='', text='', width=None, indent=INDENT):
+    """
+    Summary:
+        Renders a framed summary line, as print_footer in ec2cli
+    Returns:
+        output lines | TYPE: list
+    """
+    margin = ' ' * indent
+    return [
+        margin + frame + '_' * width + text,
+        '',
+        ' ' * 20 + message,
+        margin + frame + '_' * width + text,
+        ''
+    ]
+
+
+class Totals():
+    """
+    Running row count and column sum over a stream of rows; memory use is
+    independent of the number of rows consumed
+    """
+    def __init__(self, index=None):
+        self.index = index
+        self.count = 0
+        self.total = 0
+
+    def consume(self, rows):
+        for row in rows:
+            self.count += 1
+            if self.index is not None:
+                try:
+                    self.total += float(row[self.index])
+                except ValueError:
+                    pass
+            yield row
+
+    def format(self, template):
+        total = int(self.total) if self.total == int(self.total) else round(self.total, 2)
+        return template.format(count=self.count, total=total)
+
+
+def stream_rows(lines, columns, delimiter=DELIMITER, null=None):
+    """Splits rows from an iterable of delimited lines as each line arrives"""
+    for line in lines:
+        for row in read_rows(line, columns, delimiter, null):
+            yield row
+
+
+def read_rows(text, columns, delimiter=DELIMITER, null=None):
+    """
+    Summary:
+        Splits delimited text into rows of exactly columns fields
+    Args:
+        :text (str): newline separated rows; blank lines are skipped
+        :columns (int): fields per row; short rows are padded
+        :null (str): replacement for null (jq -r) or empty field values
+    Returns:
+        lists of field values | TYPE: list
+    """
+    d = delimiter
+    text = text.strip('\n')
+    if not text:
+        return []
+    if null is not None:
+        # substitute whole fields across the entire text; bracketing every
+        # line with delimiters and repeating catches first, last and adjacent fields
+        text = d + text.replace('\n', d + '\n' + d) + d
+        for _ in range(2):
+            text = text.replace(d + 'null' + d, d + null + d).replace(d + d, d + null + d)
+        text = text.replace(d + '\n' + d, '\n')[1:-1]
+
+    rows = []
+    for line in text.split('\n'):
+        row = line.split(d)
+        if len(row) < columns:
+            if not line:
+                continue
+            row += [null or ''] * (columns - len(row))
+        rows.append(row)
+    return rows
+
+
+def options(parser, help_menu=False):
+    """
+    Summary:
+        parse cli parameter options
+    Returns:
+        TYPE: argparse object, parser argument set
+    """
+    parser.add_argument("-c", "--columns", nargs='?', required=True,
+                              help="comma delimited column specs, eg InstanceId:21,State:9.9:green")
+    parser.add_argument("-s", "--sort", nargs='?', default=None, required=False,
+                              help="sort column header or 1-based position")
+    parser.add_argument("-n", "--numeric", dest='numeric', action='store_true', required=False)
+    parser.add_argument("-R", "--reverse", dest='reverse', action='store_true', required=False)
+    parser.add_argument("-w", "--width", nargs='?', type=int, default=None, required=False)
+    parser.add_argument("-N", "--null", nargs='?', default=None, required=False)
+    parser.add_argument("-f", "--frame", nargs='?', default='', required=False)
+    parser.add_argument("-t", "--text", nargs='?', default='', required=False)
+    parser.add_argument("-i", "--indent", nargs='?', type=int, default=INDENT, required=False)
+    parser.add_argument("-D", "--delimiter", nargs='?', default=DELIMITER, required=False)
+    parser.add_argument("-S", "--stream", dest='stream', action='store_true', required=False,
+                              help="render rows as they are read; no sorting")
+    parser.add_argument("-T", "--total", nargs='?', default=None, required=False,
+                              help="column summed into the footer {total}")
+    parser.add_argument("-F", "--footer", nargs='?', default=None, required=False,
+                              help="footer template, eg '{count} snapshots, {total} GB'")
+    parser.add_argument("filename", nargs='?', default='-')
+    return parser.parse_args()
+
+
+def init():
+
+    parser = argparse.ArgumentParser(add_help=True, description="table help:")
+
+    if len(sys.argv) == 1:
+        parser.print_help()
+        sys.exit(exit_codes['EX_OK']['Code'])
+
+    args = options(parser)
+
+    try:
+        specs = parse_columns(args.columns.split(','))
+        if args.total is not None and column_index(specs, args.total) is None:
+            raise ValueError('Unknown total column: %s' % args.total)
+        if args.stream:
+            return stream(args, specs)
+        if args.filename == '-':
+            text = sys.stdin.read()
+        else:
+            with open(args.filename) as f1:
+                text = f1.read()
+        rows = read_rows(text, len(specs), args.delimiter, args.null)
+    except (OSError, ValueError) as e:
+        print('table: %s' % str(e), file=sys.stderr)
+        return False
+
+    sort_rows(rows, specs, args.sort, args.numeric, args.reverse)
+    totals = Totals(column_index(specs, args.total))
+    lines = render(totals.consume(rows), specs, args.frame, args.text, args.width, args.indent)
+    sys.stdout.write('\n'.join(lines) + '\n')
+    if args.footer:
+        sys.stdout.write('\n'.join(footer(totals.format(args.footer), args.frame, args.text,
+                                          table_width(specs, args.width), args.indent)) + '\n')
+    return True
+
+
+def stream(args, specs):
+    """
+    Summary:
+        Renders rows line by line from stdin or filename, flushing each line
+    Returns:
+        Success | Failure, TYPE: bool
+    """
+    f1 = sys.stdin if args.filename == '-' else open(args.filename)
+    totals = Totals(column_index(specs, args.total))
+    rows = totals.consume(stream_rows(f1, len(specs), args.delimiter, args.null))
+    try:
+        for line in render(rows, specs, args.frame, args.text, args.width, args.indent):
+            sys.stdout.write(line + '\n')
+            sys.stdout.flush()
+        if args.footer:
+            sys.stdout.write('\n'.join(footer(totals.format(args.footer), args.frame, args.text,
+                                              table_width(specs, args.width), args.indent)) + '\n')
+            sys.stdout.flush()
+    except BrokenPipeError:
+        # reader (eg head) exited; suppress the error on interpreter shutdown
+        sys.stdout = None
+    finally:
+        if f1 is not sys.stdin:
+            f1.close()
+    return True
+
+
+if __name__ == '__main__':
+    sys.exit(exit_codes['EX_OK']['Code'] if init() else exit_codes['EX_DATAERR']['Code'])
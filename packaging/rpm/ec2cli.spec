@@ -60,16 +60,33 @@ install -m 0644 config.json $RPM_BUILD_ROOT/%{_libdir}/config.json
 install -m 0755 ec2cli $RPM_BUILD_ROOT/%{_bindir}/ec2cli
 install -m 0644 ec2cli-completion.bash $RPM_BUILD_ROOT/%{_compdir}/ec2cli-completion.bash
 install -m 0644 exitcodes.sh $RPM_BUILD_ROOT/%{_libdir}/exitcodes.sh
+install -m 0664 catalog.py $RPM_BUILD_ROOT/%{_libdir}/catalog.py
 install -m 0664 components.py $RPM_BUILD_ROOT/%{_libdir}/components.py
 install -m 0664 csv_generator.py $RPM_BUILD_ROOT/%{_libdir}/csv_generator.py
+install -m 0664 ec2clid.py $RPM_BUILD_ROOT/%{_libdir}/ec2clid.py
+install -m 0664 filters.py $RPM_BUILD_ROOT/%{_libdir}/filters.py
+install -m 0664 fleet.py $RPM_BUILD_ROOT/%{_libdir}/fleet.py
 install -m 0664 iam_identities.py $RPM_BUILD_ROOT/%{_libdir}/iam_identities.py
+install -m 0664 identity.py $RPM_BUILD_ROOT/%{_libdir}/identity.py
+install -m 0664 instance_start.py $RPM_BUILD_ROOT/%{_libdir}/instance_start.py
 install -m 0664 instancetypes.sh $RPM_BUILD_ROOT/%{_libdir}/instancetypes.sh
 install -m 0664 loggers.py $RPM_BUILD_ROOT/%{_libdir}/loggers.py
+install -m 0664 offer_fetch.py $RPM_BUILD_ROOT/%{_libdir}/offer_fetch.py
+install -m 0664 offerfile.py $RPM_BUILD_ROOT/%{_libdir}/offerfile.py
+install -m 0664 projection.py $RPM_BUILD_ROOT/%{_libdir}/projection.py
+install -m 0664 region_fetch.py $RPM_BUILD_ROOT/%{_libdir}/region_fetch.py
+install -m 0664 response_cache.py $RPM_BUILD_ROOT/%{_libdir}/response_cache.py
+install -m 0664 scheduler.py $RPM_BUILD_ROOT/%{_libdir}/scheduler.py
 install -m 0644 help_menus.lib $RPM_BUILD_ROOT/%{_libdir}/help_menus.lib
 install -m 0664 script_utils.py $RPM_BUILD_ROOT/%{_libdir}/script_utils.py
 install -m 0644 oscodes_unix.py $RPM_BUILD_ROOT/%{_libdir}/oscodes_unix.py
 install -m 0644 pkgconfig.json $RPM_BUILD_ROOT/%{_libdir}/pkgconfig.json
+install -m 0664 snapshot_batch.py $RPM_BUILD_ROOT/%{_libdir}/snapshot_batch.py
+install -m 0664 snapshot_store.py $RPM_BUILD_ROOT/%{_libdir}/snapshot_store.py
+install -m 0664 spot_engine.py $RPM_BUILD_ROOT/%{_libdir}/spot_engine.py
 install -m 0664 spot_prices.sh $RPM_BUILD_ROOT/%{_libdir}/spot_prices.sh
+install -m 0664 spot_store.py $RPM_BUILD_ROOT/%{_libdir}/spot_store.py
+install -m 0664 table.py $RPM_BUILD_ROOT/%{_libdir}/table.py
 install -m 0644 std_functions.sh $RPM_BUILD_ROOT/%{_libdir}/std_functions.sh
 install -m 0644 regions.list $RPM_BUILD_ROOT/%{_libdir}/regions.list
 install -m 0644 sizes.txt $RPM_BUILD_ROOT/%{_libdir}/sizes.txt
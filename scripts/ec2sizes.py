@@ -5,20 +5,27 @@ Summary.
     Generates a list of all valid Amazon EC2 instance sizes
     from most recent price file
 
+    By default only the regional offer files for the regions given with
+    --regions are downloaded (in parallel), rather than the global file.
+    Size sets are merged and per-region availability recorded in catalog.json
+
 """
 
 import os
 import sys
 import json
 import datetime
+import argparse
+from concurrent.futures import ThreadPoolExecutor, as_completed
 import subprocess
 import inspect
-import urllib.request
-import urllib.error
 import requests
 from pyaws import Colors
 from pyaws.utils import stdout_message
 from init import logger
+from offerfile import instance_types
+from offer_fetch import fetch, fetch_json, local_path
+import catalog
 
 try:
 
@@ -33,8 +40,10 @@ except Exception as e:
 
 
 MAX_AGE_DAYS = 10
+MAX_WORKERS = 4
 FORCE = False
-index_url = 'https://pricing.us-east-1.amazonaws.com/offers/v1.0/aws/index.json'
+DEFAULT_REGIONS = 'us-east-1'
+service_index_url = 'https://pricing.us-east-1.amazonaws.com/offers/v1.0/aws/index.json'
 index_url = 'https://pricing.us-east-1.amazonaws.com/offers/v1.0/aws/AmazonEC2/current/index.json'
 tmpdir = '/tmp'
 pricee_url = None
@@ -66,11 +75,13 @@ def download_fileobject(url, overwrite=False):
     """
     Summary.
 
-        Retrieve latest ec2 pricefile
+        Retrieve latest ec2 pricefile.  Objects previously downloaded are
+        revalidated with a conditional request (ETag, Last-Modified) and
+        interrupted downloads are resumed
 
     Args:
         :url (str): http/s universal resource locator
-        :overwrite (bool): flag optionally force overwrite of objects
+        :overwrite (bool): flag optionally force full download of objects
          previously downloaded
 
     Returns:
@@ -87,22 +98,16 @@ def download_fileobject(url, overwrite=False):
             return False
 
     try:
-        filename = os.path.split(url)[1]
-        path = tmpdir + '/' + filename
-
-        if overwrite and exists(path):
-            os.remove(path)
-        elif not overwrite and exists(path):
-            return path
-
-        r = urllib.request.urlretrieve(url, path)
+        path = local_path(url, tmpdir)
+        status = fetch(url, path, force=overwrite)
+        logger.info(f'{inspect.stack()[0][3]}: {url} {status} ({path})')
         if not exists(path):
             stdout_message(message=f'Failed to retrieve file object {path}', prefix='WARN')
 
-    except urllib.error.HTTPError as e:
+    except requests.RequestException as e:
         stdout_message(
-            message='%s: Failed to retrive file object: %s. Exception: %s, data: %s' %
-            (inspect.stack()[0][3], url, str(e), e.read()),
+            message='%s: Failed to retrive file object: %s. Exception: %s' %
+            (inspect.stack()[0][3], url, str(e)),
             prefix='WARN'
         )
         raise e
@@ -140,7 +145,7 @@ def file_age(filepath, unit='seconds'):
     return round(delta.seconds, 2)
 
 
-def get_service_url(service, url=index_url):
+def get_service_url(service, url=service_index_url):
     """
     Summary.
 
@@ -163,14 +168,99 @@ def get_service_url(service, url=index_url):
             not be found in the index file')
         return None
 
-    r = requests.get(url)
-    f1 = json.loads(r.content)
-    index_url = url_prefix + f1['offers'][converted_name]['currentRegionIndexUrl']
-    data = json.loads(requests.get(index_url).content)
+    f1 = fetch_json(url, tmpdir)
+    region_index_url = url_prefix + f1['offers'][converted_name]['currentRegionIndexUrl']
+    data = fetch_json(region_index_url, tmpdir)
     url_suffix = data['regions']['us-east-1']['currentVersionUrl']
     return url_prefix + url_suffix
 
 
+def get_region_urls(service, regions, url=service_index_url):
+    """
+    Summary.
+
+        Resolves current regional offer file urls from the region index
+
+    Args:
+        :service (str): boto service descriptor (s3, ec2, sqs, etc)
+        :regions (list): aws region codes
+        :url (str): universal resource locator for Amazon API Index file
+
+    Returns:
+        region code: offer file url (dict); regions absent from the index are omitted
+
+    """
+    url_prefix = 'https://pricing.us-east-1.amazonaws.com'
+    converted_name = name_lookup(service, url)
+
+    if not converted_name:
+        logger.critical(f'{inspect.stack()[0][3]}: Service {service} not found in the index file')
+        return {}
+
+    f1 = fetch_json(url, tmpdir)
+    data = fetch_json(url_prefix + f1['offers'][converted_name]['currentRegionIndexUrl'], tmpdir)
+
+    urls = {}
+    for region in regions:
+        try:
+            urls[region] = url_prefix + data['regions'][region]['currentVersionUrl']
+        except KeyError:
+            stdout_message(message=f'Region {region} not found in region index. Skipping', prefix='WARN')
+    return urls
+
+
+def download_regional(region_urls, workers=MAX_WORKERS):
+    """
+    Summary.
+
+        Downloads regional offer files in parallel
+
+    Args:
+        :region_urls (dict): region code: offer file url
+        :workers (int): maximum concurrent downloads
+
+    Returns:
+        region code: local file path (dict); regions which failed to
+        download are reported and omitted
+
+    """
+    paths = {}
+    with ThreadPoolExecutor(max_workers=max(1, min(workers, len(region_urls)))) as executor:
+        futures = {executor.submit(download_fileobject, url): region for region, url in region_urls.items()}
+        for future in as_completed(futures):
+            region = futures[future]
+            try:
+                path = future.result()
+            except (requests.RequestException, OSError) as e:
+                logger.warning(f'{inspect.stack()[0][3]}: {region} offer file failed ({e})')
+                stdout_message(message=f'Region {region} offer file failed to download ({e}). Skipping', prefix='WARN')
+                continue
+            if os.path.exists(path):
+                paths[region] = path
+    return dict(sorted(paths.items()))
+
+
+def regional_catalog(price_files):
+    """
+    Summary.
+
+        Builds and merges a catalog for each regional offer file
+
+    Args:
+        :price_files (dict): region code: local path to regional offer file
+
+    Returns:
+        merged catalog with per-region availability (dict)
+
+    """
+    catalogs = []
+    for region, path in sorted(price_files.items()):
+        with open(path) as f1:
+            catalogs.append(catalog.build(f1, region=region))
+        logger.info(f'{inspect.stack()[0][3]}: {region}: {len(catalogs[-1]["Types"])} size types')
+    return catalog.merge(catalogs)
+
+
 def git_root():
     """
     Summary.
@@ -182,7 +272,7 @@ def git_root():
     return subprocess.getoutput(cmd).strip()
 
 
-def name_lookup(service, url=index_url):
+def name_lookup(service, url=service_index_url):
     """Summary.
 
         Lookup Table to convert boto3 Amazon Service names to Amazon index file names
@@ -198,10 +288,8 @@ def name_lookup(service, url=index_url):
     """
     key = None
 
-    r = requests.get(url)
-
     try:
-        for key in [x for x in json.loads(r.content)['offers']]:
+        for key in [x for x in fetch_json(url, tmpdir)['offers']]:
             if (service.upper() or service.title()) in key:
                 return key
     except KeyError as e:
@@ -224,24 +312,15 @@ def retrieve_raw_data(service_url):
         :data (json):  ec2 price api parsed data in json format
 
     """
-    file_path = tmpdir + '/' + 'index.json'
-
     try:
-        if not os.path.exists(file_path):
-            path = urllib.request.urlretrieve(service_url, file_path)[0]
-        else:
-            path = file_path
-
-        if os.path.exists(file_path) and path:
-            with open(path) as f1:
-                data = json.loads(f1.read())
-        else:
-            return None
-    except urllib.error.HTTPError as e:
+        data = fetch_json(service_url, tmpdir)
+    except requests.RequestException as e:
         logger.exception(
-            '%s: Failed to retrive file object: %s. Exception: %s, data: %s' %
-            (inspect.stack()[0][3], file_path, str(e), e.read()))
+            '%s: Failed to retrive file object: %s. Exception: %s' %
+            (inspect.stack()[0][3], service_url, str(e)))
         raise e
+    except (OSError, ValueError):
+        return None
     return data
 
 
@@ -249,29 +328,21 @@ def sizetypes(pricefile):
     """
     Summary.
 
-        Finds all EC2 size types in price file
+        Finds all EC2 size types in price file.  The price file is
+        read as a stream of parse events; memory use is constant
 
     Args:
         :pricefile (str): complete path to file on local fs containing ec2 price data
 
     Returns:
-        size type list (list)
+        deduplicated size type list (list)
 
     """
-    sizes = []
-    count = 0
-
     with open(pricefile) as f1:
-        f2 = json.loads(f1.read())
+        sizes = instance_types(f1)
 
-    for sku in [x for x in f2['products']]:
-        try:
-            sizes.append(f2['products'][sku]['attributes']['instanceType'])
-            count += 1
-        except KeyError:
-            logger.info(f'No size type found at count {count}, sku {sku}')
-            continue
-    return sizes
+    logger.info(f'{inspect.stack()[0][3]}: {len(sizes)} unique size types found in {pricefile}')
+    return list(sizes)
 
 
 def split_list(monolith, n):
@@ -308,9 +379,18 @@ def write_sizetypes(path, types_list):
 
 if __name__ == '__main__':
 
+    parser = argparse.ArgumentParser(add_help=True, description="ec2sizes help:")
+    parser.add_argument("force", nargs='?', default=None, help="any value forces refresh")
+    parser.add_argument("-r", "--regions", nargs='?', default=DEFAULT_REGIONS,
+                        help="comma delimited region codes (default: %(default)s)")
+    parser.add_argument("-f", "--filter-region", dest='filter_region', nargs='?', default=None,
+                        help="limit sizes.txt to types available in this region")
+    parser.add_argument("-w", "--workers", type=int, default=MAX_WORKERS)
+    args = parser.parse_args()
+
     output_path = git_root() + '/bash/' + output_filename
 
-    if len(sys.argv) > 1:
+    if args.force:
         FORCE = True
 
     if os.path.exists(output_path) and file_age(output_path, 'days') < MAX_AGE_DAYS and not FORCE:
@@ -329,21 +409,38 @@ if __name__ == '__main__':
         ## create new or refresh size types file  ##
         ############################################
 
-        # download, process index file
-        index_path = download_fileobject(index_url)
-        if index_path:
-            stdout_message(message=f'index file {index_url} downloaded successfully')
-
-        # download, process  price file
-        price_url = get_service_url('ec2')
-
-        # download, process price file
-        price_file = download_fileobject(price_url, overwrite=True)
-        if price_file:
-            stdout_message(message=f'Price file {price_file} downloaded successfully')
+        # resolve regional offer files; global price file is not downloaded
+        regions = [x.strip() for x in args.regions.split(',') if x.strip()]
+        if args.filter_region and args.filter_region not in regions:
+            stdout_message(
+                    message=f'Filter region {args.filter_region} is not one of --regions ({", ".join(regions)})',
+                    prefix='WARN'
+                )
+            sys.exit(exit_codes['E_BADARG']['Code'])
+        region_urls = get_region_urls('ec2', regions)
+
+        # download, process price files
+        price_files = download_regional(region_urls, args.workers)
+        if not price_files:
+            stdout_message(message='No regional offer file could be downloaded', prefix='WARN')
+            sys.exit(exit_codes['E_DEPENDENCY']['Code'])
+        for region, price_file in price_files.items():
+            stdout_message(message=f'Price file {price_file} ({region}) downloaded successfully')
+
+        # single pass over each price file; catalog indexes provide size type list
+        current_catalog = regional_catalog(price_files)
+        if args.filter_region:
+            current_sizetypes = catalog.lookup(current_catalog, region=args.filter_region)
+            if not current_sizetypes:
+                # region offer file unavailable; keep existing sizetype file
+                stdout_message(message=f'No size types found for region {args.filter_region}', prefix='WARN')
+                sys.exit(exit_codes['E_BADARG']['Code'])
+        else:
+            current_sizetypes = sorted(current_catalog['Types'])
 
-        # generate new size type list; dedup list
-        current_sizetypes = eliminate_duplicates(sizetypes(price_file))
+        catalog_path = os.path.join(os.path.split(output_path)[0], catalog.CATALOG_FILE)
+        if catalog.save(current_catalog, catalog_path):
+            stdout_message(message=f'New EC2 instance type catalog ({catalog_path}) created successfully')
 
         if write_sizetypes(output_path, sorted(current_sizetypes)):
             stdout_message(message=f'New EC2 sizetype file ({output_path}) created successfully')
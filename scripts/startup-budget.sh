@@ -0,0 +1,59 @@
+#!/usr/bin/env bash
+
+#------------------------------------------------------------------------------
+#
+#   startup-budget.sh | ec2cli startup time against a budget
+#
+#   Runs ec2cli --help (or the arguments given) repeatedly after one warm
+#   run populating the startup cache, reports the median wall time and
+#   exits non-zero when it exceeds the budget.
+#
+#   Usage:
+#       $ bash startup-budget.sh                       # ec2cli --help, 50ms
+#       $ BUDGET=80 RUNS=20 bash startup-budget.sh list instances
+#       $ EC2CLI=./ec2cli bash startup-budget.sh
+#
+#   Requires bash 5 (EPOCHREALTIME)
+#
+#------------------------------------------------------------------------------
+
+EC2CLI="${EC2CLI:-$(type -P ec2cli)}"
+BUDGET="${BUDGET:-50}"          # milliseconds, median
+RUNS="${RUNS:-15}"
+
+
+function _elapsed(){
+    ## wall time of one invocation in milliseconds ##
+    local start="$EPOCHREALTIME"
+    "$EC2CLI" "$@" > /dev/null 2>&1
+    echo $(( (${EPOCHREALTIME/./} - ${start/./}) / 1000 ))
+}
+
+
+if [ ! "$EC2CLI" ]; then
+    echo "startup-budget: ec2cli not found in the PATH; set EC2CLI" >&2
+    exit 1
+elif [ ! "$EPOCHREALTIME" ]; then
+    echo "startup-budget: requires bash 5 or newer" >&2
+    exit 1
+fi
+
+if [ $# -eq 0 ]; then set -- --help; fi
+
+_elapsed "$@" > /dev/null      # warm run; writes startup cache
+
+times=()
+for (( i = 0; i < RUNS; i++ )); do
+    times+=( "$(_elapsed "$@")" )
+done
+sorted=( $(printf '%s\n' "${times[@]}" | sort -n) )
+median="${sorted[$(( RUNS / 2 ))]}"
+
+printf 'ec2cli %s: median %sms, min %sms, max %sms over %s runs (budget %sms)\n' \
+    "$*" "$median" "${sorted[0]}" "${sorted[-1]}" "$RUNS" "$BUDGET"
+
+if (( median > BUDGET )); then
+    echo "startup-budget: over budget by $(( median - BUDGET ))ms" >&2
+    exit 1
+fi
+exit 0
@@ -0,0 +1,9 @@
+"""
+pytest configuration; core modules import one another by name, as installed
+under /usr/local/lib/ec2cli
+"""
+
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'core'))
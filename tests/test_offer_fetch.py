@@ -0,0 +1,124 @@
+"""
+offer_fetch against a local http stand-in for the AWS price list endpoint:
+full download, conditional revalidation (304), resumed download (206),
+restart when the range is unsatisfiable (416) and If-Range mismatch (200)
+"""
+
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+import requests
+
+import offer_fetch
+
+
+BODY = b'{"products": {"SKU1": {"attributes": {"instanceType": "m5.large"}}}}' * 64
+ETAG = '"v2"'
+
+
+class Handler(BaseHTTPRequestHandler):
+    """Serves BODY with ETag validation and byte ranges, recording each request"""
+    requests = []
+
+    def log_message(self, *args):
+        pass
+
+    def send(self, status, body=b'', headers=None):
+        self.send_response(status)
+        for key, value in dict(headers or {}, **{'Content-Length': str(len(body))}).items():
+            self.send_header(key, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        Handler.requests.append(dict(self.headers))
+        validators = {'ETag': ETAG, 'Last-Modified': 'Mon, 05 Oct 2026 00:00:00 GMT'}
+
+        if self.headers.get('If-None-Match') == ETAG:
+            return self.send(304, headers=validators)
+
+        byte_range = self.headers.get('Range')
+        if byte_range and self.headers.get('If-Range', ETAG) == ETAG:
+            start = int(byte_range.split('=')[1].rstrip('-'))
+            if start >= len(BODY):
+                return self.send(416, headers={'Content-Range': 'bytes */%d' % len(BODY)})
+            headers = dict(validators, **{'Content-Range': 'bytes %d-%d/%d' % (start, len(BODY) - 1, len(BODY))})
+            return self.send(206, BODY[start:], headers)
+
+        # no range, or If-Range validator no longer current: full representation
+        return self.send(200, BODY, validators)
+
+
+@pytest.fixture
+def server():
+    Handler.requests = []
+    httpd = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+    thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+    yield 'http://127.0.0.1:%d/offers/v1.0/aws/AmazonEC2/current/index.json' % httpd.server_address[1]
+    httpd.shutdown()
+    httpd.server_close()
+
+
+@pytest.fixture
+def session():
+    with requests.Session() as s:
+        yield s
+
+
+def read(path):
+    with open(path, 'rb') as f1:
+        return f1.read()
+
+
+def partial(path, url, size, etag=ETAG):
+    """Leaves an interrupted download of size bytes at path"""
+    with open(path + offer_fetch.PART_SUFFIX, 'wb') as f1:
+        f1.write(BODY[:size])
+    offer_fetch.write_metadata(path, {'Url': url, 'ETag': etag, 'LastModified': None, 'Complete': False})
+
+
+def test_full_download(server, session, tmp_path):
+    path = str(tmp_path / 'index.json')
+    assert offer_fetch.fetch(server, path, session) == 'downloaded'
+    assert read(path) == BODY
+    metadata = offer_fetch.read_metadata(path)
+    assert metadata['Complete'] and metadata['ETag'] == ETAG and metadata['Size'] == len(BODY)
+    assert 'Range' not in Handler.requests[-1]
+
+
+def test_unchanged(server, session, tmp_path):
+    path = str(tmp_path / 'index.json')
+    offer_fetch.fetch(server, path, session)
+    assert offer_fetch.fetch(server, path, session) == 'unchanged'
+    assert Handler.requests[-1]['If-None-Match'] == ETAG
+    assert read(path) == BODY
+
+
+def test_resume_partial(server, session, tmp_path):
+    path = str(tmp_path / 'index.json')
+    partial(path, server, 1000)
+    assert offer_fetch.fetch(server, path, session) == 'resumed'
+    assert Handler.requests[-1]['Range'] == 'bytes=1000-'
+    assert Handler.requests[-1]['If-Range'] == ETAG
+    assert read(path) == BODY
+    assert offer_fetch.read_metadata(path)['Complete']
+
+
+def test_restart_on_416(server, session, tmp_path):
+    path = str(tmp_path / 'index.json')
+    partial(path, server, len(BODY))
+    assert offer_fetch.fetch(server, path, session) == 'downloaded'
+    assert [x.get('Range') for x in Handler.requests] == ['bytes=%d-' % len(BODY), None]
+    assert read(path) == BODY
+
+
+def test_if_range_mismatch(server, session, tmp_path):
+    path = str(tmp_path / 'index.json')
+    partial(path, server, 1000, etag='"v1"')
+    assert offer_fetch.fetch(server, path, session) == 'downloaded'
+    assert Handler.requests[-1]['If-Range'] == '"v1"'
+    # full representation replaces the stale part rather than being appended to it
+    assert read(path) == BODY
+    assert offer_fetch.read_metadata(path)['ETag'] == ETAG
@@ -0,0 +1,84 @@
+"""
+offerfile streaming parser: documents rebuilt from parse events match
+json.loads at every chunk size, including tokens split at chunk boundaries
+"""
+
+import io
+import json
+
+import pytest
+
+import offerfile
+
+
+DOCUMENT = json.dumps({
+    'formatVersion': 'v1.0',
+    'products': {
+        'SKU1': {
+            'sku': 'SKU1',
+            'attributes': {'instanceType': 'm5.large', 'vcpu': '2', 'location': 'US East (N. Virginia)'}
+        },
+        'SKU2': {
+            'sku': 'SKU2',
+            'attributes': {'instanceType': 'c5.xlarge', 'note': 'say "hi" \\ café ☃'}
+        },
+        'SKU3': {'sku': 'SKU3', 'attributes': {'instanceType': 'm5'}}
+    },
+    'terms': {
+        'OnDemand': {
+            'SKU1': {'price': 1500.25, 'small': 1e-3, 'neg': -0.5, 'big': 12345678901234, 'exp': 2.5E+10}
+        }
+    },
+    'flags': [True, False, None, [], {}, ''],
+    'unicode': 'éè中'
+}, ensure_ascii=True)
+
+
+def build(events):
+    """Reassembles a document from (prefix, event, value) parse events"""
+    stack, key, root = [], None, None
+
+    def add(value):
+        nonlocal root
+        if not stack:
+            root = value
+        elif isinstance(stack[-1], list):
+            stack[-1].append(value)
+        else:
+            stack[-1][key] = value
+
+    for prefix, event, value in events:
+        if event == 'map_key':
+            key = value
+        elif event in ('start_map', 'start_array'):
+            container = {} if event == 'start_map' else []
+            add(container)
+            stack.append(container)
+        elif event in ('end_map', 'end_array'):
+            stack.pop()
+        else:
+            add(value)
+    return root
+
+
+@pytest.mark.parametrize('chunk_size', [1, 2, 3, 7, offerfile.CHUNK_SIZE])
+def test_parse_round_trip(chunk_size):
+    events = offerfile.parse(io.StringIO(DOCUMENT), chunk_size)
+    assert build(events) == json.loads(DOCUMENT)
+
+
+@pytest.mark.parametrize('chunk_size', [1, 2, 3, 7])
+def test_instance_types(chunk_size):
+    assert offerfile.instance_types(io.StringIO(DOCUMENT), chunk_size) == {'m5.large', 'c5.xlarge'}
+
+
+@pytest.mark.parametrize('chunk_size', range(1, 40))
+def test_number_split_at_boundary(chunk_size):
+    document = '{"products": {"a": 1500.25, "b": 1e-3, "c": true}}'
+    events = offerfile.parse(io.StringIO(document), chunk_size)
+    assert build(events) == json.loads(document)
+
+
+def test_invalid_json():
+    with pytest.raises(ValueError):
+        list(offerfile.parse(io.StringIO('{"a": 1500.2x}'), 3))